@@ -1,8 +1,15 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db.models import Count
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.html import format_html
 from .models import (
     Planta, Perfil, Campana, DiaBloquedo,
-    Beneficiario, Retiro, AutorizacionTercero, AgendaRetiro
+    Beneficiario, Retiro, AutorizacionTercero, AgendaRetiro,
+    CampanaArchivada, TokenDispositivo, RendimientoGuardiaDia
 )
+from .etiquetas import generar_pdf_en_segundo_plano, DependenciaFaltante
+from .provision import provisionar_trabajadores, escribir_enlaces_activacion
 
 
 @admin.register(Planta)
@@ -22,9 +29,66 @@ class PerfilAdmin(admin.ModelAdmin):
 @admin.register(Campana)
 class CampanaAdmin(admin.ModelAdmin):
     list_display = ['nombre', 'planta', 'fecha_inicio', 'fecha_fin', 'activa', 'total_beneficiarios', 'tasa_entrega']
-    list_filter = ['activa', 'planta', 'fecha_inicio']
+    list_filter = ['activa', 'estado_carga', 'planta', 'fecha_inicio']
     search_fields = ['nombre']
     date_hierarchy = 'fecha_inicio'
+    list_select_related = ['planta']
+    actions = ['generar_etiquetas', 'provisionar_cuentas']
+
+    def get_queryset(self, request):
+        # Totales por campaña en la misma consulta del listado
+        return super().get_queryset(request).annotate(
+            num_beneficiarios=Count('beneficiarios', distinct=True),
+            num_entregados=Count('beneficiarios__retiro', distinct=True),
+        )
+
+    @admin.display(description='Total beneficiarios', ordering='num_beneficiarios')
+    def total_beneficiarios(self, obj):
+        return obj.num_beneficiarios
+
+    @admin.display(description='Tasa entrega')
+    def tasa_entrega(self, obj):
+        if obj.num_beneficiarios == 0:
+            return 0
+        return round((obj.num_entregados / obj.num_beneficiarios) * 100, 1)
+
+    @admin.action(description='Generar etiquetas PDF (una campaña)')
+    def generar_etiquetas(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Seleccione una sola campaña', messages.WARNING)
+            return None
+
+        campana = queryset.get()
+        try:
+            generar_pdf_en_segundo_plano(campana)
+        except DependenciaFaltante as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return None
+
+        enlace = reverse('admin_descargar_etiquetas', args=[campana.id])
+        self.message_user(request, format_html(
+            'Generando etiquetas de {} en segundo plano. <a href="{}">Descargar PDF</a> cuando termine '
+            '(para campañas grandes use manage.py generar_etiquetas {}).',
+            campana.nombre, enlace, campana.id
+        ), messages.INFO)
+        return None
+
+    @admin.action(description='Crear cuentas de trabajador faltantes (descarga enlaces de activación)')
+    def provisionar_cuentas(self, request, queryset):
+        creados, omitidos = [], 0
+        for campana in queryset:
+            nuevos, ya_existentes = provisionar_trabajadores(campana)
+            creados.extend(nuevos)
+            omitidos += ya_existentes
+
+        if not creados:
+            self.message_user(request, f'No hay cuentas por crear ({omitidos} ya existían)', messages.INFO)
+            return None
+
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="activacion_trabajadores.csv"'
+        escribir_enlaces_activacion(response, creados, request.build_absolute_uri('/'))
+        return response
 
 
 @admin.register(DiaBloquedo)
@@ -40,15 +104,17 @@ class BeneficiarioAdmin(admin.ModelAdmin):
     list_filter = ['campana', 'planta', 'tipo_contrato', 'tipo_caja']
     search_fields = ['nombre', 'rut', 'codigo_caja']
     readonly_fields = ['codigo_caja']
+    list_select_related = ['campana__planta', 'planta', 'retiro']
 
 
 @admin.register(Retiro)
 class RetiroAdmin(admin.ModelAdmin):
     list_display = ['beneficiario', 'codigo_caja', 'fecha_hora', 'confirmado_por', 'retirado_por_tercero']
-    list_filter = ['fecha_hora', 'retirado_por_tercero']
+    list_filter = ['fecha_hora', 'origen', 'retirado_por_tercero']
     search_fields = ['beneficiario__nombre', 'beneficiario__rut', 'codigo_caja']
     date_hierarchy = 'fecha_hora'
     readonly_fields = ['codigo_caja']
+    list_select_related = ['beneficiario', 'confirmado_por']
 
 
 @admin.register(AutorizacionTercero)
@@ -60,6 +126,32 @@ class AutorizacionTerceroAdmin(admin.ModelAdmin):
 
 @admin.register(AgendaRetiro)
 class AgendaRetiroAdmin(admin.ModelAdmin):
-    list_display = ['beneficiario', 'fecha_agendada', 'confirmado_hoy', 'fecha_confirmacion']
+    list_display = ['beneficiario', 'fecha_agendada', 'hora_inicio', 'confirmado_hoy', 'fecha_confirmacion']
     list_filter = ['confirmado_hoy', 'fecha_agendada']
     search_fields = ['beneficiario__nombre']
+
+
+@admin.register(CampanaArchivada)
+class CampanaArchivadaAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'planta', 'fecha_inicio', 'fecha_fin', 'total_beneficiarios', 'total_entregados', 'fecha_archivo']
+    list_filter = ['planta']
+    search_fields = ['nombre']
+    readonly_fields = ['campana_id_original', 'archivo', 'total_beneficiarios', 'total_entregados']
+
+
+@admin.register(TokenDispositivo)
+class TokenDispositivoAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'planta', 'usuario', 'prefijo', 'activo', 'ultimo_uso']
+    list_filter = ['activo', 'planta']
+    search_fields = ['nombre', 'usuario__username']
+    list_select_related = ['planta', 'usuario']
+    # Los tokens se emiten desde la pantalla de dispositivos (el hash no se edita)
+    readonly_fields = ['clave_hash', 'prefijo', 'creado_por', 'fecha_revocacion', 'ultimo_uso']
+
+
+@admin.register(RendimientoGuardiaDia)
+class RendimientoGuardiaDiaAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'planta', 'guardia', 'retiros', 'retiros_tercero', 'pausas', 'maximo_por_hora']
+    list_filter = ['planta']
+    date_hierarchy = 'fecha'
+    list_select_related = ['planta', 'guardia']
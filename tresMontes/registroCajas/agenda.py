@@ -0,0 +1,294 @@
+"""
+Planificador de retiros por bloques de una hora
+
+Asigna a cada beneficiario pendiente un bloque (AgendaRetiro.fecha_agendada +
+hora_inicio) dentro de su campaña, sin superar la capacidad por hora de la
+portería de su planta y saltando los días bloqueados. Las agendas que ya
+están en un bloque válido no se mueven; solo ocupan cupo.
+
+Cada beneficiario va al bloque menos cargado (el más temprano si hay empate),
+tomado de un heap: O(n log b) para n beneficiarios y b bloques. Así la
+portería recibe un flujo parejo durante todo el período en vez de llenar
+primero los primeros días.
+"""
+import heapq
+from collections import Counter
+from datetime import time as dtime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .campanas_activas import obtener_registro
+from .models import AgendaRetiro, Beneficiario, Planta
+
+
+AGENDA_CAPACIDAD_HORA = 60
+AGENDA_HORARIO = (8, 18)  # primer bloque 08:00, último 17:00
+AGENDA_TAMANO_LOTE = 2000
+
+
+def capacidad_hora(planta_codigo):
+    """Personas por hora que atiende la portería (AGENDA_CAPACIDAD_POR_PLANTA o el valor general)"""
+    por_planta = getattr(settings, 'AGENDA_CAPACIDAD_POR_PLANTA', {})
+    return por_planta.get(planta_codigo, getattr(settings, 'AGENDA_CAPACIDAD_HORA', AGENDA_CAPACIDAD_HORA))
+
+
+def horas_porteria():
+    inicio, fin = getattr(settings, 'AGENDA_HORARIO', AGENDA_HORARIO)
+    return [dtime(hora) for hora in range(inicio, fin)]
+
+
+def _bloques(campana, bloqueados, ahora):
+    """Bloques (fecha, hora) que aún no empiezan, dentro de la campaña y sin días bloqueados"""
+    hoy, hora_actual = ahora.date(), ahora.time()
+    horas = horas_porteria()
+    bloques = []
+    dia = max(campana.fecha_inicio, hoy)
+    while dia <= campana.fecha_fin:
+        if dia not in bloqueados:
+            bloques.extend((dia, hora) for hora in horas if dia > hoy or hora > hora_actual)
+        dia += timedelta(days=1)
+    return bloques
+
+
+def _asignar(pendientes, bloques, carga, capacidad):
+    """
+    Reparte `pendientes` en `bloques` llenando siempre el de menor carga.
+    Actualiza `carga` (Counter por bloque).
+
+    Returns:
+        tuple: (lista de (pendiente, bloque), pendientes sin cupo)
+    """
+    heap = [(carga[b], i) for i, b in enumerate(bloques) if carga[b] < capacidad]
+    heapq.heapify(heap)
+
+    asignados = []
+    for n, pendiente in enumerate(pendientes):
+        if not heap:
+            return asignados, pendientes[n:]
+        ocupados, i = heapq.heappop(heap)
+        bloque = bloques[i]
+        carga[bloque] = ocupados + 1
+        asignados.append((pendiente, bloque))
+        if ocupados + 1 < capacidad:
+            heapq.heappush(heap, (ocupados + 1, i))
+    return asignados, []
+
+
+def programar_retiros(campanas=None, ahora=None):
+    """
+    Asigna bloque a los beneficiarios pendientes de las campañas activas (o
+    solo de `campanas`) que no tienen una agenda válida: sin agenda, sin hora,
+    en un día bloqueado, fuera de la campaña o en un día ya pasado. Si la
+    agenda tiene fecha válida pero no hora, se respeta la fecha cuando hay
+    cupo. La carga de cada bloque considera todas las campañas activas de la
+    planta.
+
+    Returns:
+        dict: asignadas (agendas nuevas), reprogramadas y sin_cupo
+    """
+    ahora = timezone.localtime(ahora)
+    hoy = ahora.date()
+    registro = obtener_registro()
+    ids = registro.ids if campanas is None else [c.id for c in campanas if registro.esta_activa(c.id)]
+    resumen = {'asignadas': 0, 'reprogramadas': 0, 'sin_cupo': 0}
+    if not ids:
+        return resumen
+
+    pendientes = list(
+        Beneficiario.objects.filter(campana_id__in=ids, retiro__isnull=True)
+        .order_by('nombre')
+        .values_list('id', 'campana_id', 'planta_id')
+    )
+    plantas = {planta_id for _, _, planta_id in pendientes}
+    capacidades = {
+        planta_id: capacidad_hora(codigo)
+        for planta_id, codigo in Planta.objects.filter(id__in=plantas).values_list('id', 'codigo')
+    }
+    horas = horas_porteria()
+
+    def fecha_valida(campana_id, fecha):
+        campana = registro.campana(campana_id)
+        return (
+            hoy <= fecha and campana.fecha_inicio <= fecha <= campana.fecha_fin
+            and fecha not in registro.dias_bloqueados(campana_id)
+        )
+
+    # Agendas de pendientes en todas las campañas activas de esas plantas;
+    # con varias agendas por beneficiario vale la más reciente
+    agendas = {}
+    for agenda_id, beneficiario_id, campana_id, planta_id, fecha, hora in (
+        AgendaRetiro.objects
+        .filter(
+            beneficiario__campana_id__in=registro.ids,
+            beneficiario__planta_id__in=plantas,
+            beneficiario__retiro__isnull=True,
+        )
+        .order_by('id')
+        .values_list('id', 'beneficiario_id', 'beneficiario__campana_id', 'beneficiario__planta_id',
+                     'fecha_agendada', 'hora_inicio')
+        .iterator(chunk_size=AGENDA_TAMANO_LOTE)
+    ):
+        agendas[beneficiario_id] = (agenda_id, campana_id, planta_id, fecha, hora)
+
+    carga, validas = Counter(), set()
+    for beneficiario_id, (_, campana_id, planta_id, fecha, hora) in agendas.items():
+        if hora in horas and fecha_valida(campana_id, fecha):
+            carga[(planta_id, fecha, hora)] += 1
+            validas.add(beneficiario_id)
+
+    # Pendientes sin bloque válido, agrupados por campaña y planta
+    grupos = {}
+    for beneficiario_id, campana_id, planta_id in pendientes:
+        if beneficiario_id not in validas:
+            grupos.setdefault((campana_id, planta_id), []).append(beneficiario_id)
+
+    asignaciones = []  # (beneficiario_id, fecha, hora)
+    for (campana_id, planta_id), beneficiarios in grupos.items():
+        capacidad = capacidades[planta_id]
+        bloques = [
+            (planta_id, fecha, hora)
+            for fecha, hora in _bloques(registro.campana(campana_id), registro.dias_bloqueados(campana_id), ahora)
+        ]
+        por_dia = {}
+        for bloque in bloques:
+            por_dia.setdefault(bloque[1], []).append(bloque)
+
+        # Agendas con fecha válida y sin hora: primero se intenta esa fecha
+        sin_fecha = []
+        for beneficiario_id in beneficiarios:
+            agenda = agendas.get(beneficiario_id)
+            if agenda and agenda[4] is None and agenda[3] in por_dia:
+                bloque = min(por_dia[agenda[3]], key=lambda b: carga[b])
+                if carga[bloque] < capacidad:
+                    carga[bloque] += 1
+                    asignaciones.append((beneficiario_id, bloque[1], bloque[2]))
+                    continue
+            sin_fecha.append(beneficiario_id)
+
+        asignados, sin_cupo = _asignar(sin_fecha, bloques, carga, capacidad)
+        asignaciones.extend((beneficiario_id, fecha, hora) for beneficiario_id, (_, fecha, hora) in asignados)
+        resumen['sin_cupo'] += len(sin_cupo)
+
+    nuevas, movidas = [], {}
+    for beneficiario_id, fecha, hora in asignaciones:
+        if beneficiario_id in agendas:
+            movidas.setdefault((fecha, hora), []).append(agendas[beneficiario_id][0])
+        else:
+            nuevas.append(AgendaRetiro(beneficiario_id=beneficiario_id, fecha_agendada=fecha, hora_inicio=hora))
+
+    _guardar(nuevas, movidas)
+    resumen['asignadas'] = len(nuevas)
+    resumen['reprogramadas'] = sum(len(agenda_ids) for agenda_ids in movidas.values())
+    return resumen
+
+
+def reprogramar_fecha(campana, fecha, ahora=None):
+    """
+    Mueve a otros bloques solo las agendas pendientes de `campana` en `fecha`
+    (p. ej. recién bloqueada desde admin_emergencia). No toca al resto de
+    los pendientes: la planificación completa es el comando programar_retiros.
+    La carga de cada bloque se cuenta con un agregado sobre las agendas de
+    las plantas afectadas.
+
+    Returns:
+        dict: asignadas (siempre 0), reprogramadas y sin_cupo
+    """
+    ahora = timezone.localtime(ahora)
+    registro = obtener_registro()
+    resumen = {'asignadas': 0, 'reprogramadas': 0, 'sin_cupo': 0}
+    campana = registro.campana(campana.id)
+    if campana is None:
+        return resumen
+
+    afectadas = list(
+        AgendaRetiro.objects
+        .filter(fecha_agendada=fecha, beneficiario__campana_id=campana.id, beneficiario__retiro__isnull=True)
+        .order_by('beneficiario__nombre')
+        .values_list('id', 'beneficiario__planta_id')
+    )
+    if not afectadas:
+        return resumen
+
+    por_planta = {}
+    for agenda_id, planta_id in afectadas:
+        por_planta.setdefault(planta_id, []).append(agenda_id)
+    bloqueados = registro.dias_bloqueados(campana.id)
+    bloques = _bloques(campana, bloqueados, ahora)
+    if not bloques:
+        resumen['sin_cupo'] = len(afectadas)
+        return resumen
+
+    carga = Counter({
+        (planta_id, dia, hora): total
+        for planta_id, dia, hora, total in (
+            AgendaRetiro.objects
+            .filter(
+                beneficiario__campana_id__in=registro.ids,
+                beneficiario__planta_id__in=por_planta,
+                beneficiario__retiro__isnull=True,
+                fecha_agendada__range=(bloques[0][0], bloques[-1][0]),
+                hora_inicio__in=horas_porteria(),
+            )
+            .exclude(fecha_agendada__in=bloqueados)
+            .values_list('beneficiario__planta_id', 'fecha_agendada', 'hora_inicio')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+    })
+    capacidades = dict(Planta.objects.filter(id__in=por_planta).values_list('id', 'codigo'))
+
+    movidas = {}
+    for planta_id, agenda_ids in por_planta.items():
+        asignados, sin_cupo = _asignar(
+            agenda_ids, [(planta_id, dia, hora) for dia, hora in bloques],
+            carga, capacidad_hora(capacidades[planta_id])
+        )
+        for agenda_id, (_, dia, hora) in asignados:
+            movidas.setdefault((dia, hora), []).append(agenda_id)
+        resumen['sin_cupo'] += len(sin_cupo)
+
+    _guardar([], movidas)
+    resumen['reprogramadas'] = sum(len(agenda_ids) for agenda_ids in movidas.values())
+    return resumen
+
+
+def _guardar(nuevas, movidas):
+    """Crea las agendas nuevas y mueve las existentes ({(fecha, hora): [agenda_id, ...]})"""
+    with transaction.atomic():
+        AgendaRetiro.objects.bulk_create(nuevas, batch_size=AGENDA_TAMANO_LOTE)
+        # Un UPDATE ... WHERE id IN (...) por bloque: bulk_update arma un CASE por fila y es mucho más lento
+        for (fecha, hora), agenda_ids in movidas.items():
+            for i in range(0, len(agenda_ids), AGENDA_TAMANO_LOTE):
+                AgendaRetiro.objects.filter(id__in=agenda_ids[i:i + AGENDA_TAMANO_LOTE]).update(
+                    fecha_agendada=fecha, hora_inicio=hora, confirmado_hoy=False
+                )
+
+
+def llegadas_esperadas(planta, ahora=None):
+    """
+    Agendados de la planta para el bloque en curso y pendientes por bloque del día.
+
+    Returns:
+        tuple: (hora del bloque, agendas del bloque con beneficiario y retiro,
+        lista de {'hora_inicio', 'total'} pendientes por bloque)
+    """
+    ahora = timezone.localtime(ahora)
+    hora = dtime(ahora.hour)
+    del_dia = AgendaRetiro.objects.filter(
+        fecha_agendada=ahora.date(),
+        beneficiario__planta=planta,
+        beneficiario__campana_id__in=obtener_registro().ids,
+    )
+    bloque = list(
+        del_dia.filter(hora_inicio=hora)
+        .select_related('beneficiario__retiro')
+        .order_by('beneficiario__nombre')
+    )
+    por_hora = list(
+        del_dia.filter(beneficiario__retiro__isnull=True, hora_inicio__isnull=False)
+        .values('hora_inicio').annotate(total=Count('id')).order_by('hora_inicio')
+    )
+    return hora, bloque, por_hora
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RegistrocajasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'registroCajas'
+
+    def ready(self):
+        # Registran sus señales (paneles en vivo, días bloqueados y campañas activas)
+        from . import eventos, calendario, campanas_activas  # noqa: F401
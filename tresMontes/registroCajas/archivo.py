@@ -0,0 +1,128 @@
+"""
+Archivo de campañas cerradas en archivos JSON comprimidos (gzip)
+
+Las campañas inactivas se serializan completas (días bloqueados,
+beneficiarios, retiros, autorizaciones y agendas) a un archivo por campaña
+y se eliminan de las tablas activas. El archivo se puede consultar en modo
+solo lectura y restaurar cuando se necesite.
+"""
+import gzip
+import json
+from collections import defaultdict
+from itertools import chain
+
+from django.core import serializers
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .models import (
+    Campana, DiaBloquedo, Beneficiario, Retiro,
+    AutorizacionTercero, AgendaRetiro, CampanaArchivada
+)
+from .calendario import invalidar_calendario
+from .campanas_activas import invalidar_registro
+from .purga import purgar_campana
+
+
+def _objetos_campana(campana):
+    """Registros de la campaña en orden de dependencia (padres primero)"""
+    return chain(
+        [campana],
+        DiaBloquedo.objects.filter(campana=campana).iterator(),
+        Beneficiario.objects.filter(campana=campana).iterator(),
+        Retiro.objects.filter(beneficiario__campana=campana).iterator(),
+        AutorizacionTercero.objects.filter(beneficiario__campana=campana).iterator(),
+        AgendaRetiro.objects.filter(beneficiario__campana=campana).iterator(),
+    )
+
+
+def archivar_campana(campana, usuario=None):
+    """
+    Mueve una campaña inactiva y todos sus registros a un archivo comprimido.
+
+    Returns:
+        CampanaArchivada: Registro del archivo creado
+    """
+    if campana.activa:
+        raise ValueError(f'La campaña "{campana.nombre}" está activa. Solo se archivan campañas inactivas.')
+
+    datos = serializers.serialize('json', _objetos_campana(campana))
+
+    archivada = CampanaArchivada(
+        campana_id_original=campana.id,
+        nombre=campana.nombre,
+        planta=campana.planta,
+        fecha_inicio=campana.fecha_inicio,
+        fecha_fin=campana.fecha_fin,
+        total_beneficiarios=campana.total_beneficiarios(),
+        total_entregados=Retiro.objects.filter(beneficiario__campana=campana).count(),
+        archivado_por=usuario,
+    )
+    archivada.archivo.save(
+        f'campana_{campana.id}.json.gz',
+        ContentFile(gzip.compress(datos.encode('utf-8'))),
+        save=False
+    )
+    archivada.save()
+
+    # Con el archivo ya escrito, sacar la campaña de las tablas activas
+    purgar_campana(campana.id)
+    return archivada
+
+
+def leer_archivo(archivada):
+    """
+    Lee el archivo de una campaña archivada (solo lectura).
+
+    Returns:
+        dict: Registros por modelo ('beneficiario', 'retiro', ...), cada uno
+              como diccionario de campos con su 'id'
+    """
+    with archivada.archivo.open('rb') as f:
+        registros = json.loads(gzip.decompress(f.read()))
+
+    por_modelo = defaultdict(list)
+    for registro in registros:
+        modelo = registro['model'].split('.')[-1]
+        por_modelo[modelo].append(dict(registro['fields'], id=registro['pk']))
+    return por_modelo
+
+
+def restaurar_campana(archivada):
+    """
+    Devuelve una campaña archivada a las tablas activas con sus ids originales.
+
+    Returns:
+        Campana: Campaña restaurada (inactiva)
+    """
+    with archivada.archivo.open('rb') as f:
+        datos = gzip.decompress(f.read()).decode('utf-8')
+
+    objetos = defaultdict(list)
+    for deserializado in serializers.deserialize('json', datos):
+        objetos[type(deserializado.object)].append(deserializado.object)
+
+    nombre_archivo = archivada.archivo.name
+    with transaction.atomic():
+        for modelo, lista in objetos.items():
+            # bulk_create reemplaza los campos auto_now_add por la hora actual:
+            # guardar los valores originales para reponerlos después
+            campos_auto = [
+                f.attname for f in modelo._meta.concrete_fields
+                if getattr(f, 'auto_now_add', False)
+            ]
+            originales = [[getattr(obj, campo) for campo in campos_auto] for obj in lista]
+
+            modelo.objects.bulk_create(lista, batch_size=500)
+
+            if campos_auto:
+                for obj, valores in zip(lista, originales):
+                    for campo, valor in zip(campos_auto, valores):
+                        setattr(obj, campo, valor)
+                modelo.objects.bulk_update(lista, campos_auto, batch_size=500)
+        archivada.delete()
+
+    archivada.archivo.storage.delete(nombre_archivo)
+    invalidar_calendario(archivada.campana_id_original)
+    invalidar_registro()
+    return Campana.objects.get(id=archivada.campana_id_original)
@@ -0,0 +1,101 @@
+"""
+Calendario de días bloqueados por campaña, en caché del proceso
+
+Se invalida con las señales de DiaBloquedo (crear/eliminar, p. ej. desde
+admin_emergencia y admin_eliminar_bloqueo). Las campañas activas se leen
+del registro de campanas_activas, que se invalida en todos los workers; las
+demás se refrescan a más tardar en CALENDARIO_TTL segundos.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .campanas_activas import obtener_registro
+from .models import DiaBloquedo
+
+
+CALENDARIO_TTL = 300
+
+_calendarios = {}  # campana_id -> (frozenset de fechas, expira)
+_lock = threading.Lock()
+
+
+def invalidar_calendario(campana_id=None):
+    """Descarta el calendario de una campaña (o todos si campana_id es None)"""
+    with _lock:
+        if campana_id is None:
+            _calendarios.clear()
+        else:
+            _calendarios.pop(campana_id, None)
+
+
+@receiver(post_save, sender=DiaBloquedo)
+@receiver(post_delete, sender=DiaBloquedo)
+def _al_cambiar_bloqueo(sender, instance, **kwargs):
+    campana_id = instance.campana_id
+    invalidar_calendario(campana_id)
+    # Una lectura dentro de la transacción pudo volver a cargar datos sin confirmar
+    transaction.on_commit(lambda: invalidar_calendario(campana_id))
+
+
+def calendarios(campana_ids):
+    """
+    Días bloqueados de varias campañas, con una sola consulta para las que no
+    estén en caché.
+
+    Returns:
+        dict: campana_id -> frozenset de fechas
+    """
+    campana_ids = set(campana_ids)
+    registro = obtener_registro()
+    resultado = {c: registro.dias_bloqueados(c) for c in campana_ids if registro.esta_activa(c)}
+
+    ahora = time.monotonic()
+    faltantes = set()
+    with _lock:
+        for campana_id in campana_ids - resultado.keys():
+            entrada = _calendarios.get(campana_id)
+            if entrada and entrada[1] > ahora:
+                resultado[campana_id] = entrada[0]
+            else:
+                faltantes.add(campana_id)
+
+    if faltantes:
+        fechas = {campana_id: set() for campana_id in faltantes}
+        for campana_id, fecha in DiaBloquedo.objects.filter(campana_id__in=faltantes).values_list('campana_id', 'fecha'):
+            fechas[campana_id].add(fecha)
+
+        expira = ahora + getattr(settings, 'CALENDARIO_TTL', CALENDARIO_TTL)
+        with _lock:
+            for campana_id, dias in fechas.items():
+                resultado[campana_id] = frozenset(dias)
+                _calendarios[campana_id] = (resultado[campana_id], expira)
+
+    return resultado
+
+
+def dias_bloqueados(campana_id):
+    return calendarios([campana_id])[campana_id]
+
+
+def esta_bloqueado(campana_id, fecha=None):
+    return (fecha or timezone.localdate()) in dias_bloqueados(campana_id)
+
+
+def pueden_retirar(beneficiarios, fecha=None):
+    """
+    Qué beneficiarios pueden retirar en `fecha` (hoy por defecto). Solo usa
+    campana_id, así que no carga la campaña de cada fila.
+
+    Returns:
+        dict: beneficiario.id -> bool
+    """
+    fecha = fecha or timezone.localdate()
+    beneficiarios = list(beneficiarios)
+    bloqueos = calendarios(b.campana_id for b in beneficiarios)
+    return {b.id: fecha not in bloqueos[b.campana_id] for b in beneficiarios}
@@ -0,0 +1,113 @@
+"""
+Registro de campañas activas (ids, fechas y días bloqueados) en caché del proceso
+
+Cada proceso guarda su copia junto con un sello de versión; el sello vive en
+un caché compartido entre workers (CAMPANAS_CACHE_ALIAS, archivos locales) y
+se renueva cuando se guarda o elimina una Campana o un DiaBloquedo. Leer el
+sello es una lectura de archivo, sin consultas a la base de datos.
+
+Las vistas filtran con campana_id__in=registro.ids en vez de unir con
+campana__activa.
+"""
+import secrets
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Campana, DiaBloquedo
+
+
+CAMPANAS_CACHE_ALIAS = 'compartido'
+CLAVE_VERSION = 'registroCajas:campanas_activas:version'
+
+_actual = None  # (version, Registro)
+_lock = threading.Lock()
+
+
+class Registro:
+    """Campañas activas al momento de cargar el registro. Solo lectura."""
+
+    def __init__(self, campanas, bloqueos):
+        # Más reciente primero, igual que order_by('-fecha_creacion')
+        self.campanas = campanas
+        self.ids = [c.id for c in campanas]
+        self.bloqueos = bloqueos
+        self._por_id = {c.id: c for c in campanas}
+
+    @property
+    def reciente(self):
+        return self.campanas[0] if self.campanas else None
+
+    def campana(self, campana_id):
+        return self._por_id.get(campana_id)
+
+    def por_planta(self, planta_id):
+        """Campañas cuya planta es planta_id (ojo: los beneficiarios se asocian por su propia planta)"""
+        return [c for c in self.campanas if c.planta_id == planta_id]
+
+    def dias_bloqueados(self, campana_id):
+        return self.bloqueos.get(campana_id, frozenset())
+
+    def esta_activa(self, campana_id):
+        return campana_id in self._por_id
+
+
+def _cache():
+    return caches[getattr(settings, 'CAMPANAS_CACHE_ALIAS', CAMPANAS_CACHE_ALIAS)]
+
+
+def _version():
+    cache = _cache()
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        # Primer uso o caché vaciado: otro worker pudo ganarle con add()
+        cache.add(CLAVE_VERSION, secrets.token_hex(8), None)
+        version = cache.get(CLAVE_VERSION)
+    return version
+
+
+def _cargar():
+    campanas = list(
+        Campana.objects.filter(activa=True).select_related('planta').order_by('-fecha_creacion')
+    )
+    bloqueos = {c.id: set() for c in campanas}
+    if campanas:
+        for campana_id, fecha in DiaBloquedo.objects.filter(campana_id__in=bloqueos).values_list('campana_id', 'fecha'):
+            bloqueos[campana_id].add(fecha)
+    return Registro(campanas, {campana_id: frozenset(dias) for campana_id, dias in bloqueos.items()})
+
+
+def obtener_registro():
+    """Registro vigente; se recarga (2 consultas) solo si cambió la versión"""
+    global _actual
+    version = _version()
+    with _lock:
+        if _actual is not None and _actual[0] == version:
+            return _actual[1]
+        registro = _cargar()
+        _actual = (version, registro)
+        return registro
+
+
+def invalidar_registro():
+    """Renueva el sello compartido; todos los procesos recargan en su próxima lectura"""
+    global _actual
+    _cache().set(CLAVE_VERSION, secrets.token_hex(8), None)
+    with _lock:
+        _actual = None
+
+
+@receiver(post_save, sender=Campana)
+@receiver(post_delete, sender=Campana)
+@receiver(post_save, sender=DiaBloquedo)
+@receiver(post_delete, sender=DiaBloquedo)
+def _al_cambiar_campana(sender, instance, created=False, **kwargs):
+    if created and sender is Campana and not instance.activa:
+        return  # una campaña nueva e inactiva no está en ningún registro
+    invalidar_registro()
+    # Una lectura dentro de la transacción pudo cargar datos sin confirmar
+    transaction.on_commit(invalidar_registro)
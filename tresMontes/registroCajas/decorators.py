@@ -5,6 +5,7 @@ from functools import wraps
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from .routers import lectura_replica
 
 
 def role_required(allowed_roles):
@@ -62,3 +63,12 @@ def trabajador_required(view_func):
 def admin_or_guardia_required(view_func):
     """Decorador para vistas accesibles por admin y guardia"""
     return role_required(['admin', 'guardia'])(view_func)
+
+
+def usar_replica(view_func):
+    """Decorador para vistas de solo lectura (reportes) que pueden leer de la réplica"""
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with lectura_replica():
+            return view_func(request, *args, **kwargs)
+    return _wrapped_view
@@ -0,0 +1,120 @@
+"""
+Autenticación de tablets de portería con tokens de dispositivo
+
+El token se entrega una sola vez al emitirlo; en la base solo queda su
+SHA-256 (es aleatorio de 256 bits, no necesita PBKDF2). Las peticiones lo
+envían como `Authorization: Dispositivo <token>`, y solo lo aceptan las
+vistas de escaneo (decoradas con acepta_dispositivo). La verificación se
+sirve desde un caché en memoria por DISPOSITIVOS_CACHE_TTL segundos, así
+una revocación tarda como máximo ese tiempo en llegar a otros workers.
+"""
+import hashlib
+import secrets
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .models import TokenDispositivo
+
+
+ESQUEMA = 'Dispositivo'
+DISPOSITIVOS_CACHE_TTL = 60
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def emitir_token(nombre, planta, usuario, creado_por=None):
+    """
+    Crea un token para una portería.
+
+    Returns:
+        tuple: (TokenDispositivo, token en texto plano; no se vuelve a mostrar)
+    """
+    token = secrets.token_urlsafe(32)
+    dispositivo = TokenDispositivo.objects.create(
+        nombre=nombre,
+        planta=planta,
+        usuario=usuario,
+        clave_hash=_hash(token),
+        prefijo=token[:8],
+        creado_por=creado_por,
+    )
+    return dispositivo, token
+
+
+def revocar_token(dispositivo):
+    dispositivo.activo = False
+    dispositivo.fecha_revocacion = timezone.now()
+    dispositivo.save(update_fields=['activo', 'fecha_revocacion'])
+    with _lock:
+        _cache.pop(dispositivo.clave_hash, None)
+
+
+def limpiar_cache():
+    with _lock:
+        _cache.clear()
+
+
+def autenticar_token(token):
+    """Devuelve el TokenDispositivo activo (con usuario, perfil y planta) o None"""
+    clave = _hash(token)
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _cache.get(clave)
+    if entrada and entrada[1] > ahora:
+        return entrada[0]
+
+    dispositivo = (
+        TokenDispositivo.objects
+        .select_related('usuario__perfil', 'planta')
+        .filter(clave_hash=clave, activo=True, usuario__is_active=True)
+        .first()
+    )
+    if dispositivo is None:
+        # Los tokens inválidos no se guardan, para no llenar el caché
+        return None
+
+    # Se registra el uso una vez por refresco del caché, no en cada escaneo
+    dispositivo.ultimo_uso = timezone.now()
+    TokenDispositivo.objects.filter(pk=dispositivo.pk).update(ultimo_uso=dispositivo.ultimo_uso)
+
+    ttl = getattr(settings, 'DISPOSITIVOS_CACHE_TTL', DISPOSITIVOS_CACHE_TTL)
+    with _lock:
+        _cache[clave] = (dispositivo, ahora + ttl)
+    return dispositivo
+
+
+def acepta_dispositivo(view_func):
+    """
+    Permite autenticar la vista con `Authorization: Dispositivo <token>`.
+    Se aplica solo a las vistas de escaneo: el token no abre otras vistas
+    del guardia. Con token la petición no usa CSRF (el navegador no envía
+    esta cabecera por sí solo); sin token la vista exige sesión y CSRF.
+    """
+    protegida = csrf_protect(view_func)
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        request.dispositivo = None
+        esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+        if esquema != ESQUEMA or not token:
+            return protegida(request, *args, **kwargs)
+
+        dispositivo = autenticar_token(token.strip())
+        if dispositivo is None:
+            return JsonResponse({'ok': False, 'mensaje': 'Token de dispositivo inválido o revocado'}, status=401)
+        request.dispositivo = dispositivo
+        request.user = dispositivo.usuario
+        return view_func(request, *args, **kwargs)
+
+    return csrf_exempt(_wrapped_view)
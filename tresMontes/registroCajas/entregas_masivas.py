@@ -0,0 +1,278 @@
+"""
+Registro masivo de entregas anotadas en papel (portería sin escáner o sin red)
+
+Cada fila trae RUT o código de caja, la hora real de la entrega y, si
+corresponde, los datos del tercero. Todas las filas se validan contra la
+nómina de las campañas activas con una sola consulta y los retiros válidos
+se crean con un solo bulk_create; el resto vuelve en el reporte con su motivo.
+
+Formato (una entrega por línea, separada por ';', ',' o tabulación):
+    rut_o_codigo; fecha_hora; nombre_tercero; rut_tercero; observaciones
+"""
+import csv
+import io
+import re
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .campanas_activas import obtener_registro
+from .eventos import notificar
+from .models import Beneficiario, Retiro
+from .utils import validar_rut_chileno, variantes_rut
+from . import metricas
+
+
+MAX_FILAS = 5000
+ORIGEN_PAPEL = 'Entrega registrada desde planilla en papel'
+PATRON_CODIGO = re.compile(r'^[IF]-\w+$', re.IGNORECASE)
+FORMATOS_FECHA = ('%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M', '%d-%m-%Y %H:%M')
+FORMATOS_HORA = ('%H:%M', '%H:%M:%S')
+
+MENSAJES = {
+    'formato': 'Fila incompleta o con formato inválido',
+    'fecha': 'Fecha u hora inválida',
+    'fecha_futura': 'La hora de entrega es posterior al momento del registro',
+    'no_encontrado': 'No existe en la nómina de las cargas activas',
+    'ambiguo': 'El RUT aparece en más de una carga activa; use el código de caja',
+    'otra_planta': 'No pertenece a esta planta',
+    'fuera_de_campana': 'La fecha está fuera del período de la carga',
+    'tercero': 'Datos del tercero incompletos o RUT inválido',
+    'duplicada': 'La misma caja aparece más de una vez en la lista',
+    'ya_entregada': 'La caja ya fue entregada anteriormente',
+}
+
+
+def _parsear_fecha_hora(texto, fecha_base):
+    texto = texto.strip()
+    for formato in FORMATOS_FECHA:
+        try:
+            return timezone.make_aware(datetime.strptime(texto, formato))
+        except ValueError:
+            pass
+    for formato in FORMATOS_HORA:
+        try:
+            hora = datetime.strptime(texto, formato).time()
+            return timezone.make_aware(datetime.combine(fecha_base, hora))
+        except ValueError:
+            pass
+    return None
+
+
+def leer_entregas(texto, fecha_base=None):
+    """
+    Convierte el texto pegado (o el CSV subido) en filas. Una fila de
+    encabezado se ignora si su primera columna no parece RUT ni código.
+
+    Returns:
+        list: dicts con numero, identificador, fecha_hora, nombre_tercero,
+        rut_tercero, observaciones y motivo (None si la fila se pudo leer)
+    """
+    fecha_base = fecha_base or timezone.localdate()
+    lineas = [linea for linea in texto.splitlines() if linea.strip()]
+    if not lineas:
+        return []
+
+    # ';' primero: las observaciones pueden traer comas
+    delimitador = next((d for d in ';\t,' if d in lineas[0]), ';')
+
+    filas = []
+    for numero, columnas in enumerate(csv.reader(io.StringIO('\n'.join(lineas)), delimiter=delimitador), start=1):
+        columnas = [c.strip() for c in columnas] + [''] * 5
+        if numero == 1 and not any(ch.isdigit() for ch in columnas[0]):
+            continue  # encabezado
+        filas.append(_fila(numero, *columnas[:5], fecha_base=fecha_base))
+    return filas
+
+
+def filas_desde_json(entregas, fecha_base=None):
+    """Igual que leer_entregas() para la API: lista de objetos con las mismas columnas"""
+    fecha_base = fecha_base or timezone.localdate()
+    filas = []
+    for numero, entrega in enumerate(entregas, start=1):
+        if not isinstance(entrega, dict):
+            entrega = {}
+        columnas = [
+            str(entrega.get(campo) or '').strip()
+            for campo in ('identificador', 'fecha_hora', 'nombre_tercero', 'rut_tercero', 'observaciones')
+        ]
+        filas.append(_fila(numero, *columnas, fecha_base=fecha_base))
+    return filas
+
+
+def _fila(numero, identificador, fecha_hora, nombre_tercero, rut_tercero, observaciones, fecha_base):
+    fila = {
+        'numero': numero,
+        'identificador': identificador,
+        'fecha_hora': _parsear_fecha_hora(fecha_hora, fecha_base) if fecha_hora else None,
+        'nombre_tercero': nombre_tercero,
+        'rut_tercero': rut_tercero,
+        'observaciones': observaciones,
+        'motivo': None,
+    }
+    if not identificador or not fecha_hora:
+        fila['motivo'] = 'formato'
+    elif fila['fecha_hora'] is None:
+        fila['motivo'] = 'fecha'
+    return fila
+
+
+def _buscar_beneficiarios(filas, ids_activas):
+    """Una consulta para todas las filas: beneficiarios por RUT o código de caja"""
+    ruts, codigos = set(), set()
+    for fila in filas:
+        if PATRON_CODIGO.match(fila['identificador']):
+            codigos.add(fila['identificador'].upper())
+        else:
+            ruts.update(variantes_rut(fila['identificador']))
+
+    if not (ruts or codigos) or not ids_activas:
+        return {}, {}
+
+    por_rut, por_codigo = {}, {}
+    for b in Beneficiario.objects.filter(
+        Q(rut__in=ruts) | Q(codigo_caja__in=codigos), campana_id__in=ids_activas
+    ).values('id', 'rut', 'codigo_caja', 'nombre', 'campana_id', 'planta_id', 'planta__codigo', 'retiro__id'):
+        por_rut.setdefault(b['rut'], []).append(b)
+        por_codigo[b['codigo_caja']] = b
+    return por_rut, por_codigo
+
+
+def _validar(fila, candidatos, planta, registro, ahora, vistos):
+    if not candidatos:
+        return 'no_encontrado', None
+    if len(candidatos) > 1:
+        # Si la planta decide, no hay ambigüedad
+        candidatos = [b for b in candidatos if planta is None or b['planta_id'] == planta.id] or candidatos
+        if len(candidatos) > 1:
+            return 'ambiguo', None
+    b = candidatos[0]
+
+    if planta is not None and b['planta_id'] != planta.id:
+        return 'otra_planta', b
+    if fila['fecha_hora'] > ahora:
+        return 'fecha_futura', b
+    campana = registro.campana(b['campana_id'])
+    if not campana.fecha_inicio <= timezone.localtime(fila['fecha_hora']).date() <= campana.fecha_fin:
+        return 'fuera_de_campana', b
+    if fila['nombre_tercero'] or fila['rut_tercero']:
+        if not (fila['nombre_tercero'] and fila['rut_tercero'] and validar_rut_chileno(fila['rut_tercero'])[0]):
+            return 'tercero', b
+    if b['retiro__id'] is not None:
+        return 'ya_entregada', b
+    if b['id'] in vistos:
+        return 'duplicada', b
+    return None, b
+
+
+def _nuevo_retiro(fila, b, usuario, origen, modo):
+    observaciones = [origen]
+    if fila['observaciones']:
+        observaciones.append(fila['observaciones'])
+    tercero = bool(fila['nombre_tercero'])
+    if tercero:
+        observaciones.append(f"Retirado por: {fila['nombre_tercero']} (RUT: {fila['rut_tercero']})")
+    return Retiro(
+        beneficiario_id=b['id'],
+        fecha_hora=fila['fecha_hora'],
+        confirmado_por=usuario,
+        observaciones='\n'.join(observaciones),
+        retirado_por_tercero=tercero,
+        nombre_tercero=fila['nombre_tercero'],
+        rut_tercero=fila['rut_tercero'],
+        codigo_caja=b['codigo_caja'],
+        origen=modo,
+    )
+
+
+def registrar_entregas(filas, usuario, planta=None, origen=ORIGEN_PAPEL, modo='papel'):
+    """
+    Valida y registra las filas leídas con leer_entregas().
+
+    Args:
+        planta: si se indica (guardia), solo se aceptan beneficiarios de esa planta
+        origen: primera línea de las observaciones del retiro
+        modo: Retiro.origen ('papel' o 'tercero') y etiqueta `modo` de la métrica de retiros
+
+    Returns:
+        list: una entrada por fila con numero, identificador, estado
+        ('registrada' o 'conflicto'), motivo, mensaje, nombre y codigo_caja
+    """
+    if len(filas) > MAX_FILAS:
+        raise ValueError(f'Se admiten hasta {MAX_FILAS} filas por registro')
+
+    registro = obtener_registro()
+    ahora = timezone.now()
+    legibles = [f for f in filas if f['motivo'] is None]
+    por_rut, por_codigo = _buscar_beneficiarios(legibles, registro.ids)
+
+    reporte, aceptadas, vistos = [], [], set()
+    for fila in filas:
+        motivo, b = fila['motivo'], None
+        if motivo is None:
+            if PATRON_CODIGO.match(fila['identificador']):
+                candidato = por_codigo.get(fila['identificador'].upper())
+                candidatos = [candidato] if candidato else []
+            else:
+                candidatos = [b for rut in variantes_rut(fila['identificador']) for b in por_rut.get(rut, [])]
+            motivo, b = _validar(fila, candidatos, planta, registro, ahora, vistos)
+        if motivo is None:
+            vistos.add(b['id'])
+            aceptadas.append((fila, b))
+
+        reporte.append({
+            'numero': fila['numero'],
+            'identificador': fila['identificador'],
+            'estado': 'conflicto' if motivo else 'registrada',
+            'motivo': motivo,
+            'mensaje': MENSAJES.get(motivo, ''),
+            'nombre': b['nombre'] if b else '',
+            'codigo_caja': b['codigo_caja'] if b else '',
+        })
+
+    _crear_retiros(aceptadas, reporte, usuario, origen, modo)
+    return reporte
+
+
+def _crear_retiros(aceptadas, reporte, usuario, origen, modo):
+    por_numero = {r['numero']: r for r in reporte}
+    while aceptadas:
+        retiros = [_nuevo_retiro(fila, b, usuario, origen, modo) for fila, b in aceptadas]
+        try:
+            with transaction.atomic():
+                Retiro.objects.bulk_create(retiros, batch_size=500)
+                # auto_now_add reemplaza la hora en el INSERT; se restaura la del papel
+                for retiro, (fila, _) in zip(retiros, aceptadas):
+                    retiro.fecha_hora = fila['fecha_hora']
+                Retiro.objects.bulk_update(retiros, ['fecha_hora'], batch_size=500)
+        except IntegrityError:
+            # Otra portería registró alguna caja mientras tanto: se marcan y se reintenta
+            entregados = set(
+                Retiro.objects.filter(beneficiario_id__in=[b['id'] for _, b in aceptadas])
+                .values_list('beneficiario_id', flat=True)
+            )
+            if not entregados:
+                raise
+            for fila, b in aceptadas:
+                if b['id'] in entregados:
+                    por_numero[fila['numero']].update(
+                        estado='conflicto', motivo='ya_entregada', mensaje=MENSAJES['ya_entregada']
+                    )
+            aceptadas = [(fila, b) for fila, b in aceptadas if b['id'] not in entregados]
+            continue
+
+        # bulk_create no dispara post_save: se avisa a los paneles en vivo
+        transaction.on_commit(notificar)
+        por_planta = {}
+        for _, b in aceptadas:
+            por_planta[b['planta__codigo']] = por_planta.get(b['planta__codigo'], 0) + 1
+        for planta_codigo, cantidad in por_planta.items():
+            metricas.retiros.inc(cantidad, planta=planta_codigo, guardia=usuario.username, modo=modo)
+        break
+
+
+def resumen(reporte):
+    registradas = sum(1 for r in reporte if r['estado'] == 'registrada')
+    return {'total': len(reporte), 'registradas': registradas, 'conflictos': len(reporte) - registradas}
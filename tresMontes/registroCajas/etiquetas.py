@@ -0,0 +1,241 @@
+"""
+Etiquetas imprimibles (código de caja, nombre, planta y QR) por campaña
+
+El QR de la etiqueta solo identifica la caja (codigo_caja): no es un token
+de entrega y guardia_escanear_qr lo rechaza. La imagen QR de cada etiqueta
+se renderiza en un pool de procesos y se guarda en ETIQUETAS_CACHE_DIR/<id de
+campaña> con el hash de su contenido como nombre; al volver a generar solo se
+dibujan las que cambiaron y se eliminan las que ya no se usan. El texto se
+escribe directo en el PDF (vectorial).
+
+Con muchas etiquetas, generar el PDF con `manage.py generar_etiquetas`; la
+acción del admin lo genera en un hilo aparte, sin pool de procesos.
+
+Dependencias opcionales: qrcode, Pillow y reportlab
+(pip install qrcode[pil] reportlab).
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+
+
+# Hoja A4 con etiquetas de 63,5 x 38,1 mm (3 x 7)
+COLUMNAS = 3
+FILAS = 7
+ANCHO_MM = 63.5
+ALTO_MM = 38.1
+VERSION_DISENO = 1  # subir al cambiar el dibujo del QR para invalidar el caché
+LOTE_POR_PROCESO = 50
+
+
+class DependenciaFaltante(ImportError):
+    """Falta qrcode, Pillow o reportlab"""
+
+
+def _verificar_dependencias():
+    faltantes = []
+    for modulo in ('qrcode', 'PIL', 'reportlab'):
+        try:
+            __import__(modulo)
+        except ImportError:
+            faltantes.append(modulo)
+    if faltantes:
+        raise DependenciaFaltante(
+            f'Faltan dependencias para generar etiquetas: {", ".join(faltantes)} '
+            f'(pip install qrcode[pil] reportlab)'
+        )
+
+
+def _directorio_cache(campana_id):
+    base = getattr(settings, 'ETIQUETAS_CACHE_DIR', Path(settings.MEDIA_ROOT) / 'etiquetas_cache')
+    directorio = Path(base) / str(campana_id)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def ruta_pdf(campana_id):
+    """Ruta del PDF generado en segundo plano para la campaña"""
+    return Path(settings.MEDIA_ROOT) / 'etiquetas' / f'etiquetas_{campana_id}.pdf'
+
+
+def datos_etiquetas(campana):
+    """Contenido de cada etiqueta de la campaña, con su hash"""
+    etiquetas = []
+    beneficiarios = (
+        campana.beneficiarios
+        .select_related('planta')
+        .order_by('planta__nombre', 'nombre')
+    )
+    for b in beneficiarios.iterator(chunk_size=2000):
+        contenido = {
+            'codigo': b.codigo_caja,
+            'nombre': b.nombre,
+            'planta': b.planta.nombre,
+            'caja': b.get_tipo_caja_display(),
+            'qr': b.codigo_caja,
+        }
+        clave = json.dumps([VERSION_DISENO, contenido['qr']])
+        contenido['hash'] = hashlib.sha256(clave.encode()).hexdigest()
+        etiquetas.append(contenido)
+    return etiquetas
+
+
+def _renderizar_lote(etiquetas, directorio):
+    """Dibuja los QR de un lote de etiquetas (se ejecuta en un proceso del pool)"""
+    import qrcode
+
+    for etiqueta in etiquetas:
+        qr = qrcode.QRCode(border=1, box_size=1, error_correction=qrcode.constants.ERROR_CORRECT_M)
+        qr.add_data(etiqueta['qr'])
+        # Un píxel por módulo: el PDF lo escala sin pérdida y pesa muy poco
+        imagen = qr.make_image().get_image().convert('1')
+
+        destino = Path(directorio) / f"{etiqueta['hash']}.png"
+        temporal = destino.with_suffix(f'.{os.getpid()}.tmp')
+        imagen.save(temporal, format='PNG')
+        os.replace(temporal, destino)
+
+    return len(etiquetas)
+
+
+def _partir(texto, largo):
+    lineas, actual = [], ''
+    for palabra in texto.split():
+        if actual and len(actual) + 1 + len(palabra) > largo:
+            lineas.append(actual)
+            actual = palabra
+        else:
+            actual = f'{actual} {palabra}'.strip()
+    if actual:
+        lineas.append(actual)
+    return lineas
+
+
+def _podar_cache(directorio, etiquetas):
+    """Elimina del caché las imágenes que esta generación no usó"""
+    usadas = {f"{e['hash']}.png" for e in etiquetas}
+    for archivo in directorio.glob('*.png'):
+        if archivo.name not in usadas:
+            archivo.unlink(missing_ok=True)
+
+
+def renderizar_etiquetas(etiquetas, directorio, procesos=None):
+    """
+    Renderiza en `directorio` las etiquetas que no estén en caché y elimina
+    las que sobran.
+
+    Returns:
+        tuple: (renderizadas, reutilizadas)
+    """
+    _verificar_dependencias()
+    pendientes = [e for e in etiquetas if not (directorio / f"{e['hash']}.png").exists()]
+    # Duplicados (mismo contenido) se dibujan una sola vez
+    pendientes = list({e['hash']: e for e in pendientes}.values())
+
+    lotes = [pendientes[i:i + LOTE_POR_PROCESO] for i in range(0, len(pendientes), LOTE_POR_PROCESO)]
+    if len(lotes) <= 1 or procesos == 1:
+        for lote in lotes:
+            _renderizar_lote(lote, str(directorio))
+    else:
+        procesos = procesos or getattr(settings, 'ETIQUETAS_PROCESOS', None) or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=min(procesos, len(lotes))) as pool:
+            list(pool.map(_renderizar_lote, lotes, [str(directorio)] * len(lotes)))
+    _podar_cache(directorio, etiquetas)
+
+    return len(pendientes), len(etiquetas) - len(pendientes)
+
+
+def _dibujar_etiqueta(pdf, etiqueta, directorio, x, y, ancho, alto):
+    from reportlab.lib.units import mm
+
+    margen = 3 * mm
+    lado = alto - 2 * margen
+    pdf.drawImage(str(directorio / f"{etiqueta['hash']}.png"), x + margen, y + margen, lado, lado)
+
+    texto_x = x + lado + 2 * margen
+    pdf.setFont('Helvetica-Bold', 12)
+    pdf.drawString(texto_x, y + alto - margen - 10, etiqueta['codigo'])
+    pdf.setFont('Helvetica', 8)
+    for n, linea in enumerate(_partir(etiqueta['nombre'], 22)[:3]):
+        pdf.drawString(texto_x, y + alto - margen - 22 - n * 10, linea)
+    pdf.setFont('Helvetica', 7)
+    pdf.drawString(texto_x, y + margen + 9, etiqueta['planta'])
+    pdf.drawString(texto_x, y + margen, etiqueta['caja'])
+
+
+def generar_pdf_etiquetas(campana, destino, procesos=None):
+    """
+    Genera el PDF de etiquetas de toda la campaña en `destino` (ruta o archivo).
+
+    Returns:
+        dict: total, renderizadas, reutilizadas y paginas
+    """
+    _verificar_dependencias()
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+
+    etiquetas = datos_etiquetas(campana)
+    directorio = _directorio_cache(campana.id)
+    renderizadas, reutilizadas = renderizar_etiquetas(etiquetas, directorio, procesos)
+
+    ancho_hoja, alto_hoja = A4
+    ancho, alto = ANCHO_MM * mm, ALTO_MM * mm
+    margen_x = (ancho_hoja - COLUMNAS * ancho) / 2
+    margen_y = (alto_hoja - FILAS * alto) / 2
+    por_hoja = COLUMNAS * FILAS
+
+    pdf = canvas.Canvas(destino, pagesize=A4)
+    pdf.setTitle(f'Etiquetas {campana.nombre}')
+    for i, etiqueta in enumerate(etiquetas):
+        if i and i % por_hoja == 0:
+            pdf.showPage()
+        posicion = i % por_hoja
+        x = margen_x + (posicion % COLUMNAS) * ancho
+        y = alto_hoja - margen_y - (posicion // COLUMNAS + 1) * alto
+        _dibujar_etiqueta(pdf, etiqueta, directorio, x, y, ancho, alto)
+    pdf.save()
+
+    return {
+        'total': len(etiquetas),
+        'renderizadas': renderizadas,
+        'reutilizadas': reutilizadas,
+        'paginas': (len(etiquetas) + por_hoja - 1) // por_hoja,
+    }
+
+
+def generar_pdf_en_segundo_plano(campana):
+    """
+    Genera el PDF de la campaña en ruta_pdf() desde un hilo aparte y retorna
+    el hilo. Corre en un solo proceso: desde un worker web no se lanza el pool.
+
+    Raises:
+        DependenciaFaltante: antes de lanzar el hilo
+    """
+    _verificar_dependencias()
+    destino = ruta_pdf(campana.id)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    # El PDF anterior no se ofrece mientras se genera el nuevo
+    destino.unlink(missing_ok=True)
+
+    def _tarea():
+        temporal = destino.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            resultado = generar_pdf_etiquetas(campana, str(temporal), procesos=1)
+            os.replace(temporal, destino)
+            print(f"DEBUG: Etiquetas de la campaña {campana.id} generadas: {resultado}")
+        except Exception as e:
+            temporal.unlink(missing_ok=True)
+            print(f"DEBUG: Error al generar etiquetas de la campaña {campana.id}: {str(e)}")
+        finally:
+            connection.close()
+
+    hilo = threading.Thread(target=_tarea, name=f'etiquetas-campana-{campana.id}', daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,264 @@
+"""
+Flujo de eventos (Server-Sent Events) para los paneles de admin y guardia
+
+Cada conexión consulta solo lo nuevo (Retiro/DiaBloquedo con id mayor al
+último enviado), así funciona con varios workers sin un bus externo. Las
+señales post_save despiertan de inmediato a las conexiones del mismo proceso;
+las de otros procesos lo notan en la siguiente vuelta (SSE_INTERVALO).
+
+Los ids se asignan al insertar, no al confirmar: en PostgreSQL una
+transacción lenta puede confirmar un id menor que el cursor. Por eso cada
+vuelta relee además los retiros de los últimos SSE_SOLAPE segundos (el
+cliente descarta los ids ya mostrados) y 'contadores' envía totales
+absolutos calculados con un agregado, no deltas: un retiro tardío nunca
+deja los contadores desfasados.
+
+Bajo ASGI (uvicorn/daphne, tresMontes.asgi) el flujo es un generador
+asíncrono: una conexión abierta espera en el event loop sin ocupar un
+worker ni un hilo, y cada vuelta es una consulta corta en el pool de
+sync_to_async. Cada proceso admite hasta SSE_MAX_CONEXIONES flujos largos.
+
+Bajo WSGI (o pasado ese tope) la respuesta hace una sola vuelta y se cierra;
+EventSource reconecta tras `retry` y retoma desde Last-Event-ID. Así un panel
+abierto nunca retiene un worker que necesita la portería.
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Beneficiario, Retiro, DiaBloquedo
+from .campanas_activas import obtener_registro
+from .utils import rango_fechas
+
+
+SSE_INTERVALO = 2
+SSE_DURACION = 300
+SSE_LATIDO = 15
+SSE_MAX_EVENTOS = 100
+SSE_MAX_CONEXIONES = 200
+SSE_SOLAPE = 30
+
+# Flujos esperando novedades en este proceso: (loop, asyncio.Event)
+_esperando = set()
+_lock = threading.Lock()
+_abiertos = 0
+
+
+def notificar():
+    """Despierta a los flujos abiertos en este proceso (se llama desde cualquier hilo)"""
+    with _lock:
+        esperando = list(_esperando)
+    for loop, evento in esperando:
+        try:
+            loop.call_soon_threadsafe(evento.set)
+        except RuntimeError:
+            pass  # loop cerrado
+
+
+async def _esperar_aviso(segundos):
+    evento = asyncio.Event()
+    clave = (asyncio.get_running_loop(), evento)
+    with _lock:
+        _esperando.add(clave)
+    try:
+        await asyncio.wait_for(evento.wait(), segundos)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        with _lock:
+            _esperando.discard(clave)
+
+
+@receiver(post_save, sender=Retiro)
+@receiver(post_save, sender=DiaBloquedo)
+def _al_guardar(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(notificar)
+
+
+def _evento(tipo, datos, ultimo=None):
+    lineas = []
+    if ultimo is not None:
+        lineas.append(f'id: {ultimo[0]}.{ultimo[1]}')
+    lineas.append(f'event: {tipo}')
+    lineas.append(f'data: {json.dumps(datos, ensure_ascii=False)}')
+    return '\n'.join(lineas) + '\n\n'
+
+
+def parsear_ultimo_id(valor):
+    """'retiro.bloqueo' (Last-Event-ID) -> (int, int), o None si no es válido"""
+    try:
+        retiro, bloqueo = valor.split('.')
+        return int(retiro), int(bloqueo)
+    except (AttributeError, ValueError):
+        return None
+
+
+def estado_inicial(planta, campana_id):
+    """
+    Cursor para un panel recién cargado (sin Last-Event-ID): el último id y
+    los retiros del solape que la página ya muestra, para no repetirlos.
+
+    Returns:
+        tuple: ((último retiro, último bloqueo), ids de retiro ya enviados)
+    """
+    ultimo_retiro = Retiro.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    ultimo_bloqueo = DiaBloquedo.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    tardios, _, _ = _novedades(planta, campana_id, ultimo_retiro, ultimo_bloqueo)
+    return (ultimo_retiro, ultimo_bloqueo), {retiro['id'] for retiro in tardios}
+
+
+def _novedades(planta, campana_id, ultimo_retiro, ultimo_bloqueo):
+    """
+    Retiros tardíos (id bajo el cursor y registrados hace menos de SSE_SOLAPE
+    segundos), retiros nuevos y bloqueos nuevos del alcance del panel.
+
+    Returns:
+        tuple: (retiros tardíos, retiros nuevos, bloqueos)
+    """
+    ids_activas = obtener_registro().ids
+    retiros = Retiro.objects.filter(beneficiario__campana_id__in=ids_activas)
+    bloqueos = DiaBloquedo.objects.filter(id__gt=ultimo_bloqueo, campana_id__in=ids_activas)
+    if planta is not None:
+        retiros = retiros.filter(beneficiario__planta=planta)
+    if campana_id:
+        retiros = retiros.filter(beneficiario__campana_id=campana_id)
+        bloqueos = bloqueos.filter(campana_id=campana_id)
+
+    campos = (
+        'id', 'fecha_hora', 'retirado_por_tercero', 'nombre_tercero',
+        'beneficiario__nombre', 'beneficiario__planta__codigo',
+    )
+    reciente = timezone.now() - timedelta(seconds=getattr(settings, 'SSE_SOLAPE', SSE_SOLAPE))
+    tardios = list(
+        retiros.filter(id__lte=ultimo_retiro, fecha_hora__gte=reciente)
+        .order_by('id').values(*campos)[:SSE_MAX_EVENTOS]
+    )
+    nuevos = list(retiros.filter(id__gt=ultimo_retiro).order_by('id').values(*campos)[:SSE_MAX_EVENTOS])
+    bloqueos = list(
+        bloqueos.order_by('id').values('id', 'fecha', 'motivo', 'campana_id', 'campana__nombre')[:SSE_MAX_EVENTOS]
+    )
+    return tardios, nuevos, bloqueos
+
+
+def _totales(planta, campana_id):
+    """Entregados, pendientes y entregas de hoy del alcance del panel (mismo criterio que los home)"""
+    beneficiarios = Beneficiario.objects.filter(campana_id__in=obtener_registro().ids)
+    if planta is not None:
+        beneficiarios = beneficiarios.filter(planta=planta)
+    if campana_id:
+        beneficiarios = beneficiarios.filter(campana_id=campana_id)
+
+    hoy = timezone.localdate()
+    inicio, fin = rango_fechas(hoy, hoy)
+    totales = beneficiarios.aggregate(
+        total=Count('id'),
+        entregados=Count('id', filter=Q(retiro__isnull=False)),
+        hoy=Count('id', filter=Q(retiro__fecha_hora__gte=inicio, retiro__fecha_hora__lt=fin)),
+    )
+    return {
+        'entregados': totales['entregados'],
+        'pendientes': totales['total'] - totales['entregados'],
+        'hoy': totales['hoy'],
+    }
+
+
+def _vuelta(planta, campana_id, ultimo, enviados):
+    """
+    Eventos SSE de lo nuevo desde `ultimo`: 'retiro', 'contadores' (totales
+    absolutos) y 'bloqueo'. `enviados` guarda los ids de retiro ya emitidos
+    en este flujo para no repetir los que vuelve a leer el solape.
+
+    Returns:
+        tuple: (lista de eventos, nuevo último id)
+    """
+    ultimo_retiro, ultimo_bloqueo = ultimo
+    tardios, nuevos, bloqueos = _novedades(planta, campana_id, ultimo_retiro, ultimo_bloqueo)
+    retiros = [retiro for retiro in tardios + nuevos if retiro['id'] not in enviados]
+    enviados.update(retiro['id'] for retiro in retiros)
+    eventos = []
+
+    for retiro in retiros:
+        ultimo_retiro = max(ultimo_retiro, retiro['id'])
+        fecha_hora = timezone.localtime(retiro['fecha_hora'])
+        eventos.append(_evento('retiro', {
+            'id': retiro['id'],
+            'nombre': retiro['beneficiario__nombre'],
+            'planta': retiro['beneficiario__planta__codigo'],
+            'hora': fecha_hora.strftime('%H:%M'),
+            'tercero': retiro['nombre_tercero'] if retiro['retirado_por_tercero'] else '',
+        }, (ultimo_retiro, ultimo_bloqueo)))
+    if retiros:
+        eventos.append(_evento('contadores', _totales(planta, campana_id), (ultimo_retiro, ultimo_bloqueo)))
+
+    for bloqueo in bloqueos:
+        ultimo_bloqueo = bloqueo['id']
+        eventos.append(_evento('bloqueo', {
+            'fecha': bloqueo['fecha'].strftime('%d/%m/%Y'),
+            'motivo': bloqueo['motivo'],
+            'campana': bloqueo['campana__nombre'],
+        }, (ultimo_retiro, ultimo_bloqueo)))
+
+    return eventos, (ultimo_retiro, ultimo_bloqueo)
+
+
+def _cursor(ultimo):
+    """Solo id: EventSource guarda el Last-Event-ID sin disparar un evento (no pierde lo ocurrido al reconectar)"""
+    return f'id: {ultimo[0]}.{ultimo[1]}\n\n'
+
+
+def _reintento():
+    return f"retry: {int(getattr(settings, 'SSE_INTERVALO', SSE_INTERVALO) * 1000)}\n\n"
+
+
+def eventos_una_vez(planta, campana_id, ultimo, enviados):
+    """Una sola vuelta (WSGI o tope de conexiones); EventSource reconecta tras `retry`"""
+    yield _reintento()
+    eventos, ultimo = _vuelta(planta, campana_id, ultimo, enviados)
+    yield from eventos
+    yield _cursor(ultimo)
+
+
+async def flujo_eventos(planta, campana_id, ultimo, enviados):
+    """
+    Generador asíncrono de eventos SSE (ASGI). Se cierra tras SSE_DURACION
+    segundos (o tras una vuelta si el proceso ya tiene SSE_MAX_CONEXIONES
+    flujos abiertos); EventSource reconecta solo y retoma desde Last-Event-ID.
+    """
+    global _abiertos
+    intervalo = getattr(settings, 'SSE_INTERVALO', SSE_INTERVALO)
+    lleno = _abiertos >= getattr(settings, 'SSE_MAX_CONEXIONES', SSE_MAX_CONEXIONES)
+    limite = time.monotonic() + (0 if lleno else getattr(settings, 'SSE_DURACION', SSE_DURACION))
+    ultimo_latido = time.monotonic()
+    vuelta = sync_to_async(_vuelta)
+
+    _abiertos += 1  # solo se modifica desde el event loop
+    try:
+        yield _reintento()
+        while True:
+            eventos, ultimo = await vuelta(planta, campana_id, ultimo, enviados)
+            for evento in eventos:
+                yield evento
+
+            if eventos:
+                ultimo_latido = time.monotonic()
+            elif time.monotonic() - ultimo_latido >= SSE_LATIDO:
+                ultimo_latido = time.monotonic()
+                yield ': latido\n\n'
+
+            if time.monotonic() >= limite:
+                yield _cursor(ultimo)
+                break
+            await _esperar_aviso(intervalo)
+    finally:
+        _abiertos -= 1
@@ -0,0 +1,40 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+from registroCajas.models import Planta, Retiro
+from registroCajas.rendimiento import actualizar_rendimiento
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el resumen diario de rendimiento por guardia (por defecto, ayer y hoy; '
+        'programar cada pocos minutos: el reporte no recalcula al abrirse)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat)
+        parser.add_argument('--hasta', type=date.fromisoformat)
+        parser.add_argument('--todo', action='store_true', help='Desde el primer retiro registrado')
+        parser.add_argument('--planta', help='Código de planta (por defecto, todas)')
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        hasta = options['hasta'] or hoy
+        desde = options['desde'] or hasta - timedelta(days=1)
+        if options['todo']:
+            primero = Retiro.objects.aggregate(primero=Min('fecha_hora'))['primero']
+            desde = timezone.localtime(primero).date() if primero else hasta
+
+        plantas = None
+        if options['planta']:
+            plantas = list(Planta.objects.filter(codigo=options['planta']).values_list('id', flat=True))
+
+        inicio = time.perf_counter()
+        total = actualizar_rendimiento(desde, hasta, plantas)
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} resúmenes de guardia-día entre {desde} y {hasta} ({duracion:.1f}s)'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from registroCajas.archivo import archivar_campana
+from registroCajas.models import Campana
+
+
+class Command(BaseCommand):
+    help = 'Mueve campañas inactivas y todos sus registros al archivo comprimido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campana_ids', nargs='*', type=int)
+        parser.add_argument('--inactivas', action='store_true', help='Archivar todas las campañas inactivas')
+
+    def handle(self, *args, **options):
+        if options['inactivas']:
+            campanas = Campana.objects.filter(activa=False)
+        elif options['campana_ids']:
+            campanas = Campana.objects.filter(id__in=options['campana_ids'])
+        else:
+            raise CommandError('Indique los ids de campaña o use --inactivas')
+
+        total = 0
+        for campana in campanas.select_related('planta'):
+            try:
+                archivada = archivar_campana(campana)
+            except ValueError as e:
+                self.stdout.write(self.style.WARNING(str(e)))
+                continue
+            total += 1
+            self.stdout.write(
+                f'{campana.nombre}: {archivada.total_beneficiarios} beneficiarios -> {archivada.archivo.name}'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'\nCampañas archivadas: {total}'))
@@ -0,0 +1,136 @@
+"""
+Latencia de las rutas de portería y de reportes contra el motor configurado.
+
+Corre sobre una base temporal (creada y migrada como la de los tests, con
+datos de generar_datos) para que las escrituras se confirmen de verdad: en
+SQLite el costo de cada commit (journal + fsync) es la mayor parte de la
+latencia de un escaneo. Con SQLite la base temporal es un archivo, no
+memoria. La base configurada no se toca.
+
+Ejemplo:
+    python manage.py benchmark_bd --repeticiones 100
+    DB_MOTOR=postgresql python manage.py benchmark_bd --repeticiones 100
+"""
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from registroCajas.models import Beneficiario, Campana, Perfil, Planta, Retiro
+from registroCajas.management.commands.generar_datos import PLANTAS
+from registroCajas.routers import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia de las rutas de portería y de reportes sobre una base temporal, '
+        'confirmando las escrituras. Ejecutar una vez con SQLite y otra con DB_MOTOR=postgresql para comparar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=50)
+        parser.add_argument('--beneficiarios', type=int, default=5000, help='Beneficiarios de la campaña generada')
+        parser.add_argument('--host', default='localhost', help='Host permitido en ALLOWED_HOSTS')
+
+    def handle(self, *args, **options):
+        nombre_original = connection.settings_dict['NAME']
+        directorio = None
+        if connection.vendor == 'sqlite':
+            # Archivo en disco: una base en memoria no paga fsync
+            directorio = tempfile.mkdtemp(prefix='benchmark_bd_')
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directorio, 'benchmark.sqlite3')
+
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        if REPLICA_ALIAS in connections:
+            # Los reportes leen de la réplica: que lean la base temporal
+            connections[REPLICA_ALIAS].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            self._medir(options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            if directorio:
+                os.rmdir(directorio)
+
+    def _medir(self, options):
+        repeticiones = options['repeticiones']
+
+        # Un guardia por planta (generar_datos los usa como confirmado_por) y un administrador
+        for codigo, nombre in PLANTAS:
+            planta = Planta.objects.create(codigo=codigo, nombre=nombre)
+            guardia = User.objects.create_user(f'benchmark_guardia_{codigo}')
+            Perfil.objects.create(user=guardia, rol='guardia', planta=planta, nombre_completo=f'Guardia {nombre}')
+        guardia = User.objects.select_related('perfil__planta').get(username=f'benchmark_guardia_{PLANTAS[0][0]}')
+        admin = User.objects.create_user('benchmark_admin')
+        Perfil.objects.create(user=admin, rol='admin', planta=guardia.perfil.planta, nombre_completo='Benchmark')
+
+        call_command(
+            'generar_datos', beneficiarios=max(options['beneficiarios'], repeticiones * 6),
+            retirados=0.5, semilla=1, stdout=io.StringIO()
+        )
+        # La campaña generada termina ayer; en portería la campaña está en curso
+        Campana.objects.update(fecha_fin=timezone.localdate())
+
+        beneficiarios = list(
+            Beneficiario.objects.filter(
+                planta=guardia.perfil.planta,
+                campana__activa=True,
+                retiro__isnull=True
+            ).values_list('id', 'rut')[:repeticiones]
+        )
+        if len(beneficiarios) < repeticiones:
+            raise CommandError(f'Solo hay {len(beneficiarios)} beneficiarios pendientes; use más --beneficiarios')
+
+        cliente_guardia = self._cliente(guardia, options['host'])
+        cliente_admin = self._cliente(admin, options['host'])
+
+        self.stdout.write(f'Motor: {connection.vendor} (base temporal {connection.settings_dict["NAME"]})')
+        self.stdout.write(f'Repeticiones: {repeticiones}  Plantas: {Planta.objects.count()}\n')
+
+        # Cada confirmación registra a un beneficiario distinto y se confirma (commit real)
+        rutas = [
+            ('guardia_home', cliente_guardia, lambda i: ('get', reverse('guardia_home'), {})),
+            ('guardia_buscar_rut', cliente_guardia, lambda i: (
+                'get', reverse('guardia_buscar_rut'), {'rut': beneficiarios[i][1]}
+            )),
+            ('guardia_confirmar', cliente_guardia, lambda i: (
+                'post', reverse('guardia_confirmar', args=[beneficiarios[i][0]]), {'retira_titular': 'on'}
+            )),
+            ('lista_diaria', cliente_admin, lambda i: ('get', reverse('lista_diaria'), {})),
+            ('admin_reportes', cliente_admin, lambda i: ('get', reverse('admin_reportes'), {'periodo': 'mes'})),
+        ]
+
+        for nombre, cliente, peticion in rutas:
+            tiempos = []
+            for i in range(repeticiones):
+                metodo, url, datos = peticion(i)
+                inicio = time.perf_counter()
+                getattr(cliente, metodo)(url, datos)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            self._reportar(nombre, tiempos)
+
+        confirmados = Retiro.objects.filter(beneficiario_id__in=[b[0] for b in beneficiarios]).count()
+        self.stdout.write(f'\nRetiros confirmados en la base temporal: {confirmados}/{repeticiones}')
+
+    def _cliente(self, user, host):
+        cliente = Client(SERVER_NAME=host)
+        cliente.force_login(user)
+        session = cliente.session
+        session['planta_codigo'] = user.perfil.planta.codigo
+        session.save()
+        return cliente
+
+    def _reportar(self, nombre, tiempos):
+        tiempos.sort()
+        p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+        self.stdout.write(
+            f'{nombre:<22} media={statistics.mean(tiempos):7.2f}ms '
+            f'p50={statistics.median(tiempos):7.2f}ms p95={p95:7.2f}ms'
+        )
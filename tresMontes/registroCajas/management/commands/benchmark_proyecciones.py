@@ -0,0 +1,72 @@
+"""
+Compara instancias de Beneficiario (select_related) con filas de
+proyecciones.BeneficiarioFila para el listado completo de una campaña:
+tiempo (consulta + armado de filas) y memoria retenida por fila.
+
+Ejemplo:
+    python manage.py generar_datos --beneficiarios 10000
+    python manage.py benchmark_proyecciones
+"""
+import gc
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from registroCajas.models import Campana
+from registroCajas.proyecciones import BeneficiarioFila
+
+
+class Command(BaseCommand):
+    help = 'Mide tiempo y memoria por fila de los listados con instancias de modelo frente a proyecciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campana', type=int, help='Por defecto, la campaña con más beneficiarios')
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        campanas = Campana.objects.annotate(total=Count('beneficiarios'))
+        if options['campana']:
+            campana = campanas.filter(id=options['campana']).first()
+        else:
+            campana = campanas.order_by('-total').first()
+        if not campana or not campana.total:
+            raise CommandError('No hay una campaña con beneficiarios (ver generar_datos)')
+
+        consulta = campana.beneficiarios.order_by('nombre')
+        variantes = [
+            ('instancias', lambda: list(consulta.select_related('planta', 'retiro'))),
+            ('proyeccion', lambda: BeneficiarioFila.desde(consulta)),
+        ]
+        self.stdout.write(f'Campaña "{campana.nombre}": {campana.total} beneficiarios, '
+                          f'{options["repeticiones"]} repeticiones\n')
+
+        resultados = {}
+        for nombre, cargar in variantes:
+            cargar()  # calentamiento
+            tiempos = []
+            for _ in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                cargar()
+                tiempos.append(time.perf_counter() - inicio)
+
+            gc.collect()
+            tracemalloc.start()
+            filas = cargar()
+            memoria = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            por_fila_us = statistics.median(tiempos) / len(filas) * 1e6
+            por_fila_bytes = memoria / len(filas)
+            resultados[nombre] = (por_fila_us, por_fila_bytes)
+            self.stdout.write(
+                f'{nombre:<11} {statistics.median(tiempos) * 1000:8.1f}ms  '
+                f'{por_fila_us:6.1f}µs/fila  {por_fila_bytes:7.0f} bytes/fila'
+            )
+            del filas
+
+        (t_inst, m_inst), (t_proy, m_proy) = resultados['instancias'], resultados['proyeccion']
+        self.stdout.write(self.style.SUCCESS(
+            f'Proyección: {t_inst / t_proy:.1f}x menos tiempo y {m_inst / m_proy:.1f}x menos memoria por fila'
+        ))
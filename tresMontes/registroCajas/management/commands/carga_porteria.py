@@ -0,0 +1,204 @@
+"""
+Prueba de carga de portería contra un servidor local en ejecución.
+
+Simula N guardias por planta que inician sesión por login_view y registran
+entregas por guardia_buscar_rut + guardia_confirmar (ingreso manual) o por
+guardia_escanear_qr con un token QR firmado (escaneo QR), todos en paralelo.
+
+Ejemplo (con `python manage.py runserver` en otra terminal):
+    python manage.py carga_porteria --guardias 4 --escaneos 50 --crear-guardias --rafaga
+"""
+import http.cookiejar
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from registroCajas.middleware import ENCABEZADO_BLOQUEO
+from registroCajas.models import Planta, Perfil, Beneficiario
+from registroCajas.tokens import generar_token_qr
+
+
+class GuardiaSimulado:
+    """Cliente HTTP con su propia sesión (cookies) para un guardia"""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def _csrf(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def pedir(self, ruta, datos=None):
+        """Retorna (status, ruta final, encabezados)"""
+        url = f'{self.base_url}{ruta}'
+        cuerpo = None
+        headers = {}
+        if datos is not None:
+            datos = dict(datos, csrfmiddlewaretoken=self._csrf())
+            cuerpo = urllib.parse.urlencode(datos).encode()
+            headers['Referer'] = url
+        peticion = urllib.request.Request(url, data=cuerpo, headers=headers)
+        try:
+            with self.opener.open(peticion, timeout=60) as respuesta:
+                respuesta.read()
+                return respuesta.status, urllib.parse.urlsplit(respuesta.geturl()).path, respuesta.headers
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, urllib.parse.urlsplit(url).path, e.headers
+
+    def login(self):
+        self.pedir(reverse('login'))  # Obtiene la cookie csrftoken
+        return self.pedir(reverse('login'), {'username': self.username, 'password': self.password})
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga de portería (login, búsqueda por RUT, confirmación y escaneo QR) contra un servidor local'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--guardias', type=int, default=2, help='Guardias simulados por planta')
+        parser.add_argument('--escaneos', type=int, default=20, help='Entregas por guardia')
+        parser.add_argument('--proporcion-qr', type=float, default=0.5, help='Fracción de entregas por escaneo QR (token firmado)')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos entre entregas de un mismo guardia')
+        parser.add_argument('--rafaga', action='store_true', help='Todos los guardias parten al mismo tiempo (cambio de turno)')
+        parser.add_argument('--semilla', type=int, default=None, help='Semilla aleatoria para reproducir una corrida')
+        parser.add_argument('--crear-guardias', action='store_true', help='Crea las cuentas carga_guardia_<planta>_<n>')
+        parser.add_argument('--password', default='carga123')
+
+    def handle(self, *args, **options):
+        rutas = {
+            'home': reverse('guardia_home'),
+            'escanear': reverse('guardia_escanear_qr'),
+            'buscar_rut': reverse('guardia_buscar_rut'),
+            'exitoso': reverse('guardia_confirmar_exitoso'),
+        }
+        aleatorio = random.Random(options['semilla'])
+        plantas = list(Planta.objects.filter(activa=True))
+        if not plantas:
+            raise CommandError('No hay plantas activas')
+
+        guardias = []
+        for planta in plantas:
+            # Beneficiarios pendientes de la planta, repartidos entre sus guardias
+            pendientes = list(
+                Beneficiario.objects.filter(planta=planta, campana__activa=True, retiro__isnull=True)
+                .only('id', 'rut', 'campana_id')[:options['guardias'] * options['escaneos']]
+            )
+            aleatorio.shuffle(pendientes)
+            for n in range(options['guardias']):
+                username = f'carga_guardia_{planta.codigo}_{n}'
+                if options['crear_guardias']:
+                    self._crear_guardia(username, options['password'], planta)
+                elif not User.objects.filter(username=username).exists():
+                    raise CommandError(f'No existe el usuario {username}. Use --crear-guardias')
+                asignados = pendientes[n::options['guardias']]
+                guardias.append((GuardiaSimulado(options['url'], username, options['password']), asignados))
+
+        self.stdout.write(
+            f'{len(guardias)} guardias en {len(plantas)} plantas, '
+            f'{sum(len(a) for _, a in guardias)} entregas pendientes asignadas'
+        )
+
+        resultados = defaultdict(list)  # operación -> [(ms, estado)]
+        lock = threading.Lock()
+        barrera = threading.Barrier(len(guardias)) if options['rafaga'] else None
+
+        def registrar(operacion, inicio, estado):
+            with lock:
+                resultados[operacion].append(((time.perf_counter() - inicio) * 1000, estado))
+
+        def trabajar(guardia, asignados, semilla):
+            rnd = random.Random(semilla)
+            if barrera:
+                barrera.wait()
+
+            inicio = time.perf_counter()
+            status, ruta, encabezados = guardia.login()
+            registrar('login', inicio, self._estado(status, encabezados, ruta == rutas['home']))
+
+            for beneficiario in asignados:
+                if rnd.random() < options['proporcion_qr']:
+                    # El token se genera al momento, como lo muestra la pantalla del trabajador
+                    codigo = urllib.parse.quote(generar_token_qr(beneficiario))
+                    inicio = time.perf_counter()
+                    status, ruta, encabezados = guardia.pedir(f"{rutas['escanear']}?codigo={codigo}")
+                    registrar('escaneo_qr', inicio, self._estado(status, encabezados, ruta == rutas['exitoso']))
+                else:
+                    inicio = time.perf_counter()
+                    status, ruta, encabezados = guardia.pedir(
+                        f"{rutas['buscar_rut']}?rut={urllib.parse.quote(beneficiario.rut)}"
+                    )
+                    registrar('buscar_rut', inicio, self._estado(status, encabezados, status == 200))
+
+                    inicio = time.perf_counter()
+                    status, ruta, encabezados = guardia.pedir(
+                        reverse('guardia_confirmar', args=[beneficiario.id]), {'retira_titular': 'on'}
+                    )
+                    registrar('confirmar', inicio, self._estado(status, encabezados, ruta == rutas['exitoso']))
+                if options['pausa']:
+                    time.sleep(options['pausa'])
+
+        hilos = [
+            threading.Thread(target=trabajar, args=(guardia, asignados, aleatorio.random()))
+            for guardia, asignados in guardias
+        ]
+        inicio_total = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio_total
+
+        self._reportar(resultados, duracion)
+
+    def _crear_guardia(self, username, password, planta):
+        user, created = User.objects.get_or_create(username=username)
+        if created:
+            user.set_password(password)
+            user.save()
+        Perfil.objects.update_or_create(
+            user=user,
+            defaults={'rol': 'guardia', 'planta': planta, 'nombre_completo': f'Guardia carga {username}'}
+        )
+
+    def _estado(self, status, encabezados, exito):
+        # El servidor marca los 500 causados por un bloqueo de la base (ConsultasMiddleware)
+        if encabezados.get(ENCABEZADO_BLOQUEO):
+            return 'bloqueo'
+        if status >= 400:
+            return 'error'
+        return 'ok' if exito else 'rechazado'
+
+    def _reportar(self, resultados, duracion):
+        total = sum(len(r) for r in resultados.values())
+        self.stdout.write(f'\nDuración: {duracion:.1f}s  Peticiones: {total}  Throughput: {total / duracion:.1f} req/s\n')
+        self.stdout.write(f'{"operación":<12} {"n":>6} {"p50":>9} {"p95":>9} {"p99":>9} {"errores":>8} {"bloqueos":>9} {"rechazos":>9}')
+
+        for operacion, muestras in resultados.items():
+            tiempos = sorted(ms for ms, _ in muestras)
+            estados = [estado for _, estado in muestras]
+            self.stdout.write(
+                f'{operacion:<12} {len(tiempos):>6} '
+                f'{self._percentil(tiempos, 50):>7.1f}ms {self._percentil(tiempos, 95):>7.1f}ms '
+                f'{self._percentil(tiempos, 99):>7.1f}ms '
+                f'{estados.count("error"):>8} {estados.count("bloqueo"):>9} {estados.count("rechazado"):>9}'
+            )
+
+    def _percentil(self, valores, p):
+        if len(valores) < 2:
+            return valores[0] if valores else 0.0
+        return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
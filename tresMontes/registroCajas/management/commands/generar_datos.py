@@ -0,0 +1,248 @@
+"""
+Generador de datos sintéticos a gran escala para pruebas de rendimiento.
+
+Todas las tablas grandes se escriben con INSERT por lotes (executemany).
+
+Ejemplo (≈1 millón de filas entre todas las tablas):
+    python manage.py generar_datos --campanas 2 --beneficiarios 300000 --semilla 1
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from registroCajas.models import (
+    Planta, Campana, DiaBloquedo, Beneficiario,
+    Retiro, AutorizacionTercero, AgendaRetiro
+)
+from registroCajas.utils import formatear_rut
+
+
+PLANTAS = [
+    ('casablanca', 'Casa Blanca'),
+    ('valparaiso_bif', 'Valparaíso Planta BIF'),
+    ('valparaiso_bic', 'Valparaíso Planta BIC'),
+]
+
+NOMBRES = ['Juan', 'María', 'Pedro', 'Camila', 'José', 'Francisca', 'Luis', 'Valentina', 'Carlos', 'Javiera',
+           'Diego', 'Catalina', 'Jorge', 'Constanza', 'Felipe', 'Daniela', 'Manuel', 'Fernanda', 'Cristián', 'Paula']
+APELLIDOS = ['González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Sepúlveda',
+             'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres', 'Araya', 'Flores', 'Espinoza', 'Valenzuela']
+
+# Llegadas a portería: picos en los cambios de turno (hora, desviación en minutos, peso)
+# y un fondo uniforme durante la jornada administrativa
+PICOS_PORTERIA = [(7.5, 20, 0.35), (15.5, 25, 0.35), (23.25, 15, 0.1)]
+JORNADA = (8, 18)
+
+LOTE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Genera campañas sintéticas con beneficiarios, retiros, autorizaciones, agendas y días bloqueados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campanas', type=int, default=1)
+        parser.add_argument('--beneficiarios', type=int, default=10000, help='Beneficiarios por campaña')
+        parser.add_argument('--dias', type=int, default=14, help='Duración de cada campaña en días')
+        parser.add_argument('--retirados', type=float, default=0.7, help='Fracción de beneficiarios con retiro')
+        parser.add_argument('--terceros', type=float, default=0.1, help='Fracción de retiros hechos por terceros')
+        parser.add_argument('--autorizaciones', type=float, default=0.05, help='Fracción con autorización a tercero')
+        parser.add_argument('--agendas', type=float, default=0.2, help='Fracción con agenda de retiro')
+        parser.add_argument('--bloqueados', type=int, default=1, help='Días bloqueados por campaña')
+        parser.add_argument('--inactivas', action='store_true', help='Crear las campañas como inactivas')
+        parser.add_argument('--semilla', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['semilla'])
+        self.zona = timezone.get_current_timezone()
+        inicio = time.perf_counter()
+
+        plantas = self._plantas()
+        guardias = self._guardias(plantas)
+        admin = User.objects.filter(perfil__rol='admin').first()
+
+        totales = {}
+        for fecha_inicio in self._fechas_inicio(options['campanas'], options['dias']):
+            with transaction.atomic():
+                conteos = self._generar_campana(fecha_inicio, plantas, guardias, admin, options)
+            for modelo, total in conteos.items():
+                totales[modelo] = totales.get(modelo, 0) + total
+
+        duracion = time.perf_counter() - inicio
+        for modelo, total in totales.items():
+            self.stdout.write(f'  {modelo}: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{sum(totales.values())} filas generadas en {duracion:.1f}s'
+        ))
+
+    def _plantas(self):
+        plantas = []
+        for codigo, nombre in PLANTAS:
+            planta, _ = Planta.objects.get_or_create(codigo=codigo, defaults={'nombre': nombre})
+            plantas.append(planta)
+        return plantas
+
+    def _guardias(self, plantas):
+        """Ids de usuarios guardia por planta (para confirmado_por)"""
+        guardias = {planta.id: [] for planta in plantas}
+        for user_id, planta_id in User.objects.filter(perfil__rol='guardia').values_list('id', 'perfil__planta_id'):
+            if planta_id in guardias:
+                guardias[planta_id].append(user_id)
+        return guardias
+
+    def _fechas_inicio(self, cantidad, dias):
+        """
+        Fechas de inicio cuyo día/mes no usa otra campaña: el código de caja
+        se arma con el día y mes de inicio y debe ser único.
+        """
+        usados = {f.strftime('%d%m') for f in Campana.objects.values_list('fecha_inicio', flat=True)}
+        fecha = timezone.localdate() - timedelta(days=dias * cantidad)
+        fechas = []
+        while len(fechas) < cantidad:
+            if fecha.strftime('%d%m') not in usados:
+                usados.add(fecha.strftime('%d%m'))
+                fechas.append(fecha)
+            fecha += timedelta(days=dias)
+            if fecha.strftime('%d%m') in usados:
+                fecha += timedelta(days=1)
+        return fechas
+
+    def _rut(self, numero):
+        return formatear_rut(numero)
+
+    def _nombre(self):
+        return (f'{self.rnd.choice(NOMBRES)} {self.rnd.choice(NOMBRES)} '
+                f'{self.rnd.choice(APELLIDOS)} {self.rnd.choice(APELLIDOS)}')
+
+    def _hora_llegada(self):
+        """Hora del día (en horas decimales) según la distribución de portería"""
+        r = self.rnd.random()
+        acumulado = 0
+        for hora, desviacion, peso in PICOS_PORTERIA:
+            acumulado += peso
+            if r < acumulado:
+                return min(23.99, max(0.0, self.rnd.gauss(hora, desviacion / 60)))
+        return self.rnd.uniform(*JORNADA)
+
+    def _generar_campana(self, fecha_inicio, plantas, guardias, admin, options):
+        n = options['beneficiarios']
+        fecha_fin = fecha_inicio + timedelta(days=options['dias'] - 1)
+        campana = Campana.objects.create(
+            nombre=f'Sintética {fecha_inicio.strftime("%d/%m/%Y")}',
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            planta=plantas[0],
+            activa=not options['inactivas'],
+            creado_por=admin,
+        )
+        dias_campana = [fecha_inicio + timedelta(days=i) for i in range(options['dias'])]
+
+        # Días bloqueados (pocos: se insertan con el ORM)
+        bloqueados = self.rnd.sample(dias_campana, min(options['bloqueados'], len(dias_campana) - 1))
+        DiaBloquedo.objects.bulk_create([
+            DiaBloquedo(campana=campana, fecha=fecha, motivo='feriado', bloqueado_por=admin)
+            for fecha in bloqueados
+        ])
+        dias_habiles = [d for d in dias_campana if d not in bloqueados]
+
+        # Beneficiarios: RUTs únicos sin materializar el rango completo
+        ddmm = fecha_inicio.strftime('%d%m')
+        correlativos = {planta.id: 0 for planta in plantas}
+        codigos_planta = {planta.id: planta.get_codigo_corto() for planta in plantas}
+        plantas_ids = list(correlativos)
+        beneficiarios = []
+        for numero in self.rnd.sample(range(5_000_000, 30_000_000), n):
+            planta_id = self.rnd.choice(plantas_ids)
+            tipo_contrato = 'indefinido' if self.rnd.random() < 0.7 else 'fijo'
+            correlativos[planta_id] += 1
+            beneficiarios.append((
+                campana.id,
+                self._nombre(),
+                self._rut(numero),
+                tipo_contrato,
+                self.rnd.choices(['estandar', 'especial', 'premium'], [0.8, 0.15, 0.05])[0],
+                planta_id,
+                f"{'I' if tipo_contrato == 'indefinido' else 'F'}-{ddmm}"
+                f"{codigos_planta[planta_id]}{str(correlativos[planta_id]).zfill(2)}",
+            ))
+        self._insertar(Beneficiario, ['campana', 'nombre', 'rut', 'tipo_contrato', 'tipo_caja', 'planta', 'codigo_caja'], beneficiarios)
+        del beneficiarios
+
+        filas = Beneficiario.objects.filter(campana=campana).values_list('id', 'planta_id', 'codigo_caja')
+
+        ops = connection.ops
+        ahora = ops.adapt_datetimefield_value(timezone.now())
+        fechas_habiles = [(d, ops.adapt_datefield_value(d)) for d in dias_habiles]
+
+        retiros, autorizaciones, agendas = [], [], []
+        for beneficiario_id, planta_id, codigo_caja in filas.iterator(chunk_size=LOTE):
+            if self.rnd.random() < options['agendas']:
+                agendas.append((beneficiario_id, self.rnd.choice(fechas_habiles)[1], False, ahora))
+
+            autorizado = self.rnd.random() < options['autorizaciones']
+            if autorizado:
+                autorizaciones.append((
+                    beneficiario_id,
+                    self._nombre(),
+                    self._rut(self.rnd.randrange(5_000_000, 30_000_000)),
+                    self.rnd.choice(fechas_habiles)[1],
+                    self.rnd.random() < 0.8,
+                    True,
+                    ahora,
+                ))
+
+            if self.rnd.random() < options['retirados']:
+                dia = self.rnd.choice(fechas_habiles)[0]
+                fecha_hora = datetime.combine(dia, datetime.min.time()) + timedelta(hours=self._hora_llegada())
+                por_tercero = autorizado or self.rnd.random() < options['terceros']
+                candidatos = guardias.get(planta_id)
+                retiros.append((
+                    beneficiario_id,
+                    ops.adapt_datetimefield_value(timezone.make_aware(fecha_hora, self.zona)),
+                    self.rnd.choice(candidatos) if candidatos else None,
+                    '',
+                    por_tercero,
+                    self._nombre() if por_tercero else '',
+                    self._rut(self.rnd.randrange(5_000_000, 30_000_000)) if por_tercero else '',
+                    codigo_caja,
+                    'porteria',
+                ))
+
+        self._insertar(Retiro, [
+            'beneficiario', 'fecha_hora', 'confirmado_por', 'observaciones',
+            'retirado_por_tercero', 'nombre_tercero', 'rut_tercero', 'codigo_caja', 'origen'
+        ], retiros)
+        self._insertar(AutorizacionTercero, [
+            'beneficiario', 'nombre_tercero', 'rut_tercero', 'fecha_autorizada',
+            'solo_una_vez', 'activa', 'fecha_creacion'
+        ], autorizaciones)
+        self._insertar(AgendaRetiro, ['beneficiario', 'fecha_agendada', 'confirmado_hoy', 'fecha_creacion'], agendas)
+
+        self.stdout.write(f'Campaña "{campana.nombre}": {n} beneficiarios, {len(retiros)} retiros')
+        return {
+            'Beneficiario': n,
+            'Retiro': len(retiros),
+            'AutorizacionTercero': len(autorizaciones),
+            'AgendaRetiro': len(agendas),
+            'DiaBloquedo': len(bloqueados),
+            'Campana': 1,
+        }
+
+    def _insertar(self, modelo, campos, filas):
+        """
+        INSERT por lotes con executemany, sin instanciar modelos.
+
+        Los valores deben venir ya adaptados a la base (ops.adapt_*_value).
+        """
+        ops = connection.ops
+        tabla = ops.quote_name(modelo._meta.db_table)
+        columnas = ', '.join(ops.quote_name(modelo._meta.get_field(campo).column) for campo in campos)
+        marcadores = ', '.join(['%s'] * len(campos))
+        sql = f'INSERT INTO {tabla} ({columnas}) VALUES ({marcadores})'
+        with connection.cursor() as cursor:
+            for i in range(0, len(filas), LOTE):
+                cursor.executemany(sql, filas[i:i + LOTE])
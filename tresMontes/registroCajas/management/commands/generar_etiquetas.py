@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from registroCajas.etiquetas import generar_pdf_etiquetas, DependenciaFaltante
+from registroCajas.models import Campana
+
+
+class Command(BaseCommand):
+    help = 'Genera el PDF de etiquetas (código de caja, nombre, planta y QR) de una campaña'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campana_id', type=int)
+        parser.add_argument('--salida', help='Ruta del PDF (por defecto etiquetas_<id>.pdf)')
+        parser.add_argument('--procesos', type=int, help='Procesos del pool (por defecto, uno por CPU)')
+
+    def handle(self, *args, **options):
+        try:
+            campana = Campana.objects.get(id=options['campana_id'])
+        except Campana.DoesNotExist:
+            raise CommandError(f'No existe la campaña {options["campana_id"]}')
+
+        salida = options['salida'] or f'etiquetas_{campana.id}.pdf'
+        inicio = time.perf_counter()
+        try:
+            resultado = generar_pdf_etiquetas(campana, salida, procesos=options['procesos'])
+        except DependenciaFaltante as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f'{resultado["total"]} etiquetas en {resultado["paginas"]} hojas '
+            f'({resultado["renderizadas"]} renderizadas, {resultado["reutilizadas"]} desde caché) '
+            f'en {time.perf_counter() - inicio:.1f}s'
+        )
+        self.stdout.write(self.style.SUCCESS(f'PDF generado: {salida}'))
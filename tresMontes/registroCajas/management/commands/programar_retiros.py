@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from registroCajas.agenda import programar_retiros
+from registroCajas.models import Campana
+
+
+class Command(BaseCommand):
+    help = 'Asigna bloques horarios de retiro a los beneficiarios pendientes según la capacidad de cada portería'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campana_ids', nargs='*', type=int, help='Por defecto, todas las campañas activas')
+
+    def handle(self, *args, **options):
+        campanas = None
+        if options['campana_ids']:
+            campanas = list(Campana.objects.filter(id__in=options['campana_ids'], activa=True))
+            if len(campanas) != len(set(options['campana_ids'])):
+                raise CommandError('Alguna campaña no existe o no está activa')
+
+        inicio = time.perf_counter()
+        resultado = programar_retiros(campanas)
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['asignadas']} agendas nuevas, {resultado['reprogramadas']} reprogramadas, "
+            f"{resultado['sin_cupo']} sin cupo ({duracion:.1f}s)"
+        ))
@@ -0,0 +1,46 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from registroCajas.models import Campana
+from registroCajas.provision import provisionar_trabajadores, pendientes_de_activacion, escribir_enlaces_activacion
+
+
+class Command(BaseCommand):
+    help = 'Crea cuentas de trabajador para los beneficiarios de una campaña que no tienen perfil'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campana_id', type=int)
+        parser.add_argument('--enlaces', help='CSV de salida con los enlaces de activación (- = stdout)')
+        parser.add_argument('--url-base', default='', help='Ej: https://beneficios.tresmontes.cl')
+        parser.add_argument('--lote', type=int, default=None, help='Usuarios por INSERT masivo')
+        parser.add_argument(
+            '--reemitir', action='store_true',
+            help='Incluye en --enlaces enlaces nuevos para las cuentas que aún no se activan'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            campana = Campana.objects.get(id=options['campana_id'])
+        except Campana.DoesNotExist:
+            raise CommandError(f'No existe la campaña {options["campana_id"]}')
+
+        inicio = time.perf_counter()
+        creados, omitidos = provisionar_trabajadores(campana, tamano_lote=options['lote'])
+        duracion = time.perf_counter() - inicio
+
+        usuarios = creados
+        if options['reemitir']:
+            # Las cuentas recién creadas también están pendientes de activación
+            usuarios = list(pendientes_de_activacion(campana))
+            self.stderr.write(f'{len(usuarios) - len(creados)} enlaces reemitidos para cuentas sin activar')
+
+        if options['enlaces'] == '-':
+            escribir_enlaces_activacion(sys.stdout, usuarios, options['url_base'])
+        elif options['enlaces']:
+            with open(options['enlaces'], 'w', newline='', encoding='utf-8') as f:
+                escribir_enlaces_activacion(f, usuarios, options['url_base'])
+
+        self.stderr.write(
+            self.style.SUCCESS(f'{len(creados)} cuentas creadas, {omitidos} omitidas (ya existían) en {duracion:.1f}s')
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from registroCajas.models import Campana
+from registroCajas.purga import purgar_campana, purgar_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina una campaña y todos sus registros con DELETE por lotes. Con --pendientes retoma las '
+        'campañas que quedaron en "eliminando" (programar cada pocos minutos)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('campana_id', type=int, nargs='?')
+        parser.add_argument('--pendientes', action='store_true', help='Campañas en estado "eliminando"')
+        parser.add_argument('--lote', type=int, default=None, help='Beneficiarios por lote')
+
+    def handle(self, *args, **options):
+        if options['pendientes']:
+            purgadas = purgar_pendientes(tamano_lote=options['lote'])
+            for campana_id, conteos in purgadas.items():
+                self.stdout.write(f'Campaña {campana_id}: {conteos["Beneficiario"]} beneficiarios eliminados')
+            self.stdout.write(self.style.SUCCESS(f'{len(purgadas)} campañas pendientes eliminadas'))
+            return
+
+        if options['campana_id'] is None:
+            raise CommandError('Indique el id de la campaña o use --pendientes')
+        campana = Campana.objects.filter(id=options['campana_id']).first()
+        if not campana:
+            raise CommandError(f'No existe la campaña {options["campana_id"]}')
+
+        self.stdout.write(f'Eliminando campaña "{campana.nombre}"...')
+        conteos = purgar_campana(campana.id, tamano_lote=options['lote'])
+
+        for modelo, total in conteos.items():
+            self.stdout.write(f'  {modelo}: {total}')
+        self.stdout.write(self.style.SUCCESS('Campaña eliminada'))
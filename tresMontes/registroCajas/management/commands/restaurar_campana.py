@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from registroCajas.archivo import restaurar_campana
+from registroCajas.models import CampanaArchivada
+
+
+class Command(BaseCommand):
+    help = 'Restaura una campaña archivada a las tablas activas (queda inactiva)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campana_id', type=int, help='Id original de la campaña archivada')
+
+    def handle(self, *args, **options):
+        archivada = CampanaArchivada.objects.filter(campana_id_original=options['campana_id']).first()
+        if not archivada:
+            raise CommandError(f'No hay una campaña archivada con id {options["campana_id"]}')
+
+        try:
+            campana = restaurar_campana(archivada)
+        except Exception as e:
+            raise CommandError(f'Error al restaurar la campaña: {str(e)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Campaña "{campana.nombre}" restaurada con {campana.total_beneficiarios()} beneficiarios'
+        ))
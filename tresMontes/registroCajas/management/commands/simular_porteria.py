@@ -0,0 +1,98 @@
+"""
+Simula la cola de portería de una planta con distintas cantidades de guardias.
+
+Ejemplos:
+    python manage.py simular_porteria --planta CHQ --guardias 1-5
+    python manage.py simular_porteria --planta CHQ --extraer historial_chq.npz
+    python manage.py simular_porteria --instantanea historial_chq.npz --modo muestreo --dias 200 --volumen 900
+"""
+import statistics
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from registroCajas import simulacion
+from registroCajas.models import Planta
+
+
+def _rango_guardias(texto):
+    if '-' in texto:
+        desde, hasta = texto.split('-', 1)
+        return list(range(int(desde), int(hasta) + 1))
+    return [int(g) for g in texto.split(',')]
+
+
+class Command(BaseCommand):
+    help = 'Simula esperas y largo de cola en portería por cantidad de guardias, a partir del historial de retiros'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--planta', help='Código de la planta (para leer el historial de la base)')
+        parser.add_argument('--desde', type=date.fromisoformat, help='Por defecto, hace un año')
+        parser.add_argument('--hasta', type=date.fromisoformat, help='Por defecto, hoy')
+        parser.add_argument('--extraer', metavar='ARCHIVO', help='Solo guarda el historial en un .npz y termina')
+        parser.add_argument('--instantanea', metavar='ARCHIVO', help='Simula desde un .npz sin leer la base')
+        parser.add_argument('--guardias', type=_rango_guardias, default=[1, 2, 3, 4], help='"1-6" o "2,3,5"')
+        parser.add_argument('--modo', choices=['historico', 'muestreo', 'agenda'], default='historico')
+        parser.add_argument('--dias', type=int, help='Días a sortear en modo muestreo')
+        parser.add_argument('--volumen', type=int, help='Llegadas por día en modo muestreo (por defecto, las observadas)')
+        parser.add_argument('--replicas', type=int, default=1)
+        parser.add_argument('--servicio', type=float, help='Segundos fijos de atención (por defecto, los del historial)')
+        parser.add_argument('--objetivo', type=float, help='Espera p95 aceptable en minutos')
+        parser.add_argument('--semilla', type=int, default=None, help='Semilla aleatoria para reproducir una corrida')
+
+    def handle(self, *args, **options):
+        try:
+            if options['instantanea']:
+                historial = simulacion.cargar_historial(options['instantanea'])
+            else:
+                if not options['planta']:
+                    raise CommandError('Indique --planta o --instantanea')
+                planta = Planta.objects.filter(codigo=options['planta']).first()
+                if planta is None:
+                    raise CommandError(f"No existe la planta {options['planta']}")
+                desde, hasta = simulacion.periodo_por_defecto()
+                historial = simulacion.extraer_historial(planta, options['desde'] or desde, options['hasta'] or hasta)
+
+            if options['extraer']:
+                simulacion.guardar_historial(historial, options['extraer'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Historial guardado en {options['extraer']}: {len(historial['llegadas'])} retiros, "
+                    f"{len(historial['agendas'])} agendas, {len(historial['servicio'])} tiempos de atención"
+                ))
+                return
+
+            inicio = time.perf_counter()
+            resultados = simulacion.simular(
+                historial, options['guardias'], options['modo'], options['replicas'],
+                options['dias'], options['volumen'], options['servicio'], options['semilla'],
+            )
+            duracion = time.perf_counter() - inicio
+        except simulacion.DependenciaFaltante as e:
+            raise CommandError(str(e))
+
+        if not resultados:
+            raise CommandError('No hay llegadas para simular en el período o modo indicado')
+
+        servicio = historial['servicio']
+        if options['servicio']:
+            self.stdout.write(f"Atención fija de {options['servicio']:.0f}s")
+        elif len(servicio) >= 10:
+            self.stdout.write(f'Atención según {len(servicio)} muestras (mediana {statistics.median(servicio.tolist()):.0f}s)')
+        else:
+            self.stdout.write(f'Pocas muestras de atención; se usan {simulacion.SERVICIO_DEFECTO}s')
+
+        self.stdout.write(f"{resultados[0]['dias']} días, {resultados[0]['atendidos']} llegadas, simulado en {duracion:.1f}s")
+        self.stdout.write(f"{'Guardias':>8} {'Media':>7} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} "
+                          f"{'Cola p95':>9} {'Cola máx':>9} {'Uso':>6}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['guardias']:>8} {r['espera_media']:>7.1f} {r['espera_p50']:>7.1f} {r['espera_p90']:>7.1f} "
+                f"{r['espera_p95']:>7.1f} {r['espera_p99']:>7.1f} {r['cola_max_p95']:>9.0f} {r['cola_max']:>9} "
+                f"{r['utilizacion']:>6.0%}"
+            )
+
+        recomendados = simulacion.guardias_recomendados(resultados, options['objetivo'])
+        if recomendados is None:
+            self.stdout.write(self.style.WARNING('Ninguna cantidad simulada cumple el objetivo de espera'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Guardias recomendados: {recomendados} (esperas en minutos)'))
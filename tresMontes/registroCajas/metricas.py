@@ -0,0 +1,299 @@
+"""
+Registro de métricas en memoria con exposición en formato de texto Prometheus
+
+Las actualizaciones solo tocan diccionarios en memoria. Si METRICAS_DIR está
+configurado, cada proceso (worker de gunicorn) vuelca sus valores a
+<METRICAS_DIR>/<pid>.json: al actualizar, como máximo cada
+METRICAS_INTERVALO segundos; desde un hilo cada METRICAS_INTERVALO si quedó
+algo sin volcar (poco tráfico) y al terminar el proceso (atexit). /metrics
+suma los archivos de todos los procesos.
+
+Los archivos de procesos que ya no existen se suman a _acumulado.json y se
+eliminan, así los contadores no bajan cuando un worker se recicla y el
+directorio no crece sin límite.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no se limpian archivos de procesos muertos
+    fcntl = None
+
+
+METRICAS_INTERVALO = 5
+ACUMULADO = '_acumulado.json'
+
+# Buckets de latencia en segundos
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_IMPORTACION = (1, 5, 15, 30, 60, 120, 300, 600)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, registro, nombre, ayuda, etiquetas):
+        self.registro = registro
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.valores = {}
+
+    def _clave(self, etiquetas):
+        return tuple(str(etiquetas.get(e, '')) for e in self.etiquetas)
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def inc(self, cantidad=1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self.registro.lock:
+            self.valores[clave] = self.valores.get(clave, 0) + cantidad
+            self.registro.pendiente = True
+        self.registro.volcar_si_corresponde()
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, registro, nombre, ayuda, etiquetas, buckets=BUCKETS_LATENCIA):
+        super().__init__(registro, nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        # Conteo por bucket (no acumulado) + suma + cantidad
+        indice = bisect_left(self.buckets, valor)
+        with self.registro.lock:
+            datos = self.valores.get(clave)
+            if datos is None:
+                datos = self.valores[clave] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            datos[indice] += 1
+            datos[-2] += valor
+            datos[-1] += 1
+            self.registro.pendiente = True
+        self.registro.volcar_si_corresponde()
+
+
+class Registro:
+    """Conjunto de métricas del proceso"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metricas = {}
+        self.pendiente = False  # hay actualizaciones sin volcar
+        self._ultimo_volcado = 0.0
+        self._pid_temporizador = None
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador(self, nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        return self._registrar(Histograma(self, nombre, ayuda, etiquetas, buckets))
+
+    def _registrar(self, metrica):
+        self.metricas[metrica.nombre] = metrica
+        return metrica
+
+    # ---- Multi-proceso ----
+
+    def _directorio(self):
+        directorio = getattr(settings, 'METRICAS_DIR', None)
+        return Path(directorio) if directorio else None
+
+    def _instantanea(self):
+        with self.lock:
+            return {
+                nombre: [[list(clave), valor] for clave, valor in metrica.valores.items()]
+                for nombre, metrica in self.metricas.items()
+            }
+
+    def _intervalo(self):
+        return getattr(settings, 'METRICAS_INTERVALO', METRICAS_INTERVALO)
+
+    def volcar_si_corresponde(self):
+        if not self._directorio():
+            return
+        self._iniciar_temporizador()
+        if time.monotonic() - self._ultimo_volcado >= self._intervalo():
+            self.volcar()
+
+    def _iniciar_temporizador(self):
+        """Un hilo por proceso (se revisa el pid: los workers nacen con fork)"""
+        pid = os.getpid()
+        with self.lock:
+            if self._pid_temporizador == pid:
+                return
+            self._pid_temporizador = pid
+        threading.Thread(target=self._volcar_periodicamente, name='metricas-volcado', daemon=True).start()
+        atexit.register(self.volcar_pendiente)
+
+    def _volcar_periodicamente(self):
+        while True:
+            time.sleep(self._intervalo())
+            self.volcar_pendiente()
+
+    def volcar_pendiente(self):
+        if self.pendiente:
+            self.volcar()
+
+    def volcar(self):
+        directorio = self._directorio()
+        if not directorio:
+            return
+        self._ultimo_volcado = time.monotonic()
+        self.pendiente = False
+        directorio.mkdir(parents=True, exist_ok=True)
+        self._escribir(directorio / f'{os.getpid()}.json', self._instantanea())
+
+    def _escribir(self, destino, datos):
+        temporal = destino.parent / f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        temporal.write_text(json.dumps(datos))
+        os.replace(temporal, destino)
+
+    def _leer(self, archivo):
+        try:
+            return json.loads(archivo.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _limpiar_muertos(self, directorio):
+        """Suma los archivos de procesos que ya no existen a ACUMULADO y los elimina"""
+        with _candado(directorio, exclusivo=True) as obtenido:
+            if not obtenido:
+                return  # otro proceso está limpiando (o no hay fcntl)
+            muertos = [a for a in directorio.glob('*.json') if a.stem.isdigit() and not _vivo(int(a.stem))]
+            if not muertos:
+                return
+            acumulado = _sumar([self._leer(directorio / ACUMULADO) or {}] + [self._leer(a) or {} for a in muertos])
+            self._escribir(directorio / ACUMULADO, {n: [[list(c), v] for c, v in m] for n, m in acumulado.items()})
+            for archivo in muertos:
+                archivo.unlink(missing_ok=True)
+
+    def _combinar(self):
+        """Suma los valores de todos los procesos (o solo los propios)"""
+        directorio = self._directorio()
+        if not directorio:
+            return self._instantanea()
+
+        self.volcar()
+        self._limpiar_muertos(directorio)
+        # Compartido: no leer a mitad de una limpieza (se contaría dos veces)
+        with _candado(directorio, exclusivo=False):
+            return _sumar(filter(None, (self._leer(archivo) for archivo in directorio.glob('*.json'))))
+
+    # ---- Exposición ----
+
+    def exponer(self):
+        """Texto en formato de exposición Prometheus (text/plain; version=0.0.4)"""
+        datos = self._combinar()
+        lineas = []
+        for nombre, metrica in self.metricas.items():
+            lineas.append(f'# HELP {nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {nombre} {metrica.tipo}')
+            for clave, valor in sorted(datos.get(nombre, []), key=lambda m: tuple(m[0])):
+                etiquetas = list(zip(metrica.etiquetas, clave))
+                if metrica.tipo == 'counter':
+                    lineas.append(f'{nombre}{_etiquetas(etiquetas)} {valor}')
+                    continue
+                acumulado = 0
+                for limite, cantidad in zip(list(metrica.buckets) + ['+Inf'], valor[:-2]):
+                    acumulado += cantidad
+                    lineas.append(f'{nombre}_bucket{_etiquetas(etiquetas + [("le", limite)])} {acumulado}')
+                lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {valor[-2]}')
+                lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {valor[-1]}')
+        return '\n'.join(lineas) + '\n'
+
+
+@contextmanager
+def _candado(directorio, exclusivo):
+    """flock sobre METRICAS_DIR; el exclusivo no espera. Sin fcntl no bloquea ni limpia."""
+    if fcntl is None:
+        yield not exclusivo
+        return
+    with open(directorio / '.limpieza.lock', 'w') as archivo:
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusivo else fcntl.LOCK_SH)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # existe, pero es de otro usuario
+    return True
+
+
+def _sumar(volcados):
+    """Suma volcados {nombre: [[clave, valor], ...]} -> {nombre: [(clave, valor), ...]}"""
+    combinado = {}
+    for datos in volcados:
+        for nombre, muestras in datos.items():
+            destino = combinado.setdefault(nombre, {})
+            for clave, valor in muestras:
+                clave = tuple(clave)
+                if isinstance(valor, list):
+                    actual = destino.get(clave)
+                    destino[clave] = [a + b for a, b in zip(actual, valor)] if actual else list(valor)
+                else:
+                    destino[clave] = destino.get(clave, 0) + valor
+    return {nombre: list(muestras.items()) for nombre, muestras in combinado.items()}
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in pares) + '}'
+
+
+REGISTRO = Registro()
+
+retiros = REGISTRO.contador(
+    'registro_retiros_total', 'Retiros registrados en portería', ['planta', 'guardia', 'modo']
+)
+escaneos_fallidos = REGISTRO.contador(
+    'registro_escaneos_fallidos_total', 'Búsquedas o escaneos rechazados en portería', ['planta', 'motivo']
+)
+importaciones = REGISTRO.histograma(
+    'registro_importacion_segundos', 'Duración de importaciones de nómina', ['resultado'], BUCKETS_IMPORTACION
+)
+importacion_filas = REGISTRO.contador(
+    'registro_importacion_beneficiarios_total', 'Beneficiarios creados por importaciones de nómina'
+)
+exportaciones = REGISTRO.histograma(
+    'registro_exportacion_segundos', 'Duración de exportaciones a Excel', ['tipo']
+)
+peticiones = REGISTRO.histograma(
+    'registro_peticion_segundos', 'Latencia de peticiones HTTP por vista', ['vista', 'metodo']
+)
+
+
+class MetricasMiddleware:
+    """Observa la latencia de cada petición por nombre de vista"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        vista = request.resolver_match.view_name if request.resolver_match else 'sin_vista'
+        peticiones.observar(time.perf_counter() - inicio, vista=vista, metodo=request.method)
+        return response
@@ -0,0 +1,284 @@
+"""
+Middlewares de instrumentación: consultas SQL por vista y perfilador opcional
+"""
+import cProfile
+import io
+import pstats
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from datetime import datetime
+from importlib import import_module
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import OperationalError, connections
+
+
+# Peticiones recientes que se conservan por vista en el resumen en memoria
+CONSULTAS_VENTANA = 200
+
+# Encabezado de las respuestas cuya vista falló esperando un bloqueo de la base
+# de datos (SQLite "database is locked", PostgreSQL lock_timeout o deadlock)
+ENCABEZADO_BLOQUEO = 'X-Bloqueo-BD'
+
+_resumen = defaultdict(lambda: deque(maxlen=getattr(settings, 'CONSULTAS_VENTANA', CONSULTAS_VENTANA)))
+_lock = threading.Lock()
+# Un solo cProfile activo por proceso (ver PerfiladorMiddleware)
+_perfilando = threading.Lock()
+
+
+class RegistroConsultas:
+    """Registra cantidad, tiempo y firmas de las consultas de una petición"""
+
+    def __init__(self):
+        self.total = 0
+        self.tiempo = 0.0
+        self.firmas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo += time.perf_counter() - inicio
+            self.total += 1
+            # El SQL llega con marcadores (%s): la misma firma con distintos
+            # parámetros repetida en una petición es un patrón N+1
+            self.firmas[sql] += 1
+
+    @property
+    def duplicadas(self):
+        return {sql: veces for sql, veces in self.firmas.items() if veces > 1}
+
+    def encabezado(self):
+        return f'n={self.total}; tiempo={self.tiempo * 1000:.1f}ms; duplicadas={len(self.duplicadas)}'
+
+
+def resumen_consultas():
+    """
+    Resumen de las peticiones recientes por nombre de vista.
+
+    Returns:
+        list: Un diccionario por vista, ordenado por consultas promedio
+    """
+    with _lock:
+        copia = {vista: list(registros) for vista, registros in _resumen.items()}
+
+    resumen = []
+    for vista, registros in copia.items():
+        firmas = Counter()
+        for _, _, duplicadas in registros:
+            firmas.update(duplicadas)
+        resumen.append({
+            'vista': vista,
+            'peticiones': len(registros),
+            'consultas_promedio': round(sum(r[0] for r in registros) / len(registros), 1),
+            'consultas_max': max(r[0] for r in registros),
+            'tiempo_sql_promedio_ms': round(sum(r[1] for r in registros) / len(registros) * 1000, 2),
+            'duplicadas': [{'sql': sql, 'veces': veces} for sql, veces in firmas.most_common(5)],
+        })
+    resumen.sort(key=lambda r: r['consultas_promedio'], reverse=True)
+    return resumen
+
+
+def limpiar_resumen():
+    with _lock:
+        _resumen.clear()
+
+
+class ConsultasMiddleware:
+    """
+    Cuenta las consultas SQL de cada petición y las acumula por nombre de vista.
+
+    El registro queda en request.consultas. Con DEBUG activo se agrega el
+    encabezado X-Consultas a la respuesta. Si la vista falla por un bloqueo
+    de la base de datos se agrega X-Bloqueo-BD: 1 (con o sin DEBUG), así
+    carga_porteria distingue bloqueos de otros errores 500.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registro = RegistroConsultas()
+        with ExitStack() as stack:
+            for conexion in connections.all():
+                stack.enter_context(conexion.execute_wrapper(registro))
+            response = self.get_response(request)
+
+        request.consultas = registro
+
+        vista = request.resolver_match.view_name if request.resolver_match else None
+        if vista:
+            with _lock:
+                _resumen[vista].append((registro.total, registro.tiempo, registro.duplicadas))
+
+        if settings.DEBUG:
+            response['X-Consultas'] = registro.encabezado()
+        if getattr(request, 'bloqueo_bd', False):
+            response[ENCABEZADO_BLOQUEO] = '1'
+
+        return response
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, OperationalError) and 'lock' in str(exception).lower():
+            request.bloqueo_bd = True
+        return None  # la respuesta 500 la arma Django
+
+
+# Perfilador: directorio local acotado con los perfiles capturados
+PERFILADOR_MAX_ARCHIVOS = 50
+PERFILADOR_ENCABEZADO = 'HTTP_X_PERFILAR'
+PERFILADOR_PARAMETRO = 'perfilar'
+
+# <duración ms>_<vista>_<timestamp>.prof
+_NOMBRE_PERFIL = re.compile(r'^(?P<ms>\d{8})_(?P<vista>[\w.:-]+)_(?P<ts>\d+)\.prof$')
+
+
+def _directorio_perfiles():
+    return Path(settings.PERFILADOR_DIR)
+
+
+def _es_staff(user):
+    if user is None or not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    perfil = getattr(user, 'perfil', None)
+    return perfil is not None and perfil.rol == 'admin'
+
+
+def perfiles_capturados():
+    """
+    Perfiles guardados, del más lento al más rápido.
+
+    Returns:
+        list: Diccionarios con nombre, vista, duracion_ms y fecha
+    """
+    directorio = _directorio_perfiles()
+    if not directorio.exists():
+        return []
+
+    perfiles = []
+    for archivo in directorio.glob('*.prof'):
+        match = _NOMBRE_PERFIL.match(archivo.name)
+        if match:
+            perfiles.append({
+                'nombre': archivo.name,
+                'vista': match.group('vista'),
+                'duracion_ms': int(match.group('ms')),
+                'fecha': datetime.fromtimestamp(int(match.group('ts')) / 1000),
+            })
+    perfiles.sort(key=lambda p: p['duracion_ms'], reverse=True)
+    return perfiles
+
+
+def ruta_perfil(nombre):
+    """Ruta de un perfil capturado, o None si el nombre no es válido"""
+    if not _NOMBRE_PERFIL.match(nombre):
+        return None
+    ruta = _directorio_perfiles() / nombre
+    return ruta if ruta.exists() else None
+
+
+def resumen_perfil(nombre, limite=40):
+    """Árbol de llamadas (texto pstats) ordenado por tiempo acumulado"""
+    ruta = ruta_perfil(nombre)
+    if not ruta:
+        return None
+    salida = io.StringIO()
+    estadisticas = pstats.Stats(str(ruta), stream=salida)
+    estadisticas.sort_stats('cumulative').print_stats(limite)
+    estadisticas.print_callees(limite // 2)
+    return salida.getvalue()
+
+
+def _usuario_de_sesion(request):
+    """
+    Usuario de la cookie de sesión, leído antes de SessionMiddleware (el
+    perfilador va primero). Solo se usa en peticiones que piden perfilarse.
+    """
+    clave = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not clave:
+        return None
+    sesion = import_module(settings.SESSION_ENGINE).SessionStore(clave)
+    return get_user(SimpleNamespace(session=sesion))
+
+
+class PerfiladorMiddleware:
+    """
+    Perfila la petición completa (ORM, templates y sesión) con cProfile.
+
+    Se activa al azar según PERFILADOR_MUESTREO (0 a 1), para cualquier rol
+    (así se captura la portería lenta que reporta un guardia), o con el
+    encabezado X-Perfilar: 1 o el parámetro ?perfilar=1, que solo se
+    respetan si la sesión es de staff o un administrador: nadie más puede
+    forzar el costo de cProfile. Los archivos .prof se abren con
+    snakeviz o flameprof (flamegraph); el directorio se limita a
+    PERFILADOR_MAX_ARCHIVOS, eliminando los más antiguos.
+
+    Solo se perfila una petición a la vez por proceso: desde Python 3.12
+    cProfile usa sys.monitoring y un segundo perfilador activo falla con
+    ValueError. Si ya hay uno (u otra herramienta ocupa el perfilado) la
+    petición se atiende sin perfilar.
+
+    Debe ir primero en MIDDLEWARE para incluir la carga de la sesión.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _solicitado(self, request):
+        muestreo = getattr(settings, 'PERFILADOR_MUESTREO', 0)
+        if muestreo > 0 and random.random() < muestreo:
+            return True
+        if request.META.get(PERFILADOR_ENCABEZADO) == '1' or request.GET.get(PERFILADOR_PARAMETRO) == '1':
+            return _es_staff(_usuario_de_sesion(request))
+        return False
+
+    def __call__(self, request):
+        if not self._solicitado(request):
+            return self.get_response(request)
+
+        if not _perfilando.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            perfilador = cProfile.Profile()
+            try:
+                perfilador.enable()
+            except ValueError:
+                return self.get_response(request)  # otro perfilador activo (p. ej. un depurador)
+            inicio = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                perfilador.disable()
+        finally:
+            _perfilando.release()
+        duracion_ms = int((time.perf_counter() - inicio) * 1000)
+
+        vista = request.resolver_match.view_name if request.resolver_match else 'sin_vista'
+        self._guardar(perfilador, vista, duracion_ms)
+        if settings.DEBUG:
+            response['X-Perfil'] = f'{duracion_ms}ms'
+
+        return response
+
+    def _guardar(self, perfilador, vista, duracion_ms):
+        directorio = _directorio_perfiles()
+        directorio.mkdir(parents=True, exist_ok=True)
+        vista = re.sub(r'[^\w.:-]', '_', vista)
+        nombre = f'{min(duracion_ms, 99999999):08d}_{vista}_{int(time.time() * 1000)}.prof'
+        perfilador.dump_stats(str(directorio / nombre))
+
+        # Mantener el directorio acotado
+        maximo = getattr(settings, 'PERFILADOR_MAX_ARCHIVOS', PERFILADOR_MAX_ARCHIVOS)
+        archivos = sorted(directorio.glob('*.prof'), key=lambda a: a.stat().st_mtime)
+        for archivo in archivos[:-maximo]:
+            archivo.unlink(missing_ok=True)
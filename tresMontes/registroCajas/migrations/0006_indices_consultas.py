@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0005_campana_estado_carga'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendaretiro',
+            index=models.Index(fields=['fecha_agendada'], name='agenda_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autorizaciontercero',
+            index=models.Index(condition=models.Q(('activa', True)), fields=['rut_tercero', 'fecha_autorizada'], name='autoriz_rut_fecha_activa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='beneficiario',
+            index=models.Index(fields=['rut', 'planta'], name='benef_rut_planta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='beneficiario',
+            index=models.Index(fields=['planta', 'campana', 'nombre'], name='benef_planta_campana_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campana',
+            index=models.Index(condition=models.Q(('activa', True)), fields=['-fecha_creacion'], name='campana_activa_reciente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campana',
+            index=models.Index(fields=['planta', 'activa'], name='campana_planta_activa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='retiro',
+            index=models.Index(fields=['fecha_hora'], name='retiro_fecha_hora_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0006_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='campana',
+            name='estado_carga',
+            field=models.CharField(choices=[('completa', 'Completa'), ('parcial', 'Carga parcial'), ('eliminando', 'Eliminando')], default='completa', max_length=20),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0007_campana_estado_eliminando'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampanaArchivada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campana_id_original', models.BigIntegerField(unique=True)),
+                ('nombre', models.CharField(max_length=200)),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('total_beneficiarios', models.PositiveIntegerField(default=0)),
+                ('total_entregados', models.PositiveIntegerField(default=0)),
+                ('archivo', models.FileField(upload_to='archivo/')),
+                ('fecha_archivo', models.DateTimeField(auto_now_add=True)),
+                ('archivado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('planta', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='registroCajas.planta')),
+            ],
+            options={
+                'verbose_name': 'Campaña Archivada',
+                'verbose_name_plural': 'Campañas Archivadas',
+                'ordering': ['-fecha_fin'],
+            },
+        ),
+    ]
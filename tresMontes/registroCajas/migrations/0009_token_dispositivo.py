@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0008_campana_archivada'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenDispositivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(help_text='Identificación de la portería, p. ej. "Portería Norte"', max_length=100)),
+                ('clave_hash', models.CharField(max_length=64, unique=True)),
+                ('prefijo', models.CharField(max_length=8)),
+                ('activo', models.BooleanField(default=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_revocacion', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_uso', models.DateTimeField(blank=True, null=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('planta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dispositivos', to='registroCajas.planta')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dispositivos', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Token de Dispositivo',
+                'verbose_name_plural': 'Tokens de Dispositivo',
+                'ordering': ['planta', 'nombre'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0009_token_dispositivo'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='agendaretiro',
+            options={'ordering': ['fecha_agendada', 'hora_inicio'], 'verbose_name': 'Agenda de Retiro', 'verbose_name_plural': 'Agendas de Retiro'},
+        ),
+        migrations.RemoveIndex(
+            model_name='agendaretiro',
+            name='agenda_fecha_idx',
+        ),
+        migrations.AddField(
+            model_name='agendaretiro',
+            name='hora_inicio',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='agendaretiro',
+            index=models.Index(fields=['fecha_agendada', 'hora_inicio'], name='agenda_fecha_hora_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0010_agenda_hora_inicio'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RendimientoGuardiaDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('retiros', models.PositiveIntegerField(default=0)),
+                ('retiros_tercero', models.PositiveIntegerField(default=0)),
+                ('primera', models.DateTimeField()),
+                ('ultima', models.DateTimeField()),
+                ('intervalos', models.PositiveIntegerField(default=0)),
+                ('suma_intervalos', models.FloatField(default=0)),
+                ('pausas', models.PositiveIntegerField(default=0)),
+                ('tiempo_inactivo', models.FloatField(default=0)),
+                ('horas_activas', models.PositiveSmallIntegerField(default=0)),
+                ('maximo_por_hora', models.PositiveIntegerField(default=0)),
+                ('guardia', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rendimientos', to=settings.AUTH_USER_MODEL)),
+                ('planta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rendimientos', to='registroCajas.planta')),
+            ],
+            options={
+                'verbose_name': 'Rendimiento Diario de Guardia',
+                'verbose_name_plural': 'Rendimiento Diario de Guardias',
+                'ordering': ['-fecha', 'planta'],
+                'indexes': [models.Index(fields=['planta', 'fecha'], name='rendimiento_planta_fecha_idx')],
+            },
+        ),
+    ]
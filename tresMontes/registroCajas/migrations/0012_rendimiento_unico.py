@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def eliminar_repetidos(apps, schema_editor):
+    """Deja un resumen por (fecha, planta, guardia); los repetidos son copias del mismo cálculo"""
+    RendimientoGuardiaDia = apps.get_model('registroCajas', 'RendimientoGuardiaDia')
+    repetidos = (
+        RendimientoGuardiaDia.objects
+        .filter(guardia__isnull=False)
+        .values('fecha', 'planta', 'guardia')
+        .annotate(total=Count('id'), conservar=Min('id'))
+        .filter(total__gt=1)
+    )
+    for fila in repetidos:
+        RendimientoGuardiaDia.objects.filter(
+            fecha=fila['fecha'], planta=fila['planta'], guardia=fila['guardia']
+        ).exclude(id=fila['conservar']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0011_rendimiento_guardia_dia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_repetidos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rendimientoguardiadia',
+            constraint=models.UniqueConstraint(fields=('fecha', 'planta', 'guardia'), name='rendimiento_guardia_dia_unico'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def marcar_origenes(apps, schema_editor):
+    """
+    Los retiros masivos existentes se reconocen por la primera línea de sus
+    observaciones (entregas_masivas.ORIGEN_PAPEL y terceros.ORIGEN_TERCERO).
+    Los resúmenes anteriores ya contaban solo escaneos.
+    """
+    Retiro = apps.get_model('registroCajas', 'Retiro')
+    RendimientoGuardiaDia = apps.get_model('registroCajas', 'RendimientoGuardiaDia')
+    Retiro.objects.filter(observaciones__startswith='Entrega registrada desde planilla en papel').update(origen='papel')
+    Retiro.objects.filter(observaciones__startswith='Entrega a tercero autorizado').update(origen='tercero')
+    RendimientoGuardiaDia.objects.update(escaneos=F('retiros'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registroCajas', '0012_rendimiento_unico'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendimientoguardiadia',
+            name='escaneos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='retiro',
+            name='origen',
+            field=models.CharField(choices=[('porteria', 'Portería (escaneo o confirmación)'), ('papel', 'Planilla en papel'), ('tercero', 'Retiro masivo a tercero')], default='porteria', max_length=10),
+        ),
+        migrations.RunPython(marcar_origenes, migrations.RunPython.noop),
+    ]
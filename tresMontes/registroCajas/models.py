@@ -65,6 +65,12 @@ class Perfil(models.Model):
 
 class Campana(models.Model):
     """Campaña de entrega de cajas"""
+    ESTADO_CARGA_CHOICES = [
+        ('completa', 'Completa'),
+        ('parcial', 'Carga parcial'),
+        ('eliminando', 'Eliminando'),
+    ]
+
     nombre = models.CharField(max_length=200)
     fecha_inicio = models.DateField()
     fecha_fin = models.DateField()
@@ -73,11 +79,17 @@ class Campana(models.Model):
     archivo_nomina = models.FileField(upload_to='nominas/', null=True, blank=True)
     creado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    estado_carga = models.CharField(max_length=20, choices=ESTADO_CARGA_CHOICES, default='completa')
 
     class Meta:
         verbose_name = 'Campaña'
         verbose_name_plural = 'Campañas'
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Campaña activa más reciente (casi todas las páginas)
+            models.Index(fields=['-fecha_creacion'], condition=models.Q(activa=True), name='campana_activa_reciente_idx'),
+            models.Index(fields=['planta', 'activa'], name='campana_planta_activa_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nombre} - {self.planta.nombre}"
@@ -150,6 +162,11 @@ class Beneficiario(models.Model):
         verbose_name_plural = 'Beneficiarios'
         unique_together = ['campana', 'rut']
         ordering = ['nombre']
+        indexes = [
+            # Búsqueda de portería por RUT dentro de la planta del guardia
+            models.Index(fields=['rut', 'planta'], name='benef_rut_planta_idx'),
+            models.Index(fields=['planta', 'campana', 'nombre'], name='benef_planta_campana_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nombre} - {self.rut}"
@@ -159,9 +176,8 @@ class Beneficiario(models.Model):
 
     def puede_retirar_hoy(self):
         """Verifica si puede retirar hoy (no está bloqueado el día)"""
-        from django.utils import timezone
-        hoy = timezone.now().date()
-        return not self.campana.dias_bloqueados.filter(fecha=hoy).exists()
+        from .calendario import esta_bloqueado
+        return not esta_bloqueado(self.campana_id)
 
     def generar_codigo_caja(self):
         """Genera un código único para la caja basado en campaña, tipo de contrato, planta y correlativo"""
@@ -213,6 +229,12 @@ class Beneficiario(models.Model):
 
 class Retiro(models.Model):
     """Registro de retiro de caja"""
+    ORIGENES_CHOICES = [
+        ('porteria', 'Portería (escaneo o confirmación)'),
+        ('papel', 'Planilla en papel'),
+        ('tercero', 'Retiro masivo a tercero'),
+    ]
+
     beneficiario = models.OneToOneField(Beneficiario, on_delete=models.CASCADE, related_name='retiro')
     fecha_hora = models.DateTimeField(auto_now_add=True)
     confirmado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
@@ -221,11 +243,16 @@ class Retiro(models.Model):
     nombre_tercero = models.CharField(max_length=200, blank=True)
     rut_tercero = models.CharField(max_length=12, blank=True)
     codigo_caja = models.CharField(max_length=15, unique=True, blank=True)
+    # Solo los de portería miden el ritmo de los guardias (rendimiento.py, simulacion.py)
+    origen = models.CharField(max_length=10, choices=ORIGENES_CHOICES, default='porteria')
 
     class Meta:
         verbose_name = 'Retiro'
         verbose_name_plural = 'Retiros'
         ordering = ['-fecha_hora']
+        indexes = [
+            models.Index(fields=['fecha_hora'], name='retiro_fecha_hora_idx'),
+        ]
 
     def __str__(self):
         return f"{self.beneficiario.nombre} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
@@ -251,6 +278,14 @@ class AutorizacionTercero(models.Model):
         verbose_name = 'Autorización Tercero'
         verbose_name_plural = 'Autorizaciones Terceros'
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Solo las autorizaciones activas se consultan en portería
+            models.Index(
+                fields=['rut_tercero', 'fecha_autorizada'],
+                condition=models.Q(activa=True),
+                name='autoriz_rut_fecha_activa_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.beneficiario.nombre} autoriza a {self.nombre_tercero}"
@@ -268,6 +303,8 @@ class AgendaRetiro(models.Model):
     """Agenda de retiros futuros de trabajadores"""
     beneficiario = models.ForeignKey(Beneficiario, on_delete=models.CASCADE, related_name='agendas')
     fecha_agendada = models.DateField()
+    # Inicio del bloque de una hora asignado por el planificador (agenda.py)
+    hora_inicio = models.TimeField(null=True, blank=True)
     confirmado_hoy = models.BooleanField(default=False)
     fecha_confirmacion = models.DateTimeField(null=True, blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
@@ -275,7 +312,92 @@ class AgendaRetiro(models.Model):
     class Meta:
         verbose_name = 'Agenda de Retiro'
         verbose_name_plural = 'Agendas de Retiro'
-        ordering = ['fecha_agendada']
+        ordering = ['fecha_agendada', 'hora_inicio']
+        indexes = [
+            # Llegadas esperadas por bloque horario (también sirve para filtrar solo por fecha)
+            models.Index(fields=['fecha_agendada', 'hora_inicio'], name='agenda_fecha_hora_idx'),
+        ]
 
     def __str__(self):
         return f"{self.beneficiario.nombre} - {self.fecha_agendada}"
+
+
+class CampanaArchivada(models.Model):
+    """Campaña cerrada movida a un archivo comprimido fuera de las tablas activas"""
+    campana_id_original = models.BigIntegerField(unique=True)
+    nombre = models.CharField(max_length=200)
+    planta = models.ForeignKey(Planta, on_delete=models.SET_NULL, null=True)
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    total_beneficiarios = models.PositiveIntegerField(default=0)
+    total_entregados = models.PositiveIntegerField(default=0)
+    archivo = models.FileField(upload_to='archivo/')
+    archivado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha_archivo = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Campaña Archivada'
+        verbose_name_plural = 'Campañas Archivadas'
+        ordering = ['-fecha_fin']
+
+    def __str__(self):
+        return f"{self.nombre} (archivada)"
+
+
+class TokenDispositivo(models.Model):
+    """Token de larga duración para una tablet de portería (kiosco de escaneo)"""
+    nombre = models.CharField(max_length=100, help_text='Identificación de la portería, p. ej. "Portería Norte"')
+    planta = models.ForeignKey(Planta, on_delete=models.CASCADE, related_name='dispositivos')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dispositivos')
+    clave_hash = models.CharField(max_length=64, unique=True)
+    prefijo = models.CharField(max_length=8)
+    activo = models.BooleanField(default=True)
+    creado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_revocacion = models.DateTimeField(null=True, blank=True)
+    ultimo_uso = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Token de Dispositivo'
+        verbose_name_plural = 'Tokens de Dispositivo'
+        ordering = ['planta', 'nombre']
+
+    def __str__(self):
+        return f"{self.nombre} ({self.planta.nombre})"
+
+
+class RendimientoGuardiaDia(models.Model):
+    """Resumen diario de entregas por guardia y planta (lo calcula rendimiento.py)"""
+    fecha = models.DateField()
+    planta = models.ForeignKey(Planta, on_delete=models.CASCADE, related_name='rendimientos')
+    guardia = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='rendimientos')
+    retiros = models.PositiveIntegerField(default=0)
+    retiros_tercero = models.PositiveIntegerField(default=0)
+    # Retiros de portería; planillas en papel y retiros masivos a terceros no
+    # entran en intervalos, horas activas ni retiros por hora
+    escaneos = models.PositiveIntegerField(default=0)
+    primera = models.DateTimeField()
+    ultima = models.DateTimeField()
+    # Intervalos entre escaneos consecutivos del guardia (segundos); los mayores
+    # a RENDIMIENTO_PAUSA_MINUTOS cuentan como pausas y no entran en el promedio
+    intervalos = models.PositiveIntegerField(default=0)
+    suma_intervalos = models.FloatField(default=0)
+    pausas = models.PositiveIntegerField(default=0)
+    tiempo_inactivo = models.FloatField(default=0)
+    horas_activas = models.PositiveSmallIntegerField(default=0)
+    maximo_por_hora = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Rendimiento Diario de Guardia'
+        verbose_name_plural = 'Rendimiento Diario de Guardias'
+        ordering = ['-fecha', 'planta']
+        indexes = [
+            models.Index(fields=['planta', 'fecha'], name='rendimiento_planta_fecha_idx'),
+        ]
+        constraints = [
+            # Sin guardia (NULL) no cuenta como repetido: esas filas las protege el bloqueo de planta
+            models.UniqueConstraint(fields=['fecha', 'planta', 'guardia'], name='rendimiento_guardia_dia_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.guardia or 'Sin guardia'} - {self.planta.nombre} - {self.fecha}"
@@ -0,0 +1,140 @@
+"""
+Creación masiva de cuentas de trabajador a partir de la nómina de una campaña
+
+Los usuarios se crean con contraseña inutilizable (sin PBKDF2) y un enlace de
+activación firmado; el trabajador define su contraseña en el primer ingreso.
+"""
+import csv
+
+from django.conf import settings
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db import transaction
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+
+from .models import Perfil
+
+
+PROVISION_TAMANO_LOTE = 2000
+SAL_ACTIVACION = 'registroCajas.provision.activacion'
+ACTIVACION_VIGENCIA = 60 * 60 * 24 * 30  # 30 días
+
+
+def username_desde_rut(rut):
+    """'12.345.678-5' -> '12345678-5' (el trabajador ingresa con su RUT)"""
+    return rut.replace('.', '').upper()
+
+
+def _huella_password(user):
+    # Cambia al activar la cuenta, así el enlace no se puede reutilizar
+    return salted_hmac(SAL_ACTIVACION, user.password).hexdigest()[:12]
+
+
+def token_activacion(user):
+    return signing.dumps([user.pk, _huella_password(user)], salt=SAL_ACTIVACION)
+
+
+def usuario_desde_token(token):
+    """Devuelve el User pendiente de activación o None si el token no sirve"""
+    vigencia = getattr(settings, 'ACTIVACION_VIGENCIA', ACTIVACION_VIGENCIA)
+    try:
+        user_id, huella = signing.loads(token, salt=SAL_ACTIVACION, max_age=vigencia)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+
+    user = User.objects.select_related('perfil').filter(pk=user_id, is_active=True).first()
+    if user is None or user.has_usable_password() or huella != _huella_password(user):
+        return None
+    return user
+
+
+def provisionar_trabajadores(campana, tamano_lote=None):
+    """
+    Crea User + Perfil(trabajador) para cada beneficiario de la campaña sin
+    perfil. Por cada lote se consultan solo sus RUT y usernames existentes y
+    se insertan con bulk_create.
+
+    Returns:
+        tuple: (usuarios creados, cantidad omitida por RUT o usuario existente)
+    """
+    tamano_lote = tamano_lote or getattr(settings, 'PROVISION_TAMANO_LOTE', PROVISION_TAMANO_LOTE)
+
+    nomina = {}
+    for rut, nombre, planta_id in (
+        campana.beneficiarios.order_by('nombre').values_list('rut', 'nombre', 'planta_id').iterator()
+    ):
+        nomina.setdefault(rut, (nombre, planta_id))
+
+    filas = list(nomina.items())
+    usernames_usados = set()  # '...-k' y '...-K' son el mismo usuario
+    creados = []
+    for i in range(0, len(filas), tamano_lote):
+        candidatos = filas[i:i + tamano_lote]
+        ruts_existentes = set(
+            Perfil.objects.filter(rut__in=[rut for rut, _ in candidatos]).values_list('rut', flat=True)
+        )
+        usernames_existentes = set(
+            User.objects.filter(username__in=[username_desde_rut(rut) for rut, _ in candidatos])
+            .values_list('username', flat=True)
+        )
+
+        lote = []
+        for rut, (nombre, planta_id) in candidatos:
+            username = username_desde_rut(rut)
+            if rut in ruts_existentes or username in usernames_existentes or username in usernames_usados:
+                continue
+            usernames_usados.add(username)
+            lote.append((rut, nombre, planta_id))
+        if not lote:
+            continue
+
+        with transaction.atomic():
+            usuarios = []
+            for rut, nombre, _ in lote:
+                partes = nombre.split()
+                usuarios.append(User(
+                    username=username_desde_rut(rut),
+                    first_name=(partes[0] if partes else nombre)[:150],
+                    last_name=' '.join(partes[1:])[:150],
+                    # Sin hash: make_password(None) genera una contraseña inutilizable
+                    password=make_password(None),
+                ))
+            User.objects.bulk_create(usuarios)
+
+            # Algunos motores no devuelven los ids del INSERT masivo
+            if any(u.pk is None for u in usuarios):
+                ids = dict(User.objects.filter(username__in=[u.username for u in usuarios]).values_list('username', 'id'))
+                for u in usuarios:
+                    u.pk = u.id = ids[u.username]
+
+            Perfil.objects.bulk_create([
+                Perfil(user_id=u.pk, rol='trabajador', planta_id=planta_id, rut=rut, nombre_completo=nombre)
+                for u, (rut, nombre, planta_id) in zip(usuarios, lote)
+            ])
+        creados.extend(usuarios)
+
+    return creados, len(nomina) - len(creados)
+
+
+def pendientes_de_activacion(campana):
+    """Trabajadores de la nómina de la campaña que aún no definen su contraseña"""
+    return (
+        User.objects.filter(
+            is_active=True,
+            password__startswith=UNUSABLE_PASSWORD_PREFIX,
+            perfil__rol='trabajador',
+            perfil__rut__in=campana.beneficiarios.values('rut'),
+        )
+        .order_by('username')
+    )
+
+
+def escribir_enlaces_activacion(salida, usuarios, url_base=''):
+    """CSV (usuario;nombre;enlace) para entregar los enlaces de activación"""
+    writer = csv.writer(salida, delimiter=';')
+    writer.writerow(['Usuario', 'Nombre', 'Enlace de activación'])
+    for user in usuarios:
+        enlace = url_base.rstrip('/') + reverse('activar_cuenta', args=[token_activacion(user)])
+        writer.writerow([user.username, f'{user.first_name} {user.last_name}'.strip(), enlace])
@@ -0,0 +1,98 @@
+"""
+Proyecciones de solo lectura para listados grandes
+
+Los listados no necesitan instancias de Beneficiario: cada instancia trae su
+__dict__, el estado del modelo y, con select_related, otra instancia por
+relación. Aquí cada fila es una tupla con nombre (sin __dict__) armada desde
+values_list() con solo las columnas que se muestran, incluidas las de las
+relaciones (planta__nombre, retiro__codigo_caja) en el mismo JOIN.
+
+Las filas exponen los mismos nombres que usan las plantillas
+(nombre, rut, tiene_retiro, get_tipo_contrato_display, ...), así que una
+plantilla pasa de instancias a filas sin cambiar sus expresiones.
+
+Medición: manage.py benchmark_proyecciones
+"""
+from collections import namedtuple
+
+from .models import Beneficiario
+
+
+TIPOS_CONTRATO = dict(Beneficiario.TIPO_CONTRATO_CHOICES)
+TIPOS_CAJA = dict(Beneficiario.TIPO_CAJA_CHOICES)
+
+
+class _Fila:
+    """
+    Métodos comunes. Las subclases definen `columnas` (en el orden de sus
+    campos) y `repetidas`: posiciones con valores que se repiten entre filas
+    o columnas (planta, tipo de contrato, código de caja y de retiro), que se
+    guardan una sola vez en vez de una copia por fila.
+    """
+    __slots__ = ()
+    columnas = ()
+    repetidas = ()
+
+    @classmethod
+    def _armar(cls, tuplas):
+        compartidos = {}
+        repetidas = cls.repetidas
+        nueva = tuple.__new__
+        for valores in tuplas:
+            if repetidas:
+                valores = list(valores)
+                for i in repetidas:
+                    valores[i] = compartidos.setdefault(valores[i], valores[i])
+            yield nueva(cls, valores)
+
+    @classmethod
+    def desde(cls, queryset):
+        """Lista de filas para el queryset (una consulta, sin instancias de modelo)"""
+        return list(cls._armar(queryset.values_list(*cls.columnas)))
+
+    @classmethod
+    def iterar(cls, queryset, chunk_size=2000):
+        """Como desde(), pero por lotes (exportaciones)"""
+        return cls._armar(queryset.values_list(*cls.columnas).iterator(chunk_size=chunk_size))
+
+    def get_tipo_contrato_display(self):
+        return TIPOS_CONTRATO.get(self.tipo_contrato, self.tipo_contrato)
+
+    def get_tipo_caja_display(self):
+        return TIPOS_CAJA.get(self.tipo_caja, self.tipo_caja)
+
+
+class BeneficiarioFila(_Fila, namedtuple('BeneficiarioFila', [
+    'nombre', 'rut', 'tipo_contrato', 'tipo_caja', 'codigo_caja', 'planta_nombre', 'codigo_retiro',
+])):
+    """Beneficiario en listados (lista diaria, detalle de carga)"""
+    __slots__ = ()
+    columnas = (
+        'nombre', 'rut', 'tipo_contrato', 'tipo_caja', 'codigo_caja', 'planta__nombre', 'retiro__codigo_caja',
+    )
+    repetidas = (2, 3, 4, 5, 6)
+
+    @property
+    def tiene_retiro(self):
+        # LEFT JOIN: sin retiro la columna viene en NULL (un retiro guardado siempre tiene código, aunque sea '')
+        return self.codigo_retiro is not None
+
+
+class EntregaFila(_Fila, namedtuple('EntregaFila', [
+    'nombre', 'rut', 'tipo_contrato', 'tipo_caja', 'fecha_hora',
+    'confirmado_por_id', 'confirmado_nombre', 'confirmado_apellido',
+])):
+    """Beneficiario con su retiro, para la exportación de entregados"""
+    __slots__ = ()
+    repetidas = (2, 3, 6, 7)
+    columnas = (
+        'nombre', 'rut', 'tipo_contrato', 'tipo_caja', 'retiro__fecha_hora',
+        'retiro__confirmado_por_id', 'retiro__confirmado_por__first_name', 'retiro__confirmado_por__last_name',
+    )
+
+    @property
+    def confirmado_por(self):
+        """Equivale a confirmado_por.get_full_name() o 'N/A' si no hay usuario"""
+        if self.confirmado_por_id is None:
+            return 'N/A'
+        return f'{self.confirmado_nombre} {self.confirmado_apellido}'.strip()
@@ -0,0 +1,101 @@
+"""
+Eliminación masiva de campañas con DELETE por lotes
+"""
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from .calendario import invalidar_calendario
+from .campanas_activas import invalidar_registro
+from .models import (
+    Campana, DiaBloquedo, Beneficiario,
+    Retiro, AutorizacionTercero, AgendaRetiro
+)
+
+
+PURGA_TAMANO_LOTE = 1000
+
+# Tablas que dependen de Beneficiario, en orden de eliminación
+_DEPENDIENTES_BENEFICIARIO = [Retiro, AutorizacionTercero, AgendaRetiro]
+
+
+def _tabla(modelo):
+    return connection.ops.quote_name(modelo._meta.db_table)
+
+
+def purgar_campana(campana_id, tamano_lote=None):
+    """
+    Elimina una campaña y todos sus registros con DELETE directos por lotes.
+
+    A diferencia de campana.delete(), no carga los registros en memoria ni
+    pasa por el collector de Django. Cada lote se elimina en su propia
+    transacción corta.
+
+    Returns:
+        dict: Cantidad de filas eliminadas por modelo
+    """
+    if tamano_lote is None:
+        tamano_lote = getattr(settings, 'PURGA_TAMANO_LOTE', PURGA_TAMANO_LOTE)
+
+    conteos = {modelo.__name__: 0 for modelo in _DEPENDIENTES_BENEFICIARIO}
+    conteos.update({'Beneficiario': 0, 'DiaBloquedo': 0, 'Campana': 0})
+
+    with connection.cursor() as cursor:
+        while True:
+            with transaction.atomic():
+                cursor.execute(
+                    f'SELECT id FROM {_tabla(Beneficiario)} WHERE campana_id = %s ORDER BY id LIMIT %s',
+                    [campana_id, tamano_lote]
+                )
+                ids = [fila[0] for fila in cursor.fetchall()]
+                if not ids:
+                    break
+
+                marcadores = ', '.join(['%s'] * len(ids))
+                for modelo in _DEPENDIENTES_BENEFICIARIO:
+                    cursor.execute(f'DELETE FROM {_tabla(modelo)} WHERE beneficiario_id IN ({marcadores})', ids)
+                    conteos[modelo.__name__] += cursor.rowcount
+                cursor.execute(f'DELETE FROM {_tabla(Beneficiario)} WHERE id IN ({marcadores})', ids)
+                conteos['Beneficiario'] += cursor.rowcount
+
+        with transaction.atomic():
+            cursor.execute(f'DELETE FROM {_tabla(DiaBloquedo)} WHERE campana_id = %s', [campana_id])
+            conteos['DiaBloquedo'] = cursor.rowcount
+            cursor.execute(f'DELETE FROM {_tabla(Campana)} WHERE id = %s', [campana_id])
+            conteos['Campana'] = cursor.rowcount
+
+    # Los DELETE directos no disparan señales
+    invalidar_calendario(campana_id)
+    invalidar_registro()
+    return conteos
+
+
+def purgar_pendientes(tamano_lote=None):
+    """
+    Retoma las campañas que quedaron en 'eliminando' (p. ej. el worker que
+    las purgaba se reinició). purgar_campana es reanudable: cada lote ya
+    confirmado no se repite.
+
+    Returns:
+        dict: {campana_id: conteos}
+    """
+    pendientes = Campana.objects.filter(estado_carga='eliminando').values_list('id', flat=True)
+    return {campana_id: purgar_campana(campana_id, tamano_lote) for campana_id in list(pendientes)}
+
+
+def purgar_campana_en_segundo_plano(campana_id):
+    """
+    Lanza purgar_campana en un hilo aparte y retorna el hilo. El hilo muere
+    con el worker; manage.py purgar_campana --pendientes retoma lo que quede.
+    """
+    def _tarea():
+        try:
+            conteos = purgar_campana(campana_id)
+            print(f"DEBUG: Campaña {campana_id} eliminada: {conteos}")
+        except Exception as e:
+            print(f"DEBUG: Error al eliminar campaña {campana_id}: {str(e)}")
+        finally:
+            connection.close()
+
+    hilo = threading.Thread(target=_tarea, name=f'purga-campana-{campana_id}', daemon=True)
+    hilo.start()
+    return hilo
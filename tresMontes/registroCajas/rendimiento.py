@@ -0,0 +1,203 @@
+"""
+Rendimiento de portería por guardia, planta y día
+
+Los retiros de cada día se resumen en RendimientoGuardiaDia. El intervalo
+entre escaneos consecutivos de un guardia sale de
+    LAG(fecha_hora) OVER (PARTITION BY planta, guardia, día ORDER BY fecha_hora)
+y los escaneos por hora de COUNT(*) OVER (PARTITION BY planta, guardia, día,
+hora). Los intervalos mayores a RENDIMIENTO_PAUSA_MINUTOS son pausas (tiempo
+inactivo) y no entran en el promedio.
+
+Las planillas en papel y los retiros masivos a terceros (Retiro.origen) suman
+en los retiros y en los retiros a terceros, pero no son escaneos: sus horas no
+miden el ritmo del guardia y quedan fuera de intervalos, horas activas y
+retiros por hora (que se calculan sobre `escaneos`).
+
+Los resúmenes los recalcula manage.py actualizar_rendimiento (cada noche y,
+para el día en curso, cada pocos minutos) y el botón "Actualizar hoy" del
+reporte; abrir el reporte no escribe. Cada recálculo bloquea las plantas que
+reescribe, así dos recálculos simultáneos no duplican filas. El reporte solo
+suma resúmenes, así que su costo no crece con las temporadas acumuladas, y
+sigue disponible tras archivar o purgar campañas.
+"""
+import csv
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Sum, Window
+from django.db.models.functions import ExtractHour, Lag, TruncDate
+from django.utils import timezone
+
+from .models import Planta, RendimientoGuardiaDia, Retiro
+from .utils import rango_fechas
+
+
+RENDIMIENTO_PAUSA_MINUTOS = 10
+TAMANO_LOTE = 2000
+
+TOTALES = {
+    'retiros': Sum('retiros'),
+    'retiros_tercero': Sum('retiros_tercero'),
+    'escaneos': Sum('escaneos'),
+    'intervalos': Sum('intervalos'),
+    'suma_intervalos': Sum('suma_intervalos'),
+    'pausas': Sum('pausas'),
+    'tiempo_inactivo': Sum('tiempo_inactivo'),
+    'horas_activas': Sum('horas_activas'),
+    'maximo_por_hora': Max('maximo_por_hora'),
+}
+
+COLUMNAS_CSV = [
+    ('fecha', 'Fecha'), ('planta', 'Planta'), ('guardia', 'Guardia'), ('retiros', 'Retiros'), ('escaneos', 'Escaneos'),
+    ('por_hora', 'Retiros por hora activa'), ('maximo_por_hora', 'Máximo en una hora'),
+    ('intervalo_medio', 'Intervalo medio (s)'), ('pausas', 'Pausas'),
+    ('inactivo_minutos', 'Tiempo inactivo (min)'), ('pct_tercero', '% a terceros'),
+    ('primera', 'Primera entrega'), ('ultima', 'Última entrega'),
+]
+
+
+def solo_escaneos(retiros):
+    """Excluye los retiros de planillas en papel y los masivos a terceros"""
+    return retiros.filter(origen='porteria')
+
+
+def _retiros_con_intervalo(desde, hasta, plantas=None):
+    """
+    Retiros del rango con su intervalo desde el escaneo anterior del mismo
+    guardia y los de su hora. Las ventanas se separan por origen, así los
+    intervalos de un escaneo solo miran escaneos.
+    """
+    inicio, fin = rango_fechas(desde, hasta)
+    retiros = Retiro.objects.filter(fecha_hora__gte=inicio, fecha_hora__lt=fin)
+    if plantas is not None:
+        retiros = retiros.filter(beneficiario__planta_id__in=plantas)
+
+    dia = TruncDate('fecha_hora')
+    particion = [F('beneficiario__planta_id'), F('confirmado_por_id'), dia, F('origen')]
+    anterior = Window(Lag('fecha_hora'), partition_by=particion, order_by=F('fecha_hora').asc())
+    return (
+        retiros.annotate(
+            dia=dia,
+            hora=ExtractHour('fecha_hora'),
+            intervalo=ExpressionWrapper(F('fecha_hora') - anterior, output_field=DurationField()),
+            en_hora=Window(Count('id'), partition_by=[*particion, ExtractHour('fecha_hora')]),
+        )
+        .order_by('beneficiario__planta_id', 'confirmado_por_id', 'fecha_hora')
+        .values_list('beneficiario__planta_id', 'confirmado_por_id', 'dia', 'hora', 'fecha_hora',
+                     'intervalo', 'en_hora', 'retirado_por_tercero', 'origen')
+    )
+
+
+def _resumir(filas, pausa):
+    resumenes, horas = {}, {}
+    for planta_id, guardia_id, dia, hora, fecha_hora, intervalo, en_hora, tercero, origen in filas:
+        clave = (planta_id, guardia_id, dia)
+        resumen = resumenes.get(clave)
+        if resumen is None:
+            resumen = resumenes[clave] = RendimientoGuardiaDia(
+                fecha=dia, planta_id=planta_id, guardia_id=guardia_id, primera=fecha_hora, ultima=fecha_hora
+            )
+            horas[clave] = set()
+        resumen.retiros += 1
+        resumen.retiros_tercero += tercero
+        resumen.ultima = fecha_hora
+        if origen != 'porteria':
+            continue
+        resumen.escaneos += 1
+        resumen.maximo_por_hora = max(resumen.maximo_por_hora, en_hora)
+        horas[clave].add(hora)
+        if intervalo is not None:
+            segundos = intervalo.total_seconds()
+            if segundos > pausa:
+                resumen.pausas += 1
+                resumen.tiempo_inactivo += segundos
+            else:
+                resumen.intervalos += 1
+                resumen.suma_intervalos += segundos
+
+    for clave, resumen in resumenes.items():
+        resumen.horas_activas = len(horas[clave])
+    return list(resumenes.values())
+
+
+def actualizar_rendimiento(desde, hasta, plantas=None):
+    """
+    Recalcula los resúmenes de los días [desde, hasta] (de todas las plantas
+    o solo de los ids en `plantas`).
+
+    Returns:
+        int: resúmenes guardados
+    """
+    pausa = getattr(settings, 'RENDIMIENTO_PAUSA_MINUTOS', RENDIMIENTO_PAUSA_MINUTOS) * 60
+    resumenes = _resumir(_retiros_con_intervalo(desde, hasta, plantas).iterator(chunk_size=TAMANO_LOTE), pausa)
+
+    with transaction.atomic():
+        # Un recálculo a la vez por planta: el DELETE de otro no ve las filas que este inserta
+        bloqueadas = Planta.objects.select_for_update().order_by('id')
+        if plantas is not None:
+            bloqueadas = bloqueadas.filter(id__in=plantas)
+        list(bloqueadas.values_list('id', flat=True))
+
+        anteriores = RendimientoGuardiaDia.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        if plantas is not None:
+            anteriores = anteriores.filter(planta_id__in=plantas)
+        anteriores.delete()
+        RendimientoGuardiaDia.objects.bulk_create(resumenes, batch_size=500)
+    return len(resumenes)
+
+
+def _indicadores(fila):
+    """Agrega a un resumen (o suma de resúmenes) los indicadores derivados"""
+    retiros = fila['retiros'] or 0
+    fila['por_hora'] = round((fila['escaneos'] or 0) / fila['horas_activas'], 1) if fila['horas_activas'] else 0
+    fila['intervalo_medio'] = round(fila['suma_intervalos'] / fila['intervalos'], 1) if fila['intervalos'] else None
+    fila['inactivo_minutos'] = round(fila['tiempo_inactivo'] / 60)
+    fila['pct_tercero'] = round(fila['retiros_tercero'] * 100 / retiros, 1) if retiros else 0
+    return fila
+
+
+def _nombre_guardia(fila):
+    return fila['guardia__perfil__nombre_completo'] or fila['guardia__username'] or 'Sin guardia'
+
+
+def _resumenes(planta, desde, hasta):
+    return RendimientoGuardiaDia.objects.filter(planta=planta, fecha__gte=desde, fecha__lte=hasta)
+
+
+def reporte_guardias(planta, desde, hasta):
+    """Totales del período por guardia, de mayor a menor cantidad de retiros"""
+    filas = (
+        _resumenes(planta, desde, hasta)
+        .values('guardia_id', 'guardia__username', 'guardia__perfil__nombre_completo')
+        .annotate(dias=Count('id'), **TOTALES)
+        .order_by('-retiros')
+    )
+    return [_indicadores(dict(fila, guardia=_nombre_guardia(fila))) for fila in filas]
+
+
+def reporte_diario(planta, desde, hasta):
+    """Totales de la planta por día; horas_activas suma las horas de todos los guardias"""
+    filas = (
+        _resumenes(planta, desde, hasta)
+        .values('fecha')
+        .annotate(guardias=Count('guardia_id', distinct=True), **TOTALES)
+        .order_by('fecha')
+    )
+    return [_indicadores(dict(fila)) for fila in filas]
+
+
+def escribir_csv(salida, planta, desde, hasta):
+    """CSV (;) con una fila por guardia y día"""
+    writer = csv.writer(salida, delimiter=';')
+    writer.writerow([titulo for _, titulo in COLUMNAS_CSV])
+    filas = (
+        _resumenes(planta, desde, hasta)
+        .order_by('fecha', 'guardia__username')
+        .values('fecha', 'primera', 'ultima', 'guardia__username', 'guardia__perfil__nombre_completo',
+                *TOTALES)
+    )
+    for fila in filas:
+        fila = _indicadores(dict(fila, planta=planta.nombre, guardia=_nombre_guardia(fila)))
+        fila['primera'] = timezone.localtime(fila['primera']).strftime('%H:%M')
+        fila['ultima'] = timezone.localtime(fila['ultima']).strftime('%H:%M')
+        writer.writerow(['' if fila[campo] is None else fila[campo] for campo, _ in COLUMNAS_CSV])
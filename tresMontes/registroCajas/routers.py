@@ -0,0 +1,56 @@
+"""
+Router de base de datos: lecturas de reportes y exportaciones a la réplica
+"""
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_ALIAS = 'replica'
+
+_estado = threading.local()
+
+
+@contextmanager
+def lectura_replica():
+    """
+    Contexto en que las lecturas del ORM van a la réplica de lectura.
+
+    Si no hay réplica configurada, las lecturas siguen yendo a 'default'.
+    Dentro de una transacción (atomic) también: la réplica no ve lo que la
+    transacción aún no confirma.
+
+    Ejemplo:
+        with lectura_replica():
+            total = Retiro.objects.count()
+    """
+    _estado.nivel = getattr(_estado, 'nivel', 0) + 1
+    try:
+        yield
+    finally:
+        _estado.nivel -= 1
+
+
+def replica_disponible():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    """Las escrituras y migraciones siempre van a 'default'"""
+
+    def db_for_read(self, model, **hints):
+        if getattr(_estado, 'nivel', 0) and replica_disponible() \
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica contiene los mismos datos que default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
@@ -0,0 +1,282 @@
+"""
+Simulación de la cola de portería para decidir cuántos guardias poner
+
+Llegadas y tiempos de atención salen del historial:
+- llegadas: Retiro.fecha_hora de cada día (modo 'historico'), una muestra
+  de ese perfil horario (modo 'muestreo') o los bloques de AgendaRetiro con
+  llegada uniforme dentro de la hora (modo 'agenda');
+- atención: diferencia entre retiros consecutivos del mismo guardia
+  (confirmado_por) en un mismo día, descartando pausas largas.
+
+El historial se extrae una vez a un archivo .npz (extraer_historial /
+guardar_historial) y la simulación corre sin base de datos. Cada escenario
+(día x cantidad de guardias x réplica) es una fila de una matriz; la cola FIFO
+con c guardias se recorre cliente a cliente, pero cada paso avanza todas las
+filas a la vez con numpy.
+
+Dependencia opcional: numpy (pip install numpy).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+SERVICIO_MIN = 5       # segundos; menos es un doble registro
+SERVICIO_MAX = 300     # segundos; más es una pausa del guardia, no atención
+SERVICIO_DEFECTO = 45  # si el historial no tiene suficientes muestras
+SIN_LLEGADA = 1e7      # relleno para días con menos llegadas (fuera de cualquier día)
+PERCENTILES = (50, 90, 95, 99)
+
+
+class DependenciaFaltante(ImportError):
+    """Falta numpy"""
+
+
+def _verificar_dependencias():
+    if np is None:
+        raise DependenciaFaltante('Falta numpy para simular la portería (pip install numpy)')
+
+
+def _segundos_del_dia(fechas_hora):
+    """datetimes aware -> (fechas locales, segundos desde medianoche)"""
+    fechas, segundos = [], []
+    for fecha_hora in fechas_hora:
+        local = timezone.localtime(fecha_hora)
+        fechas.append(local.date())
+        segundos.append(local.hour * 3600 + local.minute * 60 + local.second + local.microsecond / 1e6)
+    return fechas, segundos
+
+
+def extraer_historial(planta, desde, hasta):
+    """
+    Lee de la base lo necesario para simular una planta en [desde, hasta].
+
+    Returns:
+        dict de arrays numpy: dias (ordinal), llegadas y llegadas_dia (segundos
+        del día y su día), agendas y agendas_dia (inicio del bloque), servicio
+    """
+    _verificar_dependencias()
+    from .models import AgendaRetiro, Retiro
+    from .rendimiento import solo_escaneos
+    from .utils import rango_fechas
+
+    inicio, fin = rango_fechas(desde, hasta)
+    # Planillas en papel y retiros masivos a terceros no son llegadas a portería
+    retiros = list(
+        solo_escaneos(Retiro.objects)
+        .filter(beneficiario__planta=planta, fecha_hora__gte=inicio, fecha_hora__lt=fin)
+        .order_by('confirmado_por_id', 'fecha_hora')
+        .values_list('confirmado_por_id', 'fecha_hora')
+    )
+    fechas, segundos = _segundos_del_dia(f for _, f in retiros)
+    dia_retiro = np.array([f.toordinal() for f in fechas], dtype=np.int64)
+    segundos = np.array(segundos, dtype=float)
+
+    # Atención: separación entre escaneos consecutivos del mismo guardia en el mismo día
+    guardia = np.array([g if g is not None else -1 for g, _ in retiros], dtype=np.int64)
+    mismo = (guardia[1:] == guardia[:-1]) & (dia_retiro[1:] == dia_retiro[:-1]) & (guardia[1:] >= 0)
+    gaps = np.diff(segundos)[mismo] if len(segundos) > 1 else np.array([])
+    servicio = gaps[(gaps >= SERVICIO_MIN) & (gaps <= SERVICIO_MAX)]
+
+    orden = np.lexsort((segundos, dia_retiro))
+    agendas = list(
+        AgendaRetiro.objects
+        .filter(beneficiario__planta=planta, fecha_agendada__gte=desde, fecha_agendada__lte=hasta,
+                hora_inicio__isnull=False)
+        .values_list('fecha_agendada', 'hora_inicio')
+    )
+
+    return {
+        'dias': np.array(sorted({*dia_retiro.tolist(), *(f.toordinal() for f, _ in agendas)}), dtype=np.int64),
+        'llegadas': segundos[orden],
+        'llegadas_dia': dia_retiro[orden],
+        'agendas': np.array([h.hour * 3600 + h.minute * 60 for _, h in agendas], dtype=float),
+        'agendas_dia': np.array([f.toordinal() for f, _ in agendas], dtype=np.int64),
+        'servicio': servicio,
+    }
+
+
+def guardar_historial(historial, destino):
+    _verificar_dependencias()
+    np.savez_compressed(destino, **historial)
+
+
+def cargar_historial(origen):
+    _verificar_dependencias()
+    with np.load(origen) as datos:
+        return {clave: datos[clave] for clave in datos.files}
+
+
+def _por_dia(valores, dias_de_valor, dias):
+    return [np.sort(valores[dias_de_valor == dia]) for dia in dias]
+
+
+def _matriz(filas):
+    """Lista de arrays de distinto largo -> matriz rellena con SIN_LLEGADA y máscara"""
+    ancho = max((len(f) for f in filas), default=0)
+    matriz = np.full((len(filas), ancho), SIN_LLEGADA)
+    for i, fila in enumerate(filas):
+        matriz[i, :len(fila)] = fila
+    return matriz, matriz < SIN_LLEGADA
+
+
+def generar_llegadas(historial, modo='historico', dias_simulados=None, volumen=None, rng=None):
+    """
+    Llegadas por día (segundos desde medianoche) según el modo:
+    'historico' repite cada día; 'muestreo' sortea días_simulados días con el
+    perfil horario y los volúmenes observados (o `volumen` por día); 'agenda'
+    ubica a cada agendado al azar dentro de su bloque.
+
+    Returns:
+        list: un array ordenado por día simulado
+    """
+    _verificar_dependencias()
+    rng = rng or np.random.default_rng()
+    llegadas, llegadas_dia = historial['llegadas'], historial['llegadas_dia']
+
+    if modo == 'historico':
+        return _por_dia(llegadas, llegadas_dia, np.unique(llegadas_dia))
+
+    if modo == 'muestreo':
+        if not len(llegadas):
+            return []
+        _, volumenes = np.unique(llegadas_dia, return_counts=True)
+        dias_simulados = dias_simulados or len(volumenes)
+        cantidades = np.full(dias_simulados, volumen) if volumen else rng.choice(volumenes, dias_simulados)
+        # Perfil horario empírico con un poco de ruido para no repetir segundos exactos
+        return [
+            np.sort(np.clip(rng.choice(llegadas, n) + rng.uniform(-60, 60, n), 0, 86399))
+            for n in cantidades
+        ]
+
+    if modo == 'agenda':
+        bloques = _por_dia(historial['agendas'], historial['agendas_dia'], np.unique(historial['agendas_dia']))
+        return [np.sort(b + rng.uniform(0, 3600, len(b))) for b in bloques]
+
+    raise ValueError(f'Modo de llegadas desconocido: {modo}')
+
+
+def _simular_cola(llegadas, atencion, guardias):
+    """
+    Cola FIFO con varios guardias, una fila por escenario.
+
+    Args:
+        llegadas: (E, n) ordenadas, rellenas con SIN_LLEGADA
+        atencion: (E, n) segundos de atención
+        guardias: (E,) guardias de cada escenario
+
+    Returns:
+        tuple: (inicio de atención, espera) con forma (E, n)
+    """
+    escenarios, clientes = llegadas.shape
+    maximo = int(guardias.max()) if escenarios else 0
+    # Guardias que no existen en el escenario quedan "ocupados" para siempre
+    libre = np.where(np.arange(maximo)[None, :] < guardias[:, None], 0.0, np.inf)
+    filas = np.arange(escenarios)
+    inicio = np.empty_like(llegadas)
+
+    for i in range(clientes):
+        guardia = libre.argmin(axis=1)
+        disponible = libre[filas, guardia]
+        comienzo = np.maximum(llegadas[:, i], disponible)
+        inicio[:, i] = comienzo
+        real = llegadas[:, i] < SIN_LLEGADA
+        libre[filas, guardia] = np.where(real, comienzo + atencion[:, i], disponible)
+
+    return inicio, inicio - llegadas
+
+
+def _cola_maxima(llegadas, inicio, validos):
+    """Máximo de personas esperando al llegar alguien, por escenario"""
+    escenarios, clientes = llegadas.shape
+    if not clientes:
+        return np.zeros(escenarios)
+    # FIFO: los inicios quedan ordenados por fila; con un desplazamiento por fila
+    # un solo searchsorted cuenta cuántos ya empezaron a ser atendidos
+    desplazamiento = (np.arange(escenarios) * 2 * SIN_LLEGADA)[:, None]
+    comenzados = np.searchsorted((inicio + desplazamiento).ravel(), (llegadas + desplazamiento).ravel(), side='right')
+    comenzados = comenzados.reshape(escenarios, clientes) - (np.arange(escenarios) * clientes)[:, None]
+    en_cola = np.arange(clientes)[None, :] - comenzados
+    return np.where(validos, np.maximum(en_cola, 0), 0).max(axis=1)
+
+
+def simular(historial, guardias=(1, 2, 3, 4), modo='historico', replicas=1, dias_simulados=None,
+            volumen=None, servicio=None, semilla=None):
+    """
+    Simula la portería para cada cantidad de guardias.
+
+    Args:
+        servicio: segundos fijos de atención (por defecto, muestras del historial)
+
+    Returns:
+        list: un dict por cantidad de guardias con dias, atendidos, espera_media,
+        espera_p50/p90/p95/p99 (minutos), cola_max_p95, cola_max y utilizacion
+    """
+    _verificar_dependencias()
+    rng = np.random.default_rng(semilla)
+    dias = [d for _ in range(replicas) for d in generar_llegadas(historial, modo, dias_simulados, volumen, rng)]
+    dias = [d for d in dias if len(d)]
+    if not dias:
+        return []
+
+    llegadas, validos = _matriz(dias)
+    muestras = historial['servicio']
+    if servicio:
+        atencion = np.full(llegadas.shape, float(servicio))
+    elif len(muestras) >= 10:
+        atencion = rng.choice(muestras, llegadas.shape)
+    else:
+        atencion = np.full(llegadas.shape, float(SERVICIO_DEFECTO))
+    atencion = np.where(validos, atencion, 0.0)
+
+    # Mismas llegadas y atenciones para todas las cantidades de guardias (comparación justa)
+    guardias = np.array(sorted(set(guardias)))
+    n_dias = len(dias)
+    todas_llegadas = np.tile(llegadas, (len(guardias), 1))
+    todas_atencion = np.tile(atencion, (len(guardias), 1))
+    todos_validos = np.tile(validos, (len(guardias), 1))
+    por_escenario = np.repeat(guardias, n_dias)
+
+    inicio, espera = _simular_cola(todas_llegadas, todas_atencion, por_escenario)
+    colas = _cola_maxima(todas_llegadas, inicio, todos_validos)
+    fin = np.where(todos_validos, inicio + todas_atencion, 0).max(axis=1)
+    primero = todas_llegadas[:, 0]
+
+    resultados = []
+    for k, cantidad in enumerate(guardias):
+        filas = slice(k * n_dias, (k + 1) * n_dias)
+        esperas = espera[filas][todos_validos[filas]] / 60
+        jornada = np.maximum(fin[filas] - primero[filas], 1)
+        resultado = {
+            'guardias': int(cantidad),
+            'dias': n_dias,
+            'atendidos': int(todos_validos[filas].sum()),
+            'espera_media': float(esperas.mean()),
+            'cola_max_p95': float(np.percentile(colas[filas], 95)),
+            'cola_max': int(colas[filas].max()),
+            'utilizacion': float((todas_atencion[filas].sum(axis=1) / (cantidad * jornada)).mean()),
+        }
+        for p, valor in zip(PERCENTILES, np.percentile(esperas, PERCENTILES)):
+            resultado[f'espera_p{p}'] = float(valor)
+        resultados.append(resultado)
+    return resultados
+
+
+def guardias_recomendados(resultados, objetivo_minutos=None):
+    """Menor cantidad de guardias con espera p95 dentro del objetivo, o None"""
+    objetivo = objetivo_minutos or getattr(settings, 'SIMULACION_OBJETIVO_ESPERA', 5)
+    for resultado in resultados:
+        if resultado['espera_p95'] <= objetivo:
+            return resultado['guardias']
+    return None
+
+
+def periodo_por_defecto():
+    hasta = timezone.localdate()
+    return hasta - timedelta(days=365), hasta
@@ -0,0 +1,72 @@
+"""
+Retiro por terceros autorizados (AutorizacionTercero) en portería
+
+La vigencia de AutorizacionTercero.es_valida_para_fecha se evalúa en SQL:
+activa y, si es de una sola vez, para esa fecha exacta; si no, desde
+fecha_autorizada en adelante. La consulta usa el índice parcial
+autoriz_rut_fecha_activa_idx (rut_tercero, fecha_autorizada WHERE activa).
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .campanas_activas import obtener_registro
+from .entregas_masivas import registrar_entregas
+from .models import AutorizacionTercero
+from .utils import variantes_rut
+
+
+ORIGEN_TERCERO = 'Entrega a tercero autorizado'
+
+
+def vigentes_para_fecha(fecha):
+    """Q equivalente a AutorizacionTercero.es_valida_para_fecha(fecha)"""
+    return (
+        Q(activa=True, fecha_autorizada__lte=fecha)
+        & (Q(solo_una_vez=False) | Q(fecha_autorizada=fecha))
+    )
+
+
+def autorizaciones_tercero(rut_tercero, planta, fecha=None):
+    """
+    Beneficiarios de la planta, en campañas activas, que el tercero puede
+    retirar en `fecha` (hoy por defecto). Una consulta.
+
+    Returns:
+        list: AutorizacionTercero (una por beneficiario) con beneficiario y su retiro
+    """
+    fecha = fecha or timezone.localdate()
+    ids_activas = obtener_registro().ids
+    if not rut_tercero or not ids_activas:
+        return []
+
+    autorizaciones = (
+        AutorizacionTercero.objects
+        .filter(vigentes_para_fecha(fecha), rut_tercero__in=variantes_rut(rut_tercero))
+        .filter(beneficiario__planta=planta, beneficiario__campana_id__in=ids_activas)
+        .select_related('beneficiario__retiro')
+        .order_by('beneficiario__nombre', '-fecha_creacion')
+    )
+    por_beneficiario = {}
+    for autorizacion in autorizaciones:
+        por_beneficiario.setdefault(autorizacion.beneficiario_id, autorizacion)
+    return list(por_beneficiario.values())
+
+
+def registrar_retiros_tercero(autorizaciones, usuario, planta):
+    """
+    Registra en un solo lote los retiros de las autorizaciones indicadas.
+
+    Returns:
+        list: reporte por fila de entregas_masivas.registrar_entregas
+    """
+    ahora = timezone.now()
+    filas = [{
+        'numero': numero,
+        'identificador': a.beneficiario.codigo_caja,
+        'fecha_hora': ahora,
+        'nombre_tercero': a.nombre_tercero,
+        'rut_tercero': a.rut_tercero,
+        'observaciones': '',
+        'motivo': None,
+    } for numero, a in enumerate(autorizaciones, start=1)]
+    return registrar_entregas(filas, usuario, planta, origen=ORIGEN_TERCERO, modo='tercero')
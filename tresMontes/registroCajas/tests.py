@@ -1,3 +1,1327 @@
-from django.test import TestCase
+import importlib.util
+import io
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+from datetime import date, datetime, time, timedelta
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, router, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Planta, Perfil, Campana, DiaBloquedo,
+    Beneficiario, Retiro, AutorizacionTercero, AgendaRetiro, CampanaArchivada, RendimientoGuardiaDia
+)
+from .archivo import archivar_campana, restaurar_campana
+from .calendario import invalidar_calendario, pueden_retirar
+from .campanas_activas import CLAVE_VERSION, invalidar_registro, obtener_registro
+from .provision import provisionar_trabajadores, token_activacion
+from .terceros import autorizaciones_tercero
+from .agenda import programar_retiros, reprogramar_fecha
+from .dispositivos import emitir_token, limpiar_cache
+from .etiquetas import datos_etiquetas, generar_pdf_etiquetas, ruta_pdf
+from .tokens import TokenInvalido, generar_token_qr, verificar_token_qr
+from .management.commands.carga_porteria import Command as CargaPorteria
+from .middleware import perfiles_capturados
+from . import middleware
+from .eventos import _vuelta
+from .purga import purgar_campana
+from . import routers
+from .proyecciones import BeneficiarioFila
+from .rendimiento import actualizar_rendimiento
+from . import metricas, simulacion
+from . import utils as utils_nomina
+from .utils import calcular_digito_verificador, formatear_rut
+
+
+# Línea de EXPLAIN QUERY PLAN que recorre una tabla completa sin índice
+SCAN_COMPLETO = re.compile(r'SCAN (?:TABLE )?(\w+)$')
+
+
+def rut_valido(rut):
+    numeros, dv = rut.replace('.', '').split('-')
+    return calcular_digito_verificador(numeros) == dv.upper()
+
+
+def caches_locales(prefijo):
+    """CACHES en memoria para override_settings: nada se escribe en el caché de archivos del proyecto"""
+    return {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'{prefijo}-{alias}'}
+        for alias in ('default', 'sesiones', 'compartido')
+    }
+
+
+def reiniciar_caches_proceso():
+    """Descarta el registro de campañas activas y los calendarios guardados en el proceso"""
+    invalidar_registro()
+    invalidar_calendario()
+
+
+class DatosBaseMixin:
+    """Crea una planta, una campaña activa y usuarios de cada rol"""
+
+    @classmethod
+    def setUpTestData(cls):
+        hoy = timezone.localdate()
+        cls.planta = Planta.objects.create(codigo='casablanca', nombre='Casa Blanca')
+        cls.admin = User.objects.create_user('admin', password='123')
+        Perfil.objects.create(user=cls.admin, rol='admin', planta=cls.planta, nombre_completo='Ana Administradora')
+        cls.guardia = User.objects.create_user('guardia', password='123')
+        Perfil.objects.create(user=cls.guardia, rol='guardia', planta=cls.planta, nombre_completo='Carlos Silva')
+        cls.campana = Campana.objects.create(
+            nombre='Entrega',
+            fecha_inicio=hoy,
+            fecha_fin=hoy + timedelta(days=10),
+            planta=cls.planta,
+            creado_por=cls.admin
+        )
+        cls.beneficiario = Beneficiario.objects.create(
+            campana=cls.campana,
+            nombre='Juan Pérez',
+            rut='12.345.678-5',
+            tipo_contrato='indefinido',
+            planta=cls.planta
+        )
+
+    def setUp(self):
+        # El registro y los calendarios viven en el proceso: sin esto una clase
+        # vería campañas de otra que ya se revirtieron
+        reiniciar_caches_proceso()
+        self.addCleanup(reiniciar_caches_proceso)
+
+    def login(self, user):
+        self.client.force_login(user)
+        session = self.client.session
+        session['planta_codigo'] = user.perfil.planta.codigo
+        session.save()
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN es específico de SQLite')
+class IndicesConsultasTest(DatosBaseMixin, TestCase):
+    """
+    Las consultas de las vistas más usadas no deben recorrer tablas completas.
+    Se captura el SQL que ejecutan las vistas (y los registros en caché que
+    usan) y se revisa su EXPLAIN, en vez de reescribir las consultas a mano.
+    """
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [fila[-1] for fila in cursor.fetchall()]
+
+    def assertSinRecorridos(self, consultas, tabla):
+        """Ningún SELECT capturado que lee `tabla` recorre completa una tabla de la app"""
+        revisadas = 0
+        for consulta in consultas:
+            sql = consulta['sql']
+            if not sql.startswith('SELECT') or f'"{tabla}"' not in sql:
+                continue
+            revisadas += 1
+            plan = self.plan(sql)
+            tablas_recorridas = [
+                match.group(1)
+                for linea in plan
+                if (match := SCAN_COMPLETO.search(linea.strip())) and match.group(1).startswith('registroCajas_')
+            ]
+            self.assertEqual(tablas_recorridas, [], f'Recorrido completo en:\n{sql}\n' + '\n'.join(plan))
+        self.assertTrue(revisadas, f'Ninguna consulta leyó {tabla}')
+
+    def assertVistaUsaIndices(self, user, nombre, tabla, params=None):
+        self.login(user)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse(nombre), params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertSinRecorridos(consultas.captured_queries, tabla)
+
+    def test_registro_de_campanas_activas(self):
+        DiaBloquedo.objects.create(campana=self.campana, fecha=date(2025, 12, 24))
+        invalidar_registro()
+        with CaptureQueriesContext(connection) as consultas:
+            obtener_registro()
+        self.assertSinRecorridos(consultas.captured_queries, 'registroCajas_campana')
+        self.assertSinRecorridos(consultas.captured_queries, 'registroCajas_diabloquedo')
+
+    def test_busqueda_rut_porteria(self):
+        self.assertVistaUsaIndices(
+            self.guardia, 'guardia_buscar_rut', 'registroCajas_beneficiario', {'rut': self.beneficiario.rut}
+        )
+
+    def test_pendientes_planta(self):
+        self.assertVistaUsaIndices(self.guardia, 'guardia_home', 'registroCajas_beneficiario')
+
+    def test_retiros_por_rango(self):
+        self.assertVistaUsaIndices(self.admin, 'admin_reportes', 'registroCajas_retiro', {'periodo': 'mes'})
+
+    def test_dias_bloqueados_de_campana_inactiva(self):
+        inactiva = Campana.objects.create(
+            nombre='Anterior', fecha_inicio=date(2025, 12, 1), fecha_fin=date(2025, 12, 31),
+            planta=self.planta, activa=False
+        )
+        with CaptureQueriesContext(connection) as consultas:
+            pueden_retirar([Beneficiario(id=0, campana=inactiva)])
+        self.assertSinRecorridos(consultas.captured_queries, 'registroCajas_diabloquedo')
+
+    def test_autorizaciones_vigentes_de_tercero(self):
+        AutorizacionTercero.objects.create(
+            beneficiario=self.beneficiario, nombre_tercero='María Soto', rut_tercero='11.111.111-1',
+            fecha_autorizada=timezone.localdate()
+        )
+        self.assertVistaUsaIndices(
+            self.guardia, 'guardia_retiro_tercero', 'registroCajas_autorizaciontercero', {'rut_tercero': '11.111.111-1'}
+        )
+
+    def test_agenda_por_fecha(self):
+        self.assertVistaUsaIndices(self.guardia, 'guardia_llegadas', 'registroCajas_agendaretiro')
+
+
+@override_settings(NOMINA_TAMANO_LOTE=2, NOMINA_PAUSA_LOTE=0, MEDIA_ROOT=tempfile.mkdtemp())
+class ImportacionPorLotesTest(DatosBaseMixin, TestCase):
+
+    def _nomina(self):
+        filas = ['RUT,NOMBRE,TIPO_CONTRATO,TIPO_CAJA'] + [
+            f'"{formatear_rut(20000000 + i)}",Persona {i},indefinido,estandar' for i in range(5)
+        ]
+        return io.BytesIO('\n'.join(filas).encode())
+
+    def test_lote_fallido_deja_carga_parcial_inactiva_y_se_reanuda(self):
+        self.login(self.admin)
+        guardar_lote = utils_nomina._guardar_lote
+        llamadas = []
+
+        def falla_segundo_lote(campana, lote):
+            llamadas.append(len(lote))
+            if len(llamadas) == 2:
+                raise OperationalError('database is locked')
+            return guardar_lote(campana, lote)
+
+        archivo = self._nomina()
+        archivo.name = 'nomina.csv'
+        with mock.patch.object(utils_nomina, '_guardar_lote', side_effect=falla_segundo_lote):
+            respuesta = self.client.post(reverse('admin_crear_campana'), {
+                'nombre': 'Navidad', 'planta': self.planta.id, 'fecha_inicio': '2025-12-01',
+                'fecha_fin': '2025-12-31', 'archivo_nomina': archivo,
+            }, follow=True)
+
+        campana = Campana.objects.get(nombre='Navidad')
+        self.assertEqual(llamadas, [2, 2])  # se detiene en el lote que falló
+        self.assertEqual(campana.estado_carga, 'parcial')
+        self.assertFalse(campana.activa)
+        self.assertEqual(campana.beneficiarios.count(), 2)  # el primer lote quedó confirmado
+        self.assertNotIn(campana.id, obtener_registro().ids)
+        mensajes = [str(m) for m in respuesta.context['messages']]
+        self.assertTrue(any('lote 2' in m for m in mensajes), mensajes)
+
+        archivo = self._nomina()
+        archivo.name = 'nomina.csv'
+        self.client.post(reverse('admin_reanudar_carga', args=[campana.id]), {'archivo_nomina': archivo})
+
+        campana.refresh_from_db()
+        self.assertEqual(campana.estado_carga, 'completa')
+        self.assertTrue(campana.activa)
+        self.assertEqual(campana.beneficiarios.count(), 5)
+        self.assertIn(campana.id, obtener_registro().ids)
+
+
+@mock.patch.object(routers, 'replica_disponible', return_value=True)
+class ReplicaRouterTest(TransactionTestCase):
+    """Sin TestCase: su transacción envolvente mandaría toda lectura a default"""
+
+    def test_lecturas_en_contexto_van_a_la_replica(self, _):
+        self.assertEqual(Retiro.objects.all().db, 'default')
+        with routers.lectura_replica():
+            self.assertEqual(Retiro.objects.all().db, routers.REPLICA_ALIAS)
+            with routers.lectura_replica():
+                self.assertEqual(Campana.objects.all().db, routers.REPLICA_ALIAS)
+            self.assertEqual(Retiro.objects.all().db, routers.REPLICA_ALIAS)
+        self.assertEqual(Retiro.objects.all().db, 'default')
+
+    def test_escrituras_y_transacciones_van_a_default(self, _):
+        with routers.lectura_replica():
+            self.assertEqual(router.db_for_write(Retiro), 'default')
+            with transaction.atomic():
+                self.assertEqual(Retiro.objects.all().db, 'default')
+            self.assertEqual(Retiro.objects.all().db, routers.REPLICA_ALIAS)
+        self.assertFalse(routers.ReplicaRouter().allow_migrate(routers.REPLICA_ALIAS, 'registroCajas'))
+
+
+@override_settings(CACHES=caches_locales('carga-porteria'))
+class CargaPorteriaTest(LiveServerTestCase):
+    """El comando habla HTTP con un servidor real: los datos deben estar confirmados"""
+
+    def setUp(self):
+        reiniciar_caches_proceso()
+        self.addCleanup(reiniciar_caches_proceso)
+        hoy = timezone.localdate()
+        planta = Planta.objects.create(codigo='casablanca', nombre='Casa Blanca')
+        campana = Campana.objects.create(
+            nombre='Entrega', fecha_inicio=hoy, fecha_fin=hoy + timedelta(days=10), planta=planta
+        )
+        for i in range(6):
+            Beneficiario.objects.create(
+                campana=campana, nombre=f'Persona {i}', rut=formatear_rut(10_000_000 + i),
+                tipo_contrato='indefinido', planta=planta
+            )
+
+    def cargar(self, **opciones):
+        salida = io.StringIO()
+        call_command(
+            'carga_porteria', url=self.live_server_url, guardias=1, escaneos=3, crear_guardias=True,
+            stdout=salida, **opciones
+        )
+        # operación -> [n, p50, p95, p99, errores, bloqueos, rechazos]
+        return {
+            linea.split()[0]: linea.split()[1:]
+            for linea in salida.getvalue().splitlines()
+            if linea.split()[:1] in (['login'], ['escaneo_qr'], ['buscar_rut'], ['confirmar'])
+        }
+
+    def test_entregas_por_token_qr_y_por_rut(self):
+        filas = self.cargar(proporcion_qr=1)
+        self.assertEqual(set(filas), {'login', 'escaneo_qr'})
+        self.assertEqual(filas['escaneo_qr'][0], '3')
+        self.assertEqual(filas['escaneo_qr'][4:], ['0', '0', '0'])
+        self.assertEqual(
+            Retiro.objects.filter(observaciones='Entrega registrada mediante escaneo QR').count(), 3
+        )
+
+        filas = self.cargar(proporcion_qr=0)
+        self.assertEqual(set(filas), {'login', 'buscar_rut', 'confirmar'})
+        self.assertEqual(filas['confirmar'][0], '3')
+        for fila in filas.values():
+            self.assertEqual(fila[4:], ['0', '0', '0'])
+
+        self.assertEqual(Retiro.objects.count(), 6)
+        self.assertTrue(all(rut_valido(rut) for rut in Beneficiario.objects.values_list('rut', flat=True)))
+
+
+class BloqueoBaseDatosTest(DatosBaseMixin, TestCase):
+    """carga_porteria cuenta bloqueos por el encabezado del servidor, no por la página de DEBUG"""
+
+    def buscar(self, error):
+        cliente = Client(raise_request_exception=False)
+        cliente.force_login(self.guardia)
+        sesion = cliente.session
+        sesion['planta_codigo'] = self.planta.codigo
+        sesion.save()
+        with mock.patch.object(Beneficiario.objects, 'get', side_effect=error), \
+                self.assertLogs('django.request', 'ERROR'):
+            return cliente.get(reverse('guardia_buscar_rut'), {'rut': self.beneficiario.rut})
+
+    def test_encabezado_de_bloqueo_y_clasificacion(self):
+        comando = CargaPorteria()
+        response = self.buscar(OperationalError('database is locked'))
+        self.assertEqual((response.status_code, response['X-Bloqueo-BD']), (500, '1'))
+        self.assertEqual(comando._estado(response.status_code, response.headers, False), 'bloqueo')
+
+        response = self.buscar(OperationalError('no such table: registroCajas_beneficiario'))
+        self.assertNotIn('X-Bloqueo-BD', response.headers)
+        self.assertEqual(comando._estado(response.status_code, response.headers, False), 'error')
+
+
+class GenerarDatosTest(DatosBaseMixin, TestCase):
+
+    def test_campana_sintetica_pequena(self):
+        # Un guardia por planta: generar_datos los asigna como confirmado_por
+        for codigo, nombre in (('valparaiso_bif', 'Valparaíso Planta BIF'), ('valparaiso_bic', 'Valparaíso Planta BIC')):
+            planta = Planta.objects.create(codigo=codigo, nombre=nombre)
+            guardia = User.objects.create_user(f'guardia_{codigo}')
+            Perfil.objects.create(user=guardia, rol='guardia', planta=planta, nombre_completo=f'Guardia {nombre}')
+
+        salida = io.StringIO()
+        call_command(
+            'generar_datos', beneficiarios=40, dias=3, retirados=0.5, autorizaciones=0.2, agendas=0.2,
+            semilla=1, stdout=salida
+        )
+
+        campana = Campana.objects.exclude(id=self.campana.id).get()
+        self.assertEqual(campana.fecha_fin, timezone.localdate() - timedelta(days=1))
+        self.assertEqual(campana.beneficiarios.count(), 40)
+        self.assertEqual(Planta.objects.count(), 3)
+        self.assertEqual(DiaBloquedo.objects.filter(campana=campana).count(), 1)
+
+        retiros = Retiro.objects.filter(beneficiario__campana=campana)
+        self.assertIn(f'40 beneficiarios, {retiros.count()} retiros', salida.getvalue())
+        self.assertTrue(retiros.exists())
+        self.assertFalse(retiros.filter(confirmado_por__isnull=True).exists())
+        self.assertFalse(retiros.exclude(confirmado_por__perfil__planta=F('beneficiario__planta')).exists())
+
+        ruts = list(campana.beneficiarios.values_list('rut', flat=True))
+        ruts += [r for r in retiros.values_list('rut_tercero', flat=True) if r]
+        ruts += list(AutorizacionTercero.objects.filter(beneficiario__campana=campana).values_list('rut_tercero', flat=True))
+        self.assertTrue(all(rut_valido(rut) for rut in ruts))
+        self.assertEqual(len(set(campana.beneficiarios.values_list('codigo_caja', flat=True))), 40)
+
+
+class PurgaCampanaTest(DatosBaseMixin, TestCase):
+
+    def test_elimina_campana_y_dependientes(self):
+        otro = Beneficiario.objects.create(
+            campana=self.campana, nombre='María González', rut='11.111.111-1',
+            tipo_contrato='fijo', planta=self.planta
+        )
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+        AgendaRetiro.objects.create(beneficiario=otro, fecha_agendada=self.campana.fecha_inicio)
+        DiaBloquedo.objects.create(campana=self.campana, fecha=self.campana.fecha_fin)
+
+        conteos = purgar_campana(self.campana.id, tamano_lote=1)
+
+        self.assertEqual(conteos['Beneficiario'], 2)
+        self.assertEqual(conteos['Retiro'], 1)
+        self.assertEqual(conteos['AgendaRetiro'], 1)
+        self.assertEqual(conteos['DiaBloquedo'], 1)
+        self.assertEqual(conteos['Campana'], 1)
+        self.assertFalse(Beneficiario.objects.exists())
+        self.assertFalse(Campana.objects.exists())
+
+    def test_retoma_campanas_en_eliminacion(self):
+        # Purga interrumpida: ya se borró un lote y la campaña sigue oculta
+        otro = Beneficiario.objects.create(
+            campana=self.campana, nombre='María González', rut='11.111.111-1',
+            tipo_contrato='fijo', planta=self.planta
+        )
+        Retiro.objects.create(beneficiario=otro, confirmado_por=self.guardia)
+        self.beneficiario.delete()
+        Campana.objects.filter(id=self.campana.id).update(activa=False, estado_carga='eliminando')
+        completa = Campana.objects.create(
+            nombre='Otra', fecha_inicio=self.campana.fecha_inicio, fecha_fin=self.campana.fecha_fin,
+            planta=self.planta, creado_por=self.admin
+        )
+
+        call_command('purgar_campana', pendientes=True, stdout=io.StringIO())
+
+        self.assertEqual(list(Campana.objects.values_list('id', flat=True)), [completa.id])
+        self.assertFalse(Retiro.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ArchivoCampanaTest(DatosBaseMixin, TestCase):
+
+    def test_archivar_consultar_y_restaurar(self):
+        retiro = Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+        # El serializador JSON guarda los datetimes con milisegundos
+        fecha_retiro = retiro.fecha_hora.replace(microsecond=retiro.fecha_hora.microsecond // 1000 * 1000)
+        Campana.objects.filter(id=self.campana.id).update(activa=False)
+        self.campana.refresh_from_db()
+
+        archivada = archivar_campana(self.campana)
+        self.assertEqual(archivada.total_beneficiarios, 1)
+        self.assertEqual(archivada.total_entregados, 1)
+        self.assertFalse(Beneficiario.objects.exists())
+
+        self.login(self.admin)
+        response = self.client.get(reverse('admin_archivo_detalle', args=[archivada.id]))
+        self.assertContains(response, self.beneficiario.rut)
+
+        campana = restaurar_campana(archivada)
+        self.assertEqual(campana.id, self.campana.id)
+        self.assertFalse(CampanaArchivada.objects.exists())
+        self.assertEqual(Retiro.objects.get().fecha_hora, fecha_retiro)
+
+    def test_no_archiva_campana_activa(self):
+        with self.assertRaises(ValueError):
+            archivar_campana(self.campana)
+
+
+class PresupuestoConsultasMixin:
+    """
+    Presupuesto de consultas SQL por nombre de vista.
+
+    Usa el registro que ConsultasMiddleware deja en cada petición y falla
+    si la vista ejecuta más consultas que las declaradas en `presupuestos`.
+    """
+    presupuestos = {}
+
+    def assertPresupuestoConsultas(self, response):
+        vista = response.resolver_match.view_name
+        self.assertIn(vista, self.presupuestos, f'La vista {vista} no tiene presupuesto de consultas')
+        registro = response.wsgi_request.consultas
+        duplicadas = '\n'.join(f'  {veces}x {sql}' for sql, veces in registro.duplicadas.items())
+        self.assertLessEqual(
+            registro.total, self.presupuestos[vista],
+            f'{vista} ejecutó {registro.total} consultas (presupuesto {self.presupuestos[vista]})\n{duplicadas}'
+        )
+
+
+class PresupuestoConsultasTest(PresupuestoConsultasMixin, DatosBaseMixin, TestCase):
+    """Las vistas de listado no deben crecer en consultas con la cantidad de filas"""
+    presupuestos = {
+        'lista_diaria': 4,
+        'admin_gestionar_cargas': 4,
+        'admin_detalle_carga': 5,
+        'admin_detalle_carga_beneficiarios': 5,
+        'admin_home': 10,
+        'guardia_home': 5,
+        'admin:registroCajas_beneficiario_changelist': 9,
+        'admin:registroCajas_campana_changelist': 7,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin.is_staff = cls.admin.is_superuser = True
+        cls.admin.save()
+        for i in range(20):
+            benef = Beneficiario.objects.create(
+                campana=cls.campana, nombre=f'Trabajador {i:02d}', rut=f'9.{i:03d}.111-1',
+                tipo_contrato='fijo' if i % 3 else 'indefinido', planta=cls.planta
+            )
+            if i % 2:
+                Retiro.objects.create(beneficiario=benef, confirmado_por=cls.guardia)
+
+    def setUp(self):
+        super().setUp()
+        # Se mide con el registro de campañas activas ya cargado, como en producción
+        obtener_registro()
+
+    def test_vistas_admin(self):
+        self.login(self.admin)
+        for url in [
+            reverse('lista_diaria'),
+            reverse('admin_gestionar_cargas'),
+            reverse('admin_detalle_carga', args=[self.campana.id]),
+            reverse('admin_detalle_carga_beneficiarios', args=[self.campana.id]) + f'?planta={self.planta.id}&estado=pendiente',
+            reverse('admin_home'),
+            reverse('admin:registroCajas_beneficiario_changelist'),
+            reverse('admin:registroCajas_campana_changelist'),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertPresupuestoConsultas(response)
+
+    def test_vistas_guardia(self):
+        self.login(self.guardia)
+        response = self.client.get(reverse('guardia_home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertPresupuestoConsultas(response)
+
+
+class PerfiladorTest(DatosBaseMixin, TestCase):
+
+    def test_solo_staff_fuerza_perfil_y_el_muestreo_guarda_cualquier_rol(self):
+        with override_settings(PERFILADOR_DIR=tempfile.mkdtemp()):
+            self.client.get(reverse('login'), {'perfilar': '1'})  # anónimo
+            self.login(self.guardia)
+            with mock.patch('registroCajas.middleware.cProfile.Profile') as perfilador:
+                self.client.get(reverse('guardia_home'), {'perfilar': '1'})
+            perfilador.assert_not_called()  # ni siquiera se activa cProfile
+            self.assertEqual(perfiles_capturados(), [])
+
+            # Petición de guardia elegida por muestreo: se guarda
+            with override_settings(PERFILADOR_MUESTREO=1):
+                self.client.get(reverse('guardia_home'))
+            self.assertEqual([p['vista'] for p in perfiles_capturados()], ['guardia_home'])
+
+            self.login(self.admin)
+            self.client.get(reverse('admin_home'), HTTP_X_PERFILAR='1')
+            perfiles = perfiles_capturados()
+            self.assertCountEqual([p['vista'] for p in perfiles], ['guardia_home', 'admin_home'])
+
+            nombre = next(p['nombre'] for p in perfiles if p['vista'] == 'admin_home')
+            response = self.client.get(reverse('admin_perfiles'), {'perfil': nombre})
+            self.assertContains(response, 'cumulative')
+
+    @override_settings(PERFILADOR_MUESTREO=1)
+    def test_perfilador_ocupado_atiende_sin_perfilar(self):
+        self.login(self.guardia)
+        with override_settings(PERFILADOR_DIR=tempfile.mkdtemp()):
+            # Otra petición del proceso ya está perfilando
+            with middleware._perfilando, mock.patch('registroCajas.middleware.cProfile.Profile') as perfilador:
+                response = self.client.get(reverse('guardia_home'))
+            self.assertEqual(response.status_code, 200)
+            perfilador.assert_not_called()
+
+            # cProfile rechaza activarse (Python 3.12+ con otro perfilador en sys.monitoring)
+            with mock.patch('registroCajas.middleware.cProfile.Profile') as perfilador:
+                perfilador.return_value.enable.side_effect = ValueError('Another profiling tool is already active')
+                response = self.client.get(reverse('guardia_home'))
+            self.assertEqual(response.status_code, 200)
+            perfilador.return_value.disable.assert_not_called()
+            self.assertEqual(perfiles_capturados(), [])
+            self.assertFalse(middleware._perfilando.locked())
+
+
+class MetricasTest(DatosBaseMixin, TestCase):
+
+    def valor(self, texto, muestra):
+        for linea in texto.splitlines():
+            if linea.startswith(muestra + ' '):
+                return float(linea.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_escaneos_y_suma_entre_procesos(self):
+        directorio = tempfile.mkdtemp()
+        entregado = 'registro_retiros_total{planta="casablanca",guardia="guardia",modo="qr"}'
+        no_encontrado = 'registro_escaneos_fallidos_total{planta="casablanca",motivo="rut_no_encontrado"}'
+
+        scraper = Client(HTTP_AUTHORIZATION='Bearer secreto')
+        with override_settings(METRICAS_DIR=directorio, METRICAS_TOKEN='secreto'):
+            antes = scraper.get(reverse('metricas')).content.decode()
+
+            self.login(self.guardia)
+            self.client.get(reverse('guardia_escanear_qr'), {'codigo': generar_token_qr(self.beneficiario)})
+            self.client.get(reverse('guardia_buscar_rut'), {'rut': '11.111.111-1'})
+
+            # Otro worker (ya terminado) que volcó sus valores en el mismo directorio
+            with open(os.path.join(directorio, '999999.json'), 'w') as f:
+                json.dump({'registro_retiros_total': [[['casablanca', 'guardia', 'qr'], 2]]}, f)
+
+            response = scraper.get(reverse('metricas'))
+            # Sus valores pasan al acumulado y el contador no baja en la siguiente lectura
+            self.assertFalse(os.path.exists(os.path.join(directorio, '999999.json')))
+            despues = scraper.get(reverse('metricas')).content.decode()
+            self.assertEqual(self.valor(despues, entregado), self.valor(response.content.decode(), entregado))
+
+        texto = response.content.decode()
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertEqual(self.valor(texto, entregado) - self.valor(antes, entregado), 3)
+        self.assertEqual(self.valor(texto, no_encontrado) - self.valor(antes, no_encontrado), 1)
+        self.assertIn('registro_peticion_segundos_bucket{vista="guardia_buscar_rut",metodo="GET",le="+Inf"}', texto)
+
+    def test_volcado_pendiente_por_hilo_y_al_salir(self):
+        directorio = tempfile.mkdtemp()
+        registro = metricas.Registro()
+        contador = registro.contador('prueba_total', 'Prueba')
+        archivo = os.path.join(directorio, f'{os.getpid()}.json')
+
+        with override_settings(METRICAS_DIR=directorio, METRICAS_INTERVALO=60), \
+                mock.patch.object(metricas.threading, 'Thread') as hilo, \
+                mock.patch.object(metricas.atexit, 'register') as al_salir:
+            contador.inc()     # primer volcado
+            contador.inc(2)    # dentro del intervalo: queda pendiente
+            with open(archivo) as f:
+                self.assertEqual(json.load(f)['prueba_total'], [[[], 1]])
+            hilo.assert_called_once()
+            al_salir.assert_called_once_with(registro.volcar_pendiente)
+
+            registro.volcar_pendiente()  # lo que hacen el hilo y atexit
+            with open(archivo) as f:
+                self.assertEqual(json.load(f)['prueba_total'], [[[], 3]])
+
+    @override_settings(METRICAS_TOKEN='secreto')
+    def test_token_requerido(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 401)
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICAS_TOKEN='')
+    def test_sin_token_configurado_solo_administradores(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+
+        self.login(self.guardia)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 401)
+        self.login(self.admin)
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 200)
+
+
+@override_settings(SSE_DURACION=0)
+class EventosPanelTest(DatosBaseMixin, TestCase):
+
+    def leer(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_guardia_recibe_solo_retiros_de_su_planta(self):
+        otra = Planta.objects.create(codigo='valparaiso_bif', nombre='Valparaíso BIF')
+        ajeno = Beneficiario.objects.create(
+            campana=self.campana, nombre='Pedro Soto', rut='11.111.111-1',
+            tipo_contrato='indefinido', planta=otra
+        )
+        Retiro.objects.create(beneficiario=ajeno, confirmado_por=self.admin)
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+
+        self.login(self.guardia)
+        response = self.client.get(reverse('eventos_panel'), HTTP_LAST_EVENT_ID='0.0')
+        texto = self.leer(response)
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('Juan Pérez', texto)
+        self.assertNotIn('Pedro Soto', texto)
+        self.assertIn('event: contadores\ndata: {"entregados": 1, "pendientes": 0, "hoy": 1}', texto)
+
+    def test_contador_de_hoy_excluye_retiros_con_fecha_anterior(self):
+        otro = Beneficiario.objects.create(
+            campana=self.campana, nombre='María González', rut='11.111.111-1',
+            tipo_contrato='fijo', planta=self.planta
+        )
+        papel = Retiro.objects.create(beneficiario=otro, confirmado_por=self.admin)
+        Retiro.objects.filter(id=papel.id).update(fecha_hora=timezone.now() - timedelta(days=2))
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+
+        self.login(self.guardia)
+        texto = self.leer(self.client.get(reverse('eventos_panel'), HTTP_LAST_EVENT_ID='0.0'))
+        self.assertIn('event: contadores\ndata: {"entregados": 2, "pendientes": 0, "hoy": 1}', texto)
+
+    def test_retiro_confirmado_tarde_bajo_el_cursor_no_se_pierde(self):
+        """En PostgreSQL un id menor puede confirmarse después de que el cursor lo pasó"""
+        otro = Beneficiario.objects.create(
+            campana=self.campana, nombre='María González', rut='11.111.111-1',
+            tipo_contrato='fijo', planta=self.planta
+        )
+        tardio = Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+        posterior = Retiro.objects.create(beneficiario=otro, confirmado_por=self.guardia)
+
+        # El panel ya avanzó hasta `posterior` sin haber visto `tardio`
+        self.login(self.guardia)
+        texto = self.leer(self.client.get(reverse('eventos_panel'), HTTP_LAST_EVENT_ID=f'{posterior.id}.0'))
+        self.assertIn(f'"id": {tardio.id}', texto)
+        self.assertIn('event: contadores\ndata: {"entregados": 2, "pendientes": 0, "hoy": 2}', texto)
+        self.assertTrue(texto.endswith(f'id: {posterior.id}.0\n\n'))
+
+        # Dentro de un mismo flujo el solape no repite lo ya enviado
+        enviados = set()
+        eventos, ultimo = _vuelta(self.planta, None, (posterior.id, 0), enviados)
+        self.assertEqual(len(eventos), 3)
+        self.assertEqual(_vuelta(self.planta, None, ultimo, enviados)[0], [])
+
+    async def test_flujo_asincrono_bajo_asgi(self):
+        retiro = await sync_to_async(Retiro.objects.create)(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+        await self.async_client.aforce_login(self.admin)
+
+        response = await self.async_client.get(reverse('eventos_panel'), headers={'Last-Event-ID': '0.0'})
+        self.assertTrue(response.is_async)
+        texto = ''.join([parte.decode() async for parte in response.streaming_content])
+        self.assertIn('Juan Pérez', texto)
+        self.assertTrue(texto.endswith(f'id: {retiro.id}.0\n\n'))  # cursor para reconectar
+
+    def test_sin_last_event_id_solo_envia_lo_nuevo(self):
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+        DiaBloquedo.objects.create(campana=self.campana, fecha=timezone.localdate(), bloqueado_por=self.admin)
+
+        self.login(self.admin)
+        texto = self.leer(self.client.get(reverse('eventos_panel'), {'campana': self.campana.id}))
+        self.assertNotIn('event: retiro', texto)
+
+        texto = self.leer(self.client.get(
+            reverse('eventos_panel'), {'campana': self.campana.id}, HTTP_LAST_EVENT_ID='0.0'
+        ))
+        self.assertIn('event: retiro', texto)
+        self.assertIn('event: bloqueo', texto)
+
+
+class TokenQRTest(DatosBaseMixin, TestCase):
+
+    def test_verificacion_sin_base_de_datos(self):
+        token = generar_token_qr(self.beneficiario, ahora=1_000_000)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                verificar_token_qr(token, ahora=1_000_000),
+                (self.beneficiario.id, self.campana.id)
+            )
+            partes = token.split('.')
+            partes[1] = partes[1] + '0'  # otro beneficiario con la misma firma
+            falso = '.'.join(partes)
+            for codigo, motivo in ((falso, 'firma'), ('12.345.678-5', 'formato')):
+                with self.assertRaises(TokenInvalido) as ctx:
+                    verificar_token_qr(codigo, ahora=1_000_000)
+                self.assertEqual(ctx.exception.motivo, motivo)
+            with self.assertRaises(TokenInvalido) as ctx:
+                verificar_token_qr(token, ahora=1_000_000 + 601)
+            self.assertEqual(ctx.exception.motivo, 'expirado')
+
+    def test_escaneo_registra_entrega(self):
+        self.login(self.guardia)
+        token = generar_token_qr(self.beneficiario)
+
+        # Un RUT sin firmar solo se busca; la entrega exige el token
+        response = self.client.get(reverse('guardia_buscar_rut'), {'rut': self.beneficiario.rut, 'auto': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Retiro.objects.exists())
+
+        response = self.client.get(reverse('guardia_escanear_qr'), {'codigo': token[:-1] + 'x'})
+        self.assertRedirects(response, reverse('guardia_scanner'))
+        self.assertFalse(Retiro.objects.exists())
+
+        response = self.client.get(reverse('guardia_escanear_qr'), {'codigo': token})
+        self.assertTrue(response['Location'].startswith(reverse('guardia_confirmar_exitoso') + '?r='))
+        self.assertEqual(Retiro.objects.get().beneficiario, self.beneficiario)
+
+
+@unittest.skipUnless(
+    all(importlib.util.find_spec(m) for m in ('qrcode', 'PIL', 'reportlab')),
+    'Requiere qrcode, Pillow y reportlab'
+)
+class EtiquetasTest(DatosBaseMixin, TestCase):
+
+    def test_cache_por_contenido(self):
+        with override_settings(ETIQUETAS_CACHE_DIR=tempfile.mkdtemp(), ETIQUETAS_PROCESOS=1):
+            archivo = io.BytesIO()
+            resultado = generar_pdf_etiquetas(self.campana, archivo)
+            self.assertEqual((resultado['renderizadas'], resultado['paginas']), (1, 1))
+            self.assertTrue(archivo.getvalue().startswith(b'%PDF'))
+
+            Beneficiario.objects.create(
+                campana=self.campana, nombre='María Soto', rut='11.111.111-1',
+                tipo_contrato='indefinido', planta=self.planta
+            )
+            resultado = generar_pdf_etiquetas(self.campana, io.BytesIO())
+            self.assertEqual((resultado['renderizadas'], resultado['reutilizadas']), (1, 1))
+
+            # Las imágenes que la generación ya no usa se eliminan del caché
+            Beneficiario.objects.filter(rut='11.111.111-1').delete()
+            generar_pdf_etiquetas(self.campana, io.BytesIO())
+            directorio = os.path.join(settings.ETIQUETAS_CACHE_DIR, str(self.campana.id))
+            self.assertEqual(len(os.listdir(directorio)), 1)
+
+    def test_qr_de_etiqueta_no_registra_entregas(self):
+        self.beneficiario.refresh_from_db()
+        etiqueta, = datos_etiquetas(self.campana)
+        self.assertEqual(etiqueta['qr'], self.beneficiario.codigo_caja)
+
+        self.login(self.guardia)
+        response = self.client.get(reverse('guardia_escanear_qr'), {'codigo': etiqueta['qr']})
+        self.assertRedirects(response, reverse('guardia_scanner'))
+        self.assertFalse(Retiro.objects.exists())
+
+    def test_descarga_del_pdf_generado(self):
+        self.login(self.admin)
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp(), ETIQUETAS_CACHE_DIR=tempfile.mkdtemp()):
+            url = reverse('admin_descargar_etiquetas', args=[self.campana.id])
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+            ruta_pdf(self.campana.id).parent.mkdir(parents=True)
+            generar_pdf_etiquetas(self.campana, str(ruta_pdf(self.campana.id)), procesos=1)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+
+class TokenDispositivoTest(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        limpiar_cache()
+        self.dispositivo, self.token = emitir_token('Portería Norte', self.planta, self.guardia)
+        self.cabecera = {'HTTP_AUTHORIZATION': f'Dispositivo {self.token}'}
+
+    def test_escaneo_con_token_sin_sesion(self):
+        codigo = generar_token_qr(self.beneficiario)
+        response = self.client.post(reverse('api_escanear'), {'codigo': codigo}, **self.cabecera)
+        self.assertEqual(response.json()['ok'], True)
+        self.assertEqual(Retiro.objects.get().confirmado_por, self.guardia)
+        self.assertNotIn('sessionid', response.cookies)
+
+        # Verificación servida desde el caché: sin consulta al token
+        with self.assertNumQueries(1):  # beneficiario por pk (con su retiro)
+            response = self.client.post(reverse('api_escanear'), {'codigo': codigo}, **self.cabecera)
+        self.assertEqual(response.status_code, 409)
+
+    def test_token_solo_abre_las_vistas_de_escaneo(self):
+        cliente = Client(enforce_csrf_checks=True)
+        bloqueadas = [
+            (reverse('guardia_confirmar', args=[self.beneficiario.id]), {'retira_titular': 'on'}),
+            (reverse('api_registro_masivo'), {}),
+            (reverse('guardia_retiro_tercero'), {'rut_tercero': '11.111.111-1'}),
+        ]
+        for url, datos in bloqueadas:
+            response = cliente.post(url, datos, **self.cabecera)
+            self.assertIn(response.status_code, (401, 403), url)
+        self.assertFalse(Retiro.objects.exists())
+
+        # Sin token, el escaneo por sesión sigue exigiendo CSRF
+        cliente.force_login(self.guardia)
+        response = cliente.post(reverse('api_escanear'), {'codigo': generar_token_qr(self.beneficiario)})
+        self.assertEqual(response.status_code, 403)
+        cliente.logout()
+
+        response = cliente.get(
+            reverse('guardia_escanear_qr'), {'codigo': generar_token_qr(self.beneficiario)}, **self.cabecera
+        )
+        self.assertTrue(response['Location'].startswith(reverse('guardia_confirmar_exitoso')))
+        self.assertEqual(Retiro.objects.get().confirmado_por, self.guardia)
+
+    def test_revocar_desde_pantalla_admin(self):
+        self.login(self.admin)
+        self.assertContains(self.client.get(reverse('admin_dispositivos')), self.token[:8])
+        self.client.post(reverse('admin_revocar_dispositivo', args=[self.dispositivo.id]))
+
+        self.client.logout()
+        response = self.client.post(reverse('api_escanear'), {'codigo': 'x'}, **self.cabecera)
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(CACHES=caches_locales('sesiones-test'))
+class SesionesGuardiaTest(DatosBaseMixin, TestCase):
+
+    def test_escaneo_sin_escrituras_de_sesion(self):
+        self.login(self.guardia)
+        codigo = generar_token_qr(self.beneficiario)
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('guardia_escanear_qr'), {'codigo': codigo})
+        self.assertFalse([c for c in consultas.captured_queries if 'django_session' in c['sql']])
+
+        response = self.client.get(response['Location'])
+        retiro = Retiro.objects.get()
+        self.assertEqual(retiro.beneficiario, self.beneficiario)
+        self.assertContains(response, retiro.codigo_caja)
+        self.assertContains(response, self.beneficiario.nombre)
+
+        # Parámetro alterado: no se muestra nada
+        response = self.client.get(reverse('guardia_confirmar_exitoso'), {'r': '1:falso'})
+        self.assertRedirects(response, reverse('guardia_home'))
+
+
+class ProvisionTrabajadoresTest(DatosBaseMixin, TestCase):
+
+    def test_provision_y_activacion(self):
+        Beneficiario.objects.create(
+            campana=self.campana, nombre='María Soto', rut='11.111.111-1',
+            tipo_contrato='indefinido', planta=self.planta
+        )
+        trabajador = User.objects.create_user('existente')
+        Perfil.objects.create(user=trabajador, rol='trabajador', rut='11.111.111-1', nombre_completo='María Soto')
+
+        creados, omitidos = provisionar_trabajadores(self.campana)
+        self.assertEqual((len(creados), omitidos), (1, 1))
+        user = User.objects.get(username='12345678-5')
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual((user.perfil.rol, user.perfil.rut), ('trabajador', '12.345.678-5'))
+
+        url = reverse('activar_cuenta', args=[token_activacion(user)])
+        response = self.client.post(url, {'password': 'caja-navidad-24', 'password_confirmacion': 'caja-navidad-24'})
+        self.assertRedirects(response, reverse('trabajador_home'))
+        self.assertTrue(User.objects.get(pk=user.pk).check_password('caja-navidad-24'))
+
+        # El enlace deja de servir una vez usado
+        self.client.logout()
+        self.assertRedirects(self.client.get(url), reverse('login'))
+
+    def test_login_sin_activar_no_revela_la_cuenta(self):
+        provisionar_trabajadores(self.campana)
+        sin_activar = self.client.post(reverse('login'), {'username': '12345678-5', 'password': 'x'})
+        inexistente = self.client.post(reverse('login'), {'username': '99999999-9', 'password': 'x'})
+        self.assertContains(sin_activar, 'Usuario o contraseña incorrectos')
+        self.assertNotContains(sin_activar, 'activada')
+        self.assertEqual(
+            [str(m) for m in sin_activar.context['messages']],
+            [str(m) for m in inexistente.context['messages']],
+        )
+
+    def test_reemitir_enlaces_pendientes(self):
+        Beneficiario.objects.create(
+            campana=self.campana, nombre='María Soto', rut='11.111.111-1',
+            tipo_contrato='indefinido', planta=self.planta
+        )
+        provisionar_trabajadores(self.campana, tamano_lote=1)
+        activado = User.objects.get(username='11111111-1')
+        activado.set_password('caja-navidad-24')
+        activado.save()
+
+        salida = os.path.join(tempfile.mkdtemp(), 'enlaces.csv')
+        call_command(
+            'provisionar_trabajadores', self.campana.id, reemitir=True, lote=1,
+            enlaces=salida, stderr=io.StringIO()
+        )
+        with open(salida, encoding='utf-8') as f:
+            filas = f.read().splitlines()[1:]
+        # Solo la cuenta sin activar recibe un enlace nuevo, y sirve
+        self.assertEqual([fila.split(';')[0] for fila in filas], ['12345678-5'])
+        enlace = filas[0].split(';')[2]
+        self.assertEqual(self.client.get(enlace).status_code, 200)
+
+
+@override_settings(CACHES=caches_locales('calendario'))
+class CalendarioBloqueosTest(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        obtener_registro()
+
+    def test_lote_y_invalidacion_desde_emergencia(self):
+        otra = Campana.objects.create(
+            nombre='Otra', fecha_inicio=self.campana.fecha_inicio - timedelta(days=1), fecha_fin=self.campana.fecha_fin,
+            planta=self.planta, activa=False
+        )
+        beneficiarios = [self.beneficiario] + [
+            Beneficiario.objects.create(
+                campana=otra, nombre=f'Persona {i}', rut=f'1{i}.111.111-1',
+                tipo_contrato='indefinido', planta=self.planta
+            ) for i in range(3)
+        ]
+        hoy = timezone.localdate()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(all(pueden_retirar(beneficiarios, hoy).values()))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.beneficiario.puede_retirar_hoy())
+
+        self.login(self.admin)
+        self.client.post(reverse('admin_emergencia'), {'fecha': hoy.isoformat(), 'motivo': 'emergencia'})
+        resultado = pueden_retirar(beneficiarios, hoy)
+        self.assertFalse(resultado[self.beneficiario.id])
+        self.assertEqual(sum(resultado.values()), 3)
+
+        bloqueo = DiaBloquedo.objects.get(campana=self.campana)
+        self.client.get(reverse('admin_eliminar_bloqueo', args=[bloqueo.id]))
+        self.assertTrue(self.beneficiario.puede_retirar_hoy())
+
+
+@override_settings(CACHES=caches_locales('campanas-activas'))
+class CampanasActivasTest(DatosBaseMixin, TestCase):
+
+    def test_registro_en_cache_e_invalidacion(self):
+        registro = obtener_registro()
+        self.assertEqual(registro.ids, [self.campana.id])
+        with self.assertNumQueries(0):
+            self.assertIs(obtener_registro().reciente, registro.reciente)
+
+        # Otro worker cambió el sello compartido: se recarga
+        caches['compartido'].set(CLAVE_VERSION, 'otro-worker')
+        with self.assertNumQueries(2):
+            obtener_registro()
+
+        self.campana.activa = False
+        self.campana.save()
+        self.assertEqual(obtener_registro().ids, [])
+
+        self.login(self.guardia)
+        response = self.client.get(reverse('guardia_buscar_rut'), {'rut': self.beneficiario.rut})
+        self.assertContains(response, 'No se encontró beneficiario')
+
+    def test_dias_bloqueados_en_registro(self):
+        hoy = timezone.localdate()
+        DiaBloquedo.objects.create(campana=self.campana, fecha=hoy, motivo='emergencia')
+        self.assertEqual(obtener_registro().dias_bloqueados(self.campana.id), {hoy})
+        with self.assertNumQueries(0):
+            self.assertFalse(self.beneficiario.puede_retirar_hoy())
+
+
+class RegistroMasivoTest(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.otra_planta = Planta.objects.create(codigo='rosario', nombre='Rosario')
+        self.segundo = Beneficiario.objects.create(
+            campana=self.campana, nombre='Pedro Rojas', rut='11.111.111-1', tipo_contrato='fijo', planta=self.planta
+        )
+        self.entregado = Beneficiario.objects.create(
+            campana=self.campana, nombre='Luis Díaz', rut='22.222.222-2', tipo_contrato='fijo', planta=self.planta
+        )
+        Retiro.objects.create(beneficiario=self.entregado, confirmado_por=self.guardia)
+        self.de_otra_planta = Beneficiario.objects.create(
+            campana=self.campana, nombre='Rosa Vera', rut='33.333.333-3', tipo_contrato='fijo', planta=self.otra_planta
+        )
+
+    def test_planilla_con_reporte_por_fila(self):
+        texto = '\n'.join([
+            'rut;hora;tercero;rut tercero',
+            '12345678-5;00:05',
+            f'{self.segundo.codigo_caja};00:10;María Soto;11.111.111-1',
+            '12.345.678-5;00:20',
+            '99.999.999-9;00:30',
+            '22.222.222-2;00:40',
+            '33.333.333-3;25:00',
+        ])
+        self.login(self.admin)
+        response = self.client.post(reverse('admin_registro_masivo'), {'texto': texto})
+        motivos = [r['motivo'] for r in response.context['reporte']]
+        self.assertEqual(motivos, [None, None, 'duplicada', 'no_encontrado', 'ya_entregada', 'fecha'])
+
+        retiro = Retiro.objects.get(beneficiario=self.beneficiario)
+        self.assertEqual(timezone.localtime(retiro.fecha_hora).strftime('%H:%M'), '00:05')
+        self.assertEqual(retiro.origen, 'papel')
+        tercero = Retiro.objects.get(beneficiario=self.segundo)
+        self.assertEqual((tercero.retirado_por_tercero, tercero.nombre_tercero), (True, 'María Soto'))
+
+    def test_planta_no_numerica_registra_sin_filtro(self):
+        self.login(self.admin)
+        response = self.client.post(reverse('admin_registro_masivo'), {'texto': '33.333.333-3;00:05', 'planta': 'abc'})
+        self.assertEqual([r['motivo'] for r in response.context['reporte']], [None])
+        response = self.client.post(
+            reverse('admin_registro_masivo'), {'texto': '11.111.111-1;00:05', 'planta': self.otra_planta.id}
+        )
+        self.assertEqual([r['motivo'] for r in response.context['reporte']], ['otra_planta'])
+
+    def test_api_restringe_a_la_planta_del_guardia(self):
+        self.login(self.guardia)
+        entregas = [
+            {'identificador': '33.333.333-3', 'fecha_hora': '00:15'},
+            {'identificador': self.segundo.rut, 'fecha_hora': '00:15', 'nombre_tercero': 'Sin RUT'},
+            {'identificador': self.beneficiario.rut, 'fecha_hora': '00:15'},
+        ]
+        response = self.client.post(
+            reverse('api_registro_masivo'), json.dumps({'entregas': entregas}), content_type='application/json'
+        )
+        datos = response.json()
+        self.assertEqual([f['motivo'] for f in datos['filas']], ['otra_planta', 'tercero', None])
+        self.assertEqual(datos['resumen'], {'total': 3, 'registradas': 1, 'conflictos': 2})
+
+
+class RetiroTerceroTest(DatosBaseMixin, TestCase):
+
+    def test_lote_de_autorizaciones_vigentes(self):
+        hoy = timezone.localdate()
+        companeros = [
+            Beneficiario.objects.create(
+                campana=self.campana, nombre=f'Compañero {i}', rut=f'1{i}.111.111-1',
+                tipo_contrato='fijo', planta=self.planta
+            ) for i in range(4)
+        ]
+        rut = '11.111.111-1'
+        AutorizacionTercero.objects.create(beneficiario=self.beneficiario, nombre_tercero='María Soto', rut_tercero=rut, fecha_autorizada=hoy)
+        AutorizacionTercero.objects.create(beneficiario=companeros[0], nombre_tercero='María Soto', rut_tercero=rut,
+                                           fecha_autorizada=hoy - timedelta(days=3), solo_una_vez=False)
+        # No vigentes: de una sola vez para otro día, inactiva, futura
+        AutorizacionTercero.objects.create(beneficiario=companeros[1], nombre_tercero='María Soto', rut_tercero=rut,
+                                           fecha_autorizada=hoy - timedelta(days=1))
+        AutorizacionTercero.objects.create(beneficiario=companeros[2], nombre_tercero='María Soto', rut_tercero=rut,
+                                           fecha_autorizada=hoy, activa=False)
+        AutorizacionTercero.objects.create(beneficiario=companeros[3], nombre_tercero='María Soto', rut_tercero=rut,
+                                           fecha_autorizada=hoy + timedelta(days=1), solo_una_vez=False)
+
+        autorizaciones = AutorizacionTercero.objects.all()
+        esperadas = {a.beneficiario_id for a in autorizaciones if a.es_valida_para_fecha(hoy)}
+        obtenidas = autorizaciones_tercero('11111111-1', self.planta)
+        self.assertEqual({a.beneficiario_id for a in obtenidas}, esperadas)
+
+        self.login(self.guardia)
+        response = self.client.post(reverse('guardia_retiro_tercero'), {
+            'rut_tercero': rut, 'beneficiarios': [str(i) for i in esperadas] + [str(companeros[1].id)],
+        })
+        self.assertEqual([r['estado'] for r in response.context['reporte']], ['registrada', 'registrada'])
+        retiros = Retiro.objects.filter(retirado_por_tercero=True, rut_tercero=rut)
+        self.assertEqual({r.beneficiario_id for r in retiros}, esperadas)
+        self.assertEqual({r.origen for r in retiros}, {'tercero'})
+
+
+@override_settings(AGENDA_CAPACIDAD_HORA=1, AGENDA_HORARIO=(8, 10))
+class AgendaRetiroTest(DatosBaseMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(20):
+            Beneficiario.objects.create(
+                campana=self.campana, nombre=f'Turno {i:02d}', rut=f'2{i:02d}.111.111-1',
+                tipo_contrato='fijo', planta=self.planta
+            )
+        self.ahora = timezone.make_aware(datetime.combine(self.campana.fecha_inicio, time(7)))
+
+    def test_reparte_sin_superar_capacidad_y_salta_bloqueos(self):
+        manana = self.campana.fecha_inicio + timedelta(days=1)
+        DiaBloquedo.objects.create(campana=self.campana, fecha=manana)
+
+        # 11 días - 1 bloqueado = 10 días x 2 bloques x 1 persona
+        resultado = programar_retiros(ahora=self.ahora)
+        self.assertEqual(resultado, {'asignadas': 20, 'reprogramadas': 0, 'sin_cupo': 1})
+        bloques = list(AgendaRetiro.objects.values_list('fecha_agendada', 'hora_inicio'))
+        self.assertEqual(len(bloques), len(set(bloques)))
+        self.assertNotIn(manana, {fecha for fecha, _ in bloques})
+
+        # Un bloqueo de emergencia libera sus cupos y mueve a los agendados
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+        pasado = self.campana.fecha_inicio + timedelta(days=2)
+        DiaBloquedo.objects.create(campana=self.campana, fecha=pasado)
+        resultado = programar_retiros(ahora=self.ahora)
+        # Dos agendados ese día más el que no tenía cupo, y solo se liberó el bloque del que retiró
+        self.assertEqual((resultado['reprogramadas'], resultado['sin_cupo']), (1, 2))
+
+    def test_emergencia_solo_mueve_las_agendas_del_dia_bloqueado(self):
+        inicio = self.campana.fecha_inicio
+        bloqueado = inicio + timedelta(days=2)
+        turnos = list(Beneficiario.objects.filter(nombre__startswith='Turno').order_by('nombre'))
+        AgendaRetiro.objects.create(beneficiario=self.beneficiario, fecha_agendada=bloqueado, hora_inicio=time(8))
+        AgendaRetiro.objects.create(beneficiario=turnos[0], fecha_agendada=bloqueado, hora_inicio=time(9))
+        intacta = AgendaRetiro.objects.create(
+            beneficiario=turnos[1], fecha_agendada=inicio + timedelta(days=3), hora_inicio=time(8)
+        )
+
+        self.login(self.admin)
+        with mock.patch('registroCajas.views_admin.reprogramar_fecha', wraps=reprogramar_fecha) as reprogramar:
+            self.client.post(reverse('admin_emergencia'), {'fecha': bloqueado.isoformat(), 'motivo': 'emergencia'})
+        reprogramar.assert_called_once()
+
+        # Los 19 sin agenda siguen sin agenda: eso lo resuelve el comando programar_retiros
+        self.assertEqual(AgendaRetiro.objects.count(), 3)
+        bloques = list(AgendaRetiro.objects.values_list('fecha_agendada', 'hora_inicio'))
+        self.assertEqual(len(bloques), len(set(bloques)))  # capacidad 1 por bloque
+        self.assertNotIn(bloqueado, {fecha for fecha, _ in bloques})
+        self.assertEqual(AgendaRetiro.objects.get(id=intacta.id).fecha_agendada, intacta.fecha_agendada)
+
+        # Va al bloque libre más temprano que no esté bloqueado
+        DiaBloquedo.objects.create(campana=self.campana, fecha=intacta.fecha_agendada)
+        resultado = reprogramar_fecha(self.campana, intacta.fecha_agendada, ahora=self.ahora)
+        self.assertEqual(resultado, {'asignadas': 0, 'reprogramadas': 1, 'sin_cupo': 0})
+        ocupados = set(bloques) - {(intacta.fecha_agendada, intacta.hora_inicio)}
+        libres = [
+            (inicio + timedelta(days=d), time(h)) for d in range(11) for h in (8, 9)
+            if d not in (2, 3) and (inicio + timedelta(days=d), time(h)) not in ocupados
+        ]
+        self.assertEqual(AgendaRetiro.objects.values_list('fecha_agendada', 'hora_inicio').get(id=intacta.id), libres[0])
+
+    def test_llegadas_del_bloque_en_curso(self):
+        ahora = timezone.localtime()
+        AgendaRetiro.objects.create(
+            beneficiario=self.beneficiario, fecha_agendada=ahora.date(), hora_inicio=time(ahora.hour)
+        )
+        self.login(self.guardia)
+        response = self.client.get(reverse('guardia_llegadas'))
+        self.assertContains(response, self.beneficiario.nombre)
+        self.assertEqual(response.context['pendientes'], 1)
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), 'Requiere numpy')
+class SimulacionPorteriaTest(DatosBaseMixin, TestCase):
+
+    def test_historial_y_guardias_necesarios(self):
+        inicio = timezone.make_aware(datetime.combine(self.campana.fecha_inicio, time(9)))
+        for i in range(12):
+            beneficiario = Beneficiario.objects.create(
+                campana=self.campana, nombre=f'Cola {i:02d}', rut=f'3{i:02d}.111.111-1',
+                tipo_contrato='fijo', planta=self.planta
+            )
+            retiro = Retiro.objects.create(beneficiario=beneficiario, confirmado_por=self.guardia)
+            Retiro.objects.filter(id=retiro.id).update(fecha_hora=inicio + timedelta(minutes=i))
+
+        historial = simulacion.extraer_historial(self.planta, self.campana.fecha_inicio, self.campana.fecha_fin)
+        # Un guardia que entrega cada 60 s
+        self.assertEqual(sorted(set(historial['servicio'].tolist())), [60.0])
+        with tempfile.TemporaryDirectory() as directorio:
+            archivo = os.path.join(directorio, 'historial.npz')
+            simulacion.guardar_historial(historial, archivo)
+            historial = simulacion.cargar_historial(archivo)
+        self.assertEqual(len(historial['llegadas']), 12)
+
+        # Llegadas cada minuto y 3 minutos de atención: con uno se acumula la cola, con tres no
+        resultados = simulacion.simular(historial, guardias=[1, 3], servicio=180, semilla=1)
+        uno, tres = resultados
+        self.assertEqual(uno['cola_max'], 7)
+        self.assertEqual((tres['espera_p99'], tres['cola_max']), (0.0, 0))
+        self.assertEqual(simulacion.guardias_recomendados(resultados, objetivo_minutos=1), 3)
+
+
+class RendimientoGuardiaTest(DatosBaseMixin, TestCase):
+
+    def test_resumen_diario_reporte_y_csv(self):
+        hoy = timezone.localdate()
+        inicio = timezone.make_aware(datetime.combine(hoy, time(9)))
+        # Intervalos de 1 y 2 minutos; 27 y 35 minutos son pausas
+        for i, minutos in enumerate([0, 1, 3, 30, 65]):
+            beneficiario = Beneficiario.objects.create(
+                campana=self.campana, nombre=f'Turno {i}', rut=f'4{i:02d}.111.111-1',
+                tipo_contrato='fijo', planta=self.planta
+            )
+            retiro = Retiro.objects.create(
+                beneficiario=beneficiario, confirmado_por=self.guardia, retirado_por_tercero=(i == 0)
+            )
+            Retiro.objects.filter(id=retiro.id).update(fecha_hora=inicio + timedelta(minutes=minutos))
+        # Planilla en papel y retiro masivo a tercero: suman retiros, pero no son escaneos
+        for i, origen in enumerate(['papel', 'tercero']):
+            beneficiario = Beneficiario.objects.create(
+                campana=self.campana, nombre=f'Masivo {i}', rut=f'5{i:02d}.111.111-1',
+                tipo_contrato='fijo', planta=self.planta
+            )
+            retiro = Retiro.objects.create(
+                beneficiario=beneficiario, confirmado_por=self.guardia, origen=origen,
+                retirado_por_tercero=(origen == 'tercero')
+            )
+            Retiro.objects.filter(id=retiro.id).update(fecha_hora=inicio + timedelta(minutes=2))
+
+        self.assertEqual(actualizar_rendimiento(hoy, hoy), 1)
+        resumen = RendimientoGuardiaDia.objects.get(guardia=self.guardia)
+        self.assertEqual((resumen.retiros, resumen.retiros_tercero, resumen.escaneos, resumen.intervalos), (7, 2, 5, 2))
+        self.assertEqual((resumen.suma_intervalos, resumen.pausas, resumen.tiempo_inactivo), (180, 2, 3720))
+        self.assertEqual((resumen.horas_activas, resumen.maximo_por_hora), (2, 4))
+
+        self.login(self.admin)
+        response = self.client.get(reverse('admin_rendimiento'))
+        fila, = response.context['guardias']
+        self.assertEqual((fila['guardia'], fila['por_hora'], fila['intervalo_medio'], fila['pct_tercero']),
+                         ('Carlos Silva', 2.5, 90.0, 28.6))
+
+        response = self.client.get(reverse('admin_rendimiento'), {'formato': 'csv'})
+        lineas = response.content.decode().splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertIn('Carlos Silva;7;5;2.5;4;90.0;2;62;28.6;09:00;10:05', lineas[1])
+
+    def test_reporte_no_recalcula_y_resumen_unico(self):
+        hoy = timezone.localdate()
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+        self.login(self.admin)
+
+        # Abrir el reporte no escribe: el día en curso lo recalcula el cron o el botón
+        response = self.client.get(reverse('admin_rendimiento'))
+        self.assertEqual(response.context['guardias'], [])
+        self.assertFalse(RendimientoGuardiaDia.objects.exists())
+
+        response = self.client.post(reverse('admin_rendimiento') + f'?desde={hoy}&hasta={hoy}')
+        self.assertRedirects(response, reverse('admin_rendimiento') + f'?desde={hoy}&hasta={hoy}')
+        actualizar_rendimiento(hoy, hoy)
+        resumen = RendimientoGuardiaDia.objects.get()
+        self.assertEqual(resumen.retiros, 1)
+
+        resumen.pk = None
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            resumen.save()
+
+
+class ProyeccionesTest(DatosBaseMixin, TestCase):
+
+    def test_filas_equivalen_a_instancias(self):
+        Beneficiario.objects.create(
+            campana=self.campana, nombre='María Soto', rut='11.111.111-1', tipo_contrato='fijo', planta=self.planta
+        )
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+
+        with self.assertNumQueries(1):
+            filas = BeneficiarioFila.desde(self.campana.beneficiarios.order_by('nombre'))
+        for fila, b in zip(filas, self.campana.beneficiarios.select_related('planta').order_by('nombre')):
+            self.assertEqual(
+                (fila.nombre, fila.codigo_caja, fila.planta_nombre, fila.tiene_retiro, fila.get_tipo_contrato_display()),
+                (b.nombre, b.codigo_caja, b.planta.nombre, b.tiene_retiro(), b.get_tipo_contrato_display())
+            )
+        # Los valores repetidos se comparten entre filas
+        self.assertIs(filas[0].planta_nombre, filas[1].planta_nombre)
+        self.assertIs(filas[0].codigo_retiro, filas[0].codigo_caja)
+
+        self.login(self.admin)
+        response = self.client.get(reverse('lista_diaria'))
+        self.assertEqual([b.nombre for b in response.context['beneficiarios']], ['Juan Pérez', 'María Soto'])
+        self.assertContains(response, f'Código: {self.beneficiario.codigo_caja}')
+
+
+class DetalleCargaTest(DatosBaseMixin, TestCase):
+
+    def test_totales_agrupados_y_listado_paginado_por_planta(self):
+        otra = Planta.objects.create(codigo='valparaiso_bic', nombre='Valparaíso Planta BIC')
+        for i in range(60):
+            Beneficiario.objects.create(
+                campana=self.campana, nombre=f'Trabajador {i:02d}', rut=f'5{i:02d}.111.111-1',
+                tipo_contrato='fijo', planta=otra
+            )
+        Retiro.objects.create(beneficiario=self.beneficiario, confirmado_por=self.guardia)
+
+        self.login(self.admin)
+        response = self.client.get(reverse('admin_detalle_carga', args=[self.campana.id]))
+        self.assertEqual(
+            [(p['nombre'], p['total'], p['entregados'], p['fijo']) for p in response.context['plantas']],
+            [('Casa Blanca', 1, 1, 0), ('Valparaíso Planta BIC', 60, 0, 60)]
+        )
+        self.assertEqual((response.context['total_pendientes'], response.context['contratos_indefinidos']), (60, 1))
+        self.assertNotContains(response, 'Trabajador 00')
+
+        url = reverse('admin_detalle_carga_beneficiarios', args=[self.campana.id])
+        response = self.client.get(url, {'planta': otra.id, 'pagina': 2})
+        self.assertEqual([b.nombre for b in response.context['filas']], [f'Trabajador {i:02d}' for i in range(50, 60)])
+        self.assertContains(response, 'Página 2 de 2')
+
+        response = self.client.get(url, {'planta': otra.id, 'busqueda': 'dor 07', 'estado': 'pendiente'})
+        self.assertEqual([b.nombre for b in response.context['filas']], ['Trabajador 07'])
+        response = self.client.get(url, {'planta': otra.id, 'estado': 'entregado'})
+        self.assertEqual(response.context['pagina'].paginator.count, 0)
+
+        # Planta no numérica: se ignora el filtro en vez de fallar
+        response = self.client.get(url, {'planta': 'abc'})
+        self.assertEqual(response.context['pagina'].paginator.count, 61)
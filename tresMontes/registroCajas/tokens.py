@@ -0,0 +1,77 @@
+"""
+Tokens QR firmados para el retiro de cajas
+
+Formato compacto (base36, apto para QR de baja densidad):
+    TM1.<beneficiario_id>.<campana_id>.<expira>.<firma>
+
+La firma es un HMAC-SHA256 truncado con SECRET_KEY, así la verificación no
+necesita consultar la base de datos.
+"""
+import base64
+import time
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import base36_to_int, int_to_base36
+
+
+PREFIJO = 'TM1'
+SAL = 'registroCajas.tokens.qr'
+QR_VIGENCIA = 600  # segundos
+LARGO_FIRMA = 12  # bytes del HMAC que se conservan (96 bits)
+
+
+class TokenInvalido(ValueError):
+    """Token mal formado, con firma incorrecta o vencido"""
+
+    def __init__(self, motivo):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+def _firmar(valor):
+    digest = salted_hmac(SAL, valor, algorithm='sha256').digest()[:LARGO_FIRMA]
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def generar_token_qr(beneficiario, ahora=None):
+    """Token para el QR del trabajador, válido por QR_VIGENCIA segundos"""
+    ahora = int(ahora if ahora is not None else time.time())
+    vigencia = getattr(settings, 'QR_VIGENCIA', QR_VIGENCIA)
+    valor = '.'.join([
+        PREFIJO,
+        int_to_base36(beneficiario.pk),
+        int_to_base36(beneficiario.campana_id),
+        int_to_base36(ahora + vigencia),
+    ])
+    return f'{valor}.{_firmar(valor)}'
+
+
+def verificar_token_qr(token, ahora=None):
+    """
+    Valida el token sin tocar la base de datos.
+
+    Returns:
+        tuple: (beneficiario_id, campana_id)
+
+    Raises:
+        TokenInvalido: con motivo 'formato', 'firma' o 'expirado'
+    """
+    partes = (token or '').strip().split('.')
+    if len(partes) != 5 or partes[0] != PREFIJO:
+        raise TokenInvalido('formato')
+
+    valor, firma = '.'.join(partes[:4]), partes[4]
+    if not constant_time_compare(firma, _firmar(valor)):
+        raise TokenInvalido('firma')
+
+    try:
+        beneficiario_id, campana_id, expira = (base36_to_int(p) for p in partes[1:4])
+    except ValueError:
+        raise TokenInvalido('formato')
+
+    ahora = ahora if ahora is not None else time.time()
+    if expira < ahora:
+        raise TokenInvalido('expirado')
+
+    return beneficiario_id, campana_id
@@ -8,25 +8,46 @@ urlpatterns = [
     # Autenticación
     path('', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
+    path('activar/<str:token>/', views.activar_cuenta, name='activar_cuenta'),
+    path('metrics', views.metricas_view, name='metricas'),
+    path('eventos/', views.eventos_panel, name='eventos_panel'),
 
     # Administrador
     path('admin/home/', views.admin_home, name='admin_home'),
     path('admin/crear-campana/', views_admin.admin_crear_campana, name='admin_crear_campana'),
     path('admin/gestionar-cargas/', views_admin.admin_gestionar_cargas, name='admin_gestionar_cargas'),
     path('admin/eliminar-carga/<int:campana_id>/', views_admin.admin_eliminar_carga, name='admin_eliminar_carga'),
+    path('admin/reanudar-carga/<int:campana_id>/', views_admin.admin_reanudar_carga, name='admin_reanudar_carga'),
     path('admin/detalle-carga/<int:campana_id>/', views_admin.admin_ver_detalle_carga, name='admin_detalle_carga'),
+    path('admin/detalle-carga/<int:campana_id>/beneficiarios/', views_admin.admin_detalle_carga_beneficiarios, name='admin_detalle_carga_beneficiarios'),
+    path('admin/archivo/', views_admin.admin_archivo, name='admin_archivo'),
+    path('admin/archivo/<int:archivada_id>/', views_admin.admin_archivo_detalle, name='admin_archivo_detalle'),
+    path('admin/archivo/<int:archivada_id>/restaurar/', views_admin.admin_restaurar_archivo, name='admin_restaurar_archivo'),
     path('admin/usuarios/', views_admin.admin_usuarios, name='admin_usuarios'),
     path('admin/crear-usuario/', views_admin.admin_crear_usuario, name='admin_crear_usuario'),
     path('admin/editar-usuario/<int:perfil_id>/', views_admin.admin_editar_usuario, name='admin_editar_usuario'),
     path('admin/eliminar-usuario/<int:perfil_id>/', views_admin.admin_eliminar_usuario, name='admin_eliminar_usuario'),
+    path('admin/dispositivos/', views_admin.admin_dispositivos, name='admin_dispositivos'),
+    path('admin/dispositivos/<int:dispositivo_id>/revocar/', views_admin.admin_revocar_dispositivo, name='admin_revocar_dispositivo'),
     path('admin/reportes/', views_admin.admin_reportes, name='admin_reportes'),
+    path('admin/rendimiento/', views_admin.admin_rendimiento, name='admin_rendimiento'),
     path('admin/emergencia/', views_admin.admin_emergencia, name='admin_emergencia'),
     path('admin/emergencia/eliminar/<int:bloqueo_id>/', views_admin.admin_eliminar_bloqueo, name='admin_eliminar_bloqueo'),
+    path('admin/registro-masivo/', views_admin.admin_registro_masivo, name='admin_registro_masivo'),
+    path('admin/consultas/', views_admin.admin_resumen_consultas, name='admin_resumen_consultas'),
+    path('admin/perfiles/', views_admin.admin_perfiles, name='admin_perfiles'),
+    path('admin/perfiles/<str:nombre>/', views_admin.admin_descargar_perfil, name='admin_descargar_perfil'),
+    path('admin/etiquetas/<int:campana_id>/', views_admin.admin_descargar_etiquetas, name='admin_descargar_etiquetas'),
 
     # Guardia
     path('guardia/home/', views_guardia.guardia_home, name='guardia_home'),
     path('guardia/scanner/', views_guardia.guardia_scanner, name='guardia_scanner'),
+    path('guardia/llegadas/', views_guardia.guardia_llegadas, name='guardia_llegadas'),
     path('guardia/buscar-rut/', views_guardia.guardia_buscar_rut, name='guardia_buscar_rut'),
+    path('guardia/escanear/', views_guardia.guardia_escanear_qr, name='guardia_escanear_qr'),
+    path('guardia/retiro-tercero/', views_guardia.guardia_retiro_tercero, name='guardia_retiro_tercero'),
+    path('api/escanear/', views_guardia.api_escanear, name='api_escanear'),
+    path('api/registro-masivo/', views_guardia.api_registro_masivo, name='api_registro_masivo'),
     path('guardia/confirmar/<int:beneficiario_id>/', views_guardia.guardia_confirmar, name='guardia_confirmar'),
     path('guardia/confirmar-exitoso/', views_guardia.guardia_confirmar_exitoso, name='guardia_confirmar_exitoso'),
 
@@ -4,7 +4,107 @@ Utilidades para el sistema de registro de cajas
 import openpyxl
 import csv
 import io
+import time
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from .models import Beneficiario, Planta
+from .proyecciones import BeneficiarioFila, EntregaFila
+from .routers import lectura_replica
+from . import metricas
+
+
+# Tamaño de lote y pausa (segundos) entre lotes al importar nóminas.
+# Cada lote se guarda en una transacción corta para no bloquear la portería.
+NOMINA_TAMANO_LOTE = 200
+NOMINA_PAUSA_LOTE = 0.05
+
+
+def _config_lotes():
+    """Retorna (tamaño de lote, pausa entre lotes) según settings"""
+    tamano = getattr(settings, 'NOMINA_TAMANO_LOTE', NOMINA_TAMANO_LOTE)
+    pausa = getattr(settings, 'NOMINA_PAUSA_LOTE', NOMINA_PAUSA_LOTE)
+    return max(1, int(tamano)), max(0.0, float(pausa))
+
+
+class LoteNoGuardado(Exception):
+    """Un lote completo no se pudo confirmar; los lotes anteriores quedan guardados"""
+
+
+def _guardar_lote(campana, lote):
+    """
+    Guarda un lote de beneficiarios en una sola transacción corta.
+
+    Los errores de datos de una fila (RUT duplicado, valor inválido) se
+    reportan por fila; cualquier otro error (base bloqueada, conexión caída)
+    revierte el lote completo y se propaga.
+
+    Args:
+        campana: Campaña a la que pertenecen los beneficiarios
+        lote: Lista de tuplas (fila, rut, defaults)
+
+    Returns:
+        tuple: (creados: int, errores: list)
+    """
+    creados = 0
+    errores = []
+
+    with transaction.atomic():
+        for idx, rut, defaults in lote:
+            try:
+                # Savepoint por fila: un error no invalida el resto del lote
+                with transaction.atomic():
+                    beneficiario, created = Beneficiario.objects.get_or_create(
+                        campana=campana,
+                        rut=rut,
+                        defaults=defaults
+                    )
+                if created:
+                    creados += 1
+            except (IntegrityError, ValidationError, ValueError) as e:
+                errores.append(f"Fila {idx}: Error al crear beneficiario - {str(e)}")
+
+    return creados, errores
+
+
+class _ImportadorLotes:
+    """Acumula filas válidas y las guarda en lotes con pausas entre ellos"""
+
+    def __init__(self, campana):
+        self.campana = campana
+        self.tamano, self.pausa = _config_lotes()
+        self.lote = []
+        self.creados = 0
+        self.existentes = 0
+        self.errores = []
+        self.lotes_guardados = 0
+
+    def agregar(self, idx, rut, defaults):
+        self.lote.append((idx, rut, defaults))
+        if len(self.lote) >= self.tamano:
+            self.guardar()
+
+    def guardar(self):
+        if not self.lote:
+            return
+        # Ceder el turno a otras escrituras (ej. portería) entre lotes
+        if self.lotes_guardados and self.pausa:
+            time.sleep(self.pausa)
+        try:
+            creados, errores = _guardar_lote(self.campana, self.lote)
+        except Exception as e:
+            raise LoteNoGuardado(
+                f"El lote {self.lotes_guardados + 1} (filas {self.lote[0][0]} a {self.lote[-1][0]}) "
+                f"no se pudo guardar: {e}. Los {self.creados} beneficiarios de lotes anteriores quedaron guardados."
+            ) from e
+        self.creados += creados
+        self.existentes += len(self.lote) - creados - len(errores)
+        self.errores.extend(errores)
+        self.lotes_guardados += 1
+        print(f"DEBUG: Lote {self.lotes_guardados} guardado ({len(self.lote)} filas, {creados} creados)")
+        self.lote = []
 
 
 def procesar_excel_nomina(archivo, campana, planta):
@@ -20,18 +120,24 @@ def procesar_excel_nomina(archivo, campana, planta):
     Returns:
         int: Número de beneficiarios creados
     """
+    inicio = time.perf_counter()
     try:
         # Detectar si es CSV o Excel
         nombre_archivo = archivo.name.lower()
 
         if nombre_archivo.endswith('.csv'):
-            return _procesar_csv_nomina(archivo, campana, planta)
+            creados = _procesar_csv_nomina(archivo, campana, planta)
         else:
-            return _procesar_excel_nomina(archivo, campana, planta)
+            creados = _procesar_excel_nomina(archivo, campana, planta)
 
     except Exception as e:
+        metricas.importaciones.observar(time.perf_counter() - inicio, resultado='error')
         raise Exception(f"Error al procesar archivo: {str(e)}")
 
+    metricas.importaciones.observar(time.perf_counter() - inicio, resultado='ok')
+    metricas.importacion_filas.inc(creados)
+    return creados
+
 
 def _procesar_csv_nomina(archivo, campana, planta):
     """
@@ -46,6 +152,7 @@ def _procesar_csv_nomina(archivo, campana, planta):
     beneficiarios_creados = 0
     filas_procesadas = 0
     errores = []
+    importador = _ImportadorLotes(campana)
 
     try:
         # Leer el archivo CSV
@@ -267,29 +374,19 @@ def _procesar_csv_nomina(archivo, campana, planta):
                 print(f"DEBUG: Error al determinar planta: {ex}")
                 planta_por_fila = planta
 
-            # Crear beneficiario
-            print(f"DEBUG: Creando beneficiario '{nombre_completo}' ({rut}) en planta '{planta_por_fila}'...")
-            try:
-                beneficiario, created = Beneficiario.objects.get_or_create(
-                    campana=campana,
-                    rut=rut,
-                    defaults={
-                        'nombre': nombre_completo,
-                        'tipo_contrato': tipo_contrato,
-                        'tipo_caja': tipo_caja,
-                        'planta': planta_por_fila
-                    }
-                )
+            # Encolar beneficiario (se guarda por lotes)
+            print(f"DEBUG: Encolando beneficiario '{nombre_completo}' ({rut}) en planta '{planta_por_fila}'...")
+            importador.agregar(idx, rut, {
+                'nombre': nombre_completo,
+                'tipo_contrato': tipo_contrato,
+                'tipo_caja': tipo_caja,
+                'planta': planta_por_fila
+            })
 
-                if created:
-                    beneficiarios_creados += 1
-                    print(f"DEBUG: ✓ Beneficiario creado exitosamente")
-                else:
-                    print(f"DEBUG: ⚠ Beneficiario ya existía")
-            except Exception as e:
-                error = f"Fila {idx}: Error al crear beneficiario - {str(e)}"
-                print(f"DEBUG ERROR: {error}")
-                errores.append(error)
+        # Guardar el último lote pendiente
+        importador.guardar()
+        beneficiarios_creados = importador.creados
+        errores.extend(importador.errores)
 
         print(f"DEBUG: ==========================================")
         print(f"DEBUG: RESUMEN FINAL")
@@ -304,7 +401,8 @@ def _procesar_csv_nomina(archivo, campana, planta):
                 print(f"  - {error}")
 
         # Validar que se haya creado al menos un beneficiario
-        if beneficiarios_creados == 0:
+        # Sin creados ni ya existentes (al reanudar una carga puede no crear ninguno)
+        if beneficiarios_creados == 0 and not importador.existentes:
             if errores:
                 # Si hay errores, mostrar un resumen
                 errores_muestra = errores[:5]  # Mostrar solo los primeros 5 errores
@@ -341,6 +439,7 @@ def _procesar_excel_nomina(archivo, campana, planta):
     beneficiarios_creados = 0
     errores = []
     filas_procesadas = 0
+    importador = _ImportadorLotes(campana)
 
     # Leer encabezado (fila 1) para intentar detectar columna de planta
     header_row = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
@@ -448,28 +547,25 @@ def _procesar_excel_nomina(archivo, campana, planta):
                             except Exception:
                                 planta_por_fila = planta
 
-            # Crear beneficiario
-            beneficiario, created = Beneficiario.objects.get_or_create(
-                campana=campana,
-                rut=rut,
-                defaults={
-                    'nombre': nombre,
-                    'tipo_contrato': tipo_contrato,
-                    'tipo_caja': tipo_caja,
-                    'planta': planta_por_fila
-                }
-            )
-
-            if created:
-                beneficiarios_creados += 1
-                print(f"DEBUG Excel: ✓ Beneficiario creado exitosamente")
-            else:
-                print(f"DEBUG Excel: ⚠ Beneficiario ya existía")
+            # Encolar beneficiario (se guarda por lotes)
+            importador.agregar(idx, rut, {
+                'nombre': nombre,
+                'tipo_contrato': tipo_contrato,
+                'tipo_caja': tipo_caja,
+                'planta': planta_por_fila
+            })
+        except LoteNoGuardado:
+            raise
         except Exception as e:
             error = f"Fila {idx}: Error al crear beneficiario - {str(e)}"
             print(f"DEBUG Excel ERROR: {error}")
             errores.append(error)
 
+    # Guardar el último lote pendiente
+    importador.guardar()
+    beneficiarios_creados = importador.creados
+    errores.extend(importador.errores)
+
     print(f"DEBUG Excel: ==========================================")
     print(f"DEBUG Excel: RESUMEN FINAL")
     print(f"DEBUG Excel: Filas procesadas: {filas_procesadas}")
@@ -483,7 +579,8 @@ def _procesar_excel_nomina(archivo, campana, planta):
             print(f"  - {error}")
 
     # Validar que se haya creado al menos un beneficiario
-    if beneficiarios_creados == 0:
+    # Sin creados ni ya existentes (al reanudar una carga puede no crear ninguno)
+    if beneficiarios_creados == 0 and not importador.existentes:
         if errores:
             # Si hay errores, mostrar un resumen
             errores_muestra = errores[:5]  # Mostrar solo los primeros 5 errores
@@ -504,6 +601,7 @@ def generar_excel_entregados(campana):
     Returns:
         Workbook: Archivo Excel generado
     """
+    inicio = time.perf_counter()
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Entregados"
@@ -511,21 +609,21 @@ def generar_excel_entregados(campana):
     # Encabezados
     ws.append(['Nombre', 'RUT', 'Tipo Contrato', 'Tipo Caja', 'Fecha Retiro', 'Hora Retiro', 'Confirmado Por'])
 
-    # Datos
-    beneficiarios = campana.beneficiarios.filter(retiro__isnull=False).select_related('retiro', 'retiro__confirmado_por')
-
-    for b in beneficiarios:
-        retiro = b.retiro
-        ws.append([
-            b.nombre,
-            b.rut,
-            b.get_tipo_contrato_display(),
-            b.get_tipo_caja_display(),
-            retiro.fecha_hora.strftime('%d/%m/%Y'),
-            retiro.fecha_hora.strftime('%H:%M'),
-            retiro.confirmado_por.get_full_name() if retiro.confirmado_por else 'N/A'
-        ])
-
+    # Datos (lectura desde la réplica si está configurada)
+    with lectura_replica():
+        # Solo las columnas del Excel, sin instancias de modelo por fila
+        for b in EntregaFila.iterar(campana.beneficiarios.filter(retiro__isnull=False)):
+            ws.append([
+                b.nombre,
+                b.rut,
+                b.get_tipo_contrato_display(),
+                b.get_tipo_caja_display(),
+                b.fecha_hora.strftime('%d/%m/%Y'),
+                b.fecha_hora.strftime('%H:%M'),
+                b.confirmado_por
+            ])
+
+    metricas.exportaciones.observar(time.perf_counter() - inicio, tipo='entregados')
     return wb
 
 
@@ -536,6 +634,7 @@ def generar_excel_no_retirados(campana):
     Returns:
         Workbook: Archivo Excel generado
     """
+    inicio = time.perf_counter()
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "No Retirados"
@@ -543,18 +642,78 @@ def generar_excel_no_retirados(campana):
     # Encabezados
     ws.append(['Nombre', 'RUT', 'Tipo Contrato', 'Tipo Caja'])
 
-    # Datos
-    beneficiarios = campana.beneficiarios.filter(retiro__isnull=True)
+    # Datos (lectura desde la réplica si está configurada)
+    with lectura_replica():
+        for b in BeneficiarioFila.iterar(campana.beneficiarios.filter(retiro__isnull=True)):
+            ws.append([
+                b.nombre,
+                b.rut,
+                b.get_tipo_contrato_display(),
+                b.get_tipo_caja_display()
+            ])
+
+    metricas.exportaciones.observar(time.perf_counter() - inicio, tipo='no_retirados')
+    return wb
 
-    for b in beneficiarios:
-        ws.append([
-            b.nombre,
-            b.rut,
-            b.get_tipo_contrato_display(),
-            b.get_tipo_caja_display()
-        ])
 
-    return wb
+def rango_fechas(fecha_inicio, fecha_fin):
+    """
+    Convierte un rango de fechas en un rango de datetimes [inicio, fin).
+
+    Filtrar con fecha_hora__gte/__lt en vez de fecha_hora__date permite
+    usar el índice de Retiro.fecha_hora.
+    """
+    inicio = timezone.make_aware(datetime.combine(fecha_inicio, datetime.min.time()))
+    fin = timezone.make_aware(datetime.combine(fecha_fin + timedelta(days=1), datetime.min.time()))
+    return inicio, fin
+
+
+def calcular_digito_verificador(numeros):
+    """
+    Calcula el dígito verificador (módulo 11) de la parte numérica de un RUT.
+
+    Returns:
+        str: Dígito verificador ('0'-'9' o 'K')
+    """
+    suma = 0
+    multiplicador = 2
+
+    # Iterar desde la derecha hacia la izquierda
+    for digito in reversed(str(numeros)):
+        suma += int(digito) * multiplicador
+        multiplicador += 1
+        if multiplicador > 7:
+            multiplicador = 2
+
+    digito_calculado = 11 - (suma % 11)
+
+    if digito_calculado == 11:
+        return '0'
+    if digito_calculado == 10:
+        return 'K'
+    return str(digito_calculado)
+
+
+def formatear_rut(numero):
+    """Formatea un número de RUT como 12.345.678-9 (con dígito verificador)"""
+    return f"{numero:,}".replace(',', '.') + f"-{calcular_digito_verificador(numero)}"
+
+
+def variantes_rut(rut):
+    """
+    El RUT tal cual y en los formatos 12.345.678-9 y 12345678-9, para
+    buscarlo sin importar cómo quedó escrito en la nómina.
+
+    Returns:
+        set: variantes del RUT
+    """
+    rut = str(rut).strip()
+    limpio = rut.replace('.', '').replace('-', '').upper()
+    variantes = {rut}
+    if len(limpio) > 1 and limpio[:-1].isdigit():
+        variantes.add(f'{int(limpio[:-1]):,}'.replace(',', '.') + f'-{limpio[-1]}')
+        variantes.add(f'{int(limpio[:-1])}-{limpio[-1]}')
+    return variantes
 
 
 def validar_rut_chileno(rut):
@@ -595,25 +754,7 @@ def validar_rut_chileno(rut):
     digito_proporcionado = rut_limpio[-1]
     
     # Calcular dígito verificador correcto
-    suma = 0
-    multiplicador = 2
-    
-    # Iterar desde la derecha hacia la izquierda
-    for i in range(len(numeros) - 1, -1, -1):
-        suma += int(numeros[i]) * multiplicador
-        multiplicador += 1
-        if multiplicador > 7:
-            multiplicador = 2
-    
-    # Calcular el dígito verificador
-    digito_calculado = 11 - (suma % 11)
-    
-    if digito_calculado == 11:
-        digito_calculado = '0'
-    elif digito_calculado == 10:
-        digito_calculado = 'K'
-    else:
-        digito_calculado = str(digito_calculado)
+    digito_calculado = calcular_digito_verificador(numeros)
     
     # Comparar
     if digito_proporcionado != digito_calculado:
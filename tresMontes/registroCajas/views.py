@@ -2,7 +2,17 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from .models import Planta, Perfil
+from . import metricas
+from .provision import usuario_desde_token
+from .eventos import estado_inicial, eventos_una_vez, flujo_eventos, parsear_ultimo_id
+from .campanas_activas import obtener_registro
+import hmac
 
 
 # Create your views here.
@@ -47,12 +57,43 @@ def login_view(request):
             else:  # trabajador
                 return redirect('trabajador_home')
         else:
-            # Credenciales inválidas
+            # Credenciales inválidas (el mismo mensaje para cuentas sin activar:
+            # no revela qué usuarios existen; la indicación está en la página)
             messages.error(request, 'Usuario o contraseña incorrectos')
 
     return render(request, 'registroCajas/login.html')
 
 
+def activar_cuenta(request, token):
+    """Primer ingreso de un trabajador creado en forma masiva: define su contraseña"""
+    user = usuario_desde_token(token)
+    if user is None:
+        messages.error(request, 'El enlace de activación no es válido o ya fue utilizado')
+        return redirect('login')
+
+    if request.method == 'POST':
+        password = request.POST.get('password', '')
+        confirmacion = request.POST.get('password_confirmacion', '')
+
+        if password != confirmacion:
+            messages.error(request, 'Las contraseñas no coinciden')
+        else:
+            try:
+                validate_password(password, user)
+            except ValidationError as e:
+                for error in e.messages:
+                    messages.error(request, error)
+            else:
+                user.set_password(password)
+                user.save(update_fields=['password'])
+                login(request, user)
+                request.session['planta_codigo'] = user.perfil.planta.codigo
+                messages.success(request, 'Cuenta activada correctamente')
+                return redirect('trabajador_home')
+
+    return render(request, 'registroCajas/activar.html', {'usuario': user})
+
+
 def logout_view(request):
     logout(request)
     messages.success(request, 'Has cerrado sesión correctamente')
@@ -61,7 +102,8 @@ def logout_view(request):
 
 # ==================== VISTAS ADMINISTRADOR ====================
 
-from .decorators import admin_required
+from .decorators import admin_required, admin_or_guardia_required
+from .utils import rango_fechas
 from django.utils import timezone
 
 @admin_required
@@ -71,10 +113,10 @@ def admin_home(request):
     planta_codigo = request.session.get('planta_codigo')
     planta = get_object_or_404(Planta, codigo=planta_codigo)
 
-    from .models import Campana, Retiro
+    from .models import Retiro
     # Para el admin, buscar CUALQUIER campaña activa, no solo la de su planta.
     # La más reciente es la más relevante.
-    campana_activa = Campana.objects.filter(activa=True).order_by('-fecha_creacion').first()
+    campana_activa = obtener_registro().reciente
 
     context = {
         'planta': planta, # La planta del admin se sigue mostrando
@@ -83,10 +125,12 @@ def admin_home(request):
 
     if campana_activa:
         # Estadísticas del día
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
+        inicio, fin = rango_fechas(hoy, hoy)
         retiros_hoy = Retiro.objects.filter(
             beneficiario__campana=campana_activa,
-            fecha_hora__date=hoy
+            fecha_hora__gte=inicio,
+            fecha_hora__lt=fin
         )
 
         context.update({
@@ -95,9 +139,57 @@ def admin_home(request):
             'total_pendientes': campana_activa.total_pendientes(),
             'tasa_entrega': campana_activa.tasa_entrega(),
             'entregas_hoy': retiros_hoy.count(),
-            'entregas_recientes': retiros_hoy.order_by('-fecha_hora')[:5],
+            'entregas_recientes': retiros_hoy.select_related('beneficiario').order_by('-fecha_hora')[:5],
         })
 
     return render(request, 'registroCajas/admin/home.html', context)
 
 
+@admin_or_guardia_required
+def eventos_panel(request):
+    """
+    Flujo SSE para los paneles en vivo. El guardia recibe solo su planta;
+    el admin puede filtrar con ?planta=<codigo> (vacío = todas).
+    ?campana=<id> limita a una carga.
+    """
+    if request.user.perfil.rol == 'admin':
+        codigo = request.GET.get('planta', '')
+        planta = get_object_or_404(Planta, codigo=codigo) if codigo else None
+    else:
+        planta = get_object_or_404(Planta, codigo=request.session.get('planta_codigo'))
+
+    campana_id = request.GET.get('campana', '')
+    campana_id = int(campana_id) if campana_id.isdigit() else None
+
+    # Al reconectar se reenvía el solape completo: el navegador descarta los ids ya mostrados
+    ultimo = parsear_ultimo_id(request.headers.get('Last-Event-ID'))
+    if ultimo is None:
+        ultimo, enviados = estado_inicial(planta, campana_id)
+    else:
+        enviados = set()
+
+    # Bajo WSGI un flujo largo retendría el worker: una vuelta y EventSource reconecta
+    if isinstance(request, ASGIRequest):
+        flujo = flujo_eventos(planta, campana_id, ultimo, enviados)
+    else:
+        flujo = eventos_una_vez(planta, campana_id, ultimo, enviados)
+    response = StreamingHttpResponse(flujo, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metricas_view(request):
+    """
+    Métricas en formato de texto Prometheus. Las lee el scraper con
+    METRICAS_TOKEN (Authorization: Bearer) o un administrador con sesión;
+    sin token configurado solo queda la sesión de administrador.
+    """
+    perfil = getattr(request.user, 'perfil', None)
+    es_admin = request.user.is_authenticated and perfil is not None and perfil.rol == 'admin'
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    recibido = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not es_admin and not (token and hmac.compare_digest(recibido, token)):
+        return HttpResponse('No autorizado', status=401, content_type='text/plain')
+
+    return HttpResponse(metricas.REGISTRO.exponer(), content_type='text/plain; version=0.0.4; charset=utf-8')
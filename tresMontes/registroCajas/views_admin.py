@@ -2,22 +2,99 @@
 Vistas del módulo Administrador
 """
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.text import slugify
 from django.db.models import Q, Count
-from django.http import JsonResponse, HttpResponse
-from .decorators import admin_required, admin_or_guardia_required
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
+from django.core.paginator import Paginator
+from django.urls import reverse
+from .decorators import admin_required, admin_or_guardia_required, usar_replica
 from .models import (
     Planta, Perfil, Campana, DiaBloquedo,
-    Beneficiario, Retiro, AutorizacionTercero
+    Beneficiario, Retiro, AutorizacionTercero, CampanaArchivada, TokenDispositivo
 )
-from .utils import validar_rut_chileno
+from .utils import validar_rut_chileno, rango_fechas
+from .purga import purgar_campana, purgar_campana_en_segundo_plano
+from .campanas_activas import obtener_registro, invalidar_registro
+from .archivo import leer_archivo, restaurar_campana
+from .dispositivos import emitir_token, revocar_token
+from .entregas_masivas import leer_entregas, registrar_entregas, resumen, MAX_FILAS
+from .agenda import reprogramar_fecha
+from .rendimiento import actualizar_rendimiento, reporte_guardias, reporte_diario, escribir_csv
+from .routers import lectura_replica
+from .proyecciones import BeneficiarioFila
+from .middleware import resumen_consultas, perfiles_capturados, ruta_perfil, resumen_perfil
+from .etiquetas import ruta_pdf
 import json
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 
 
+DETALLE_CARGA_POR_PAGINA = 50
+
+
+def _importar_nomina(request, campana, archivo_nomina):
+    """
+    Importa la nómina en la campaña y la activa si terminó. Si falla, la deja
+    como carga parcial e inactiva y explica el error al administrador.
+
+    Returns:
+        bool: True si la importación terminó
+    """
+    try:
+        from .utils import procesar_excel_nomina
+        print(f"DEBUG: Iniciando procesamiento de archivo {archivo_nomina.name}")
+        beneficiarios_creados = procesar_excel_nomina(archivo_nomina, campana, campana.planta)
+        print(f"DEBUG: Procesamiento completado. {beneficiarios_creados} beneficiarios creados")
+    except Exception as e:
+        print(f"DEBUG: Error en procesamiento: {str(e)}")
+        import traceback
+        print(f"DEBUG: Traceback: {traceback.format_exc()}")
+
+        # Formatear el mensaje de error para mejor visualización
+        error_msg = str(e)
+        # Si el mensaje tiene múltiples líneas (como los errores detallados), formatearlos mejor
+        if '\n' in error_msg:
+            # Separar el título del detalle
+            lineas = error_msg.split('\n')
+            titulo = lineas[0]
+            detalle = '\n'.join(lineas[1:])
+            messages.error(request, f'{titulo}')
+            if detalle.strip():
+                # Agregar detalles adicionales como mensaje de advertencia
+                messages.warning(request, f'Detalles:{detalle}')
+        else:
+            messages.error(request, f'Error al procesar el archivo: {error_msg}')
+
+        # La campaña sigue como se creó: carga parcial e inactiva
+        total = campana.total_beneficiarios()
+        if total:
+            messages.warning(
+                request,
+                f'La carga "{campana.nombre}" quedó parcialmente cargada ({total} beneficiarios) e inactiva. '
+                f'Reanúdela subiendo el mismo archivo desde Gestionar Cargas.'
+            )
+        return False
+
+    # Ahora sí guardar el archivo en la campaña (resetear puntero primero)
+    archivo_nomina.seek(0)
+    campana.archivo_nomina = archivo_nomina
+    campana.activa = True
+    campana.estado_carga = 'completa'
+    campana.save()
+
+    # Mensaje de éxito con detalles
+    if beneficiarios_creados == 1:
+        messages.success(request, f'Carga "{campana.nombre}" lista con {beneficiarios_creados} beneficiario nuevo')
+    else:
+        messages.success(request, f'Carga "{campana.nombre}" lista con {beneficiarios_creados} beneficiarios nuevos')
+    return True
+
+
 @admin_required
 def admin_crear_campana(request):
     """Vista para crear una nueva carga de nómina"""
@@ -52,13 +129,16 @@ def admin_crear_campana(request):
             messages.error(request, 'La fecha de fin debe ser posterior a la fecha de inicio')
             return redirect('admin_crear_campana')
 
-        # Crear campaña SIN el archivo primero (lo procesamos antes)
+        # Crear campaña SIN el archivo primero (lo procesamos antes). Queda
+        # inactiva y como carga parcial hasta terminar: la portería no ve una
+        # nómina a medio importar.
         campana = Campana.objects.create(
             nombre=nombre,
             fecha_inicio=fecha_inicio,
             fecha_fin=fecha_fin,
             planta=planta,
-            activa=True,
+            activa=False,
+            estado_carga='parcial',
             creado_por=request.user
         )
 
@@ -77,43 +157,11 @@ def admin_crear_campana(request):
             except:
                 pass
 
-        # Procesar archivo de nómina ANTES de guardarlo (el puntero del archivo está en posición 0)
-        try:
-            from .utils import procesar_excel_nomina
-            print(f"DEBUG: Iniciando procesamiento de archivo {archivo_nomina.name}")
-            beneficiarios_creados = procesar_excel_nomina(archivo_nomina, campana, planta)
-            print(f"DEBUG: Procesamiento completado. {beneficiarios_creados} beneficiarios creados")
-
-            # Ahora sí guardar el archivo en la campaña (resetear puntero primero)
-            archivo_nomina.seek(0)
-            campana.archivo_nomina = archivo_nomina
-            campana.save()
-
-            # Mensaje de éxito con detalles
-            if beneficiarios_creados == 1:
-                messages.success(request, f'Carga creada exitosamente con {beneficiarios_creados} beneficiario')
-            else:
-                messages.success(request, f'Carga creada exitosamente con {beneficiarios_creados} beneficiarios')
-        except Exception as e:
-            print(f"DEBUG: Error en procesamiento: {str(e)}")
-            import traceback
-            print(f"DEBUG: Traceback: {traceback.format_exc()}")
-
-            # Formatear el mensaje de error para mejor visualización
-            error_msg = str(e)
-            # Si el mensaje tiene múltiples líneas (como los errores detallados), formatearlos mejor
-            if '\n' in error_msg:
-                # Separar el título del detalle
-                lineas = error_msg.split('\n')
-                titulo = lineas[0]
-                detalle = '\n'.join(lineas[1:])
-                messages.error(request, f'{titulo}')
-                if detalle.strip():
-                    # Agregar detalles adicionales como mensaje de advertencia
-                    messages.warning(request, f'Detalles:{detalle}')
-            else:
-                messages.error(request, f'Error al procesar el archivo: {error_msg}')
-
+        if not _importar_nomina(request, campana, archivo_nomina):
+            # Los lotes ya guardados se conservan y la carga queda parcial e
+            # inactiva. Solo se elimina si no alcanzó a guardar nada.
+            if campana.beneficiarios.exists():
+                return redirect('admin_gestionar_cargas')
             campana.delete()  # Eliminar la campaña si hubo error
             return redirect('admin_crear_campana')
 
@@ -336,6 +384,51 @@ def admin_eliminar_usuario(request, perfil_id):
 
 
 @admin_required
+def admin_dispositivos(request):
+    """Tokens de las tablets de portería: emitir y revocar"""
+    planta_codigo = request.session.get('planta_codigo')
+    planta = get_object_or_404(Planta, codigo=planta_codigo)
+    token_nuevo = None
+
+    if request.method == 'POST':
+        nombre = request.POST.get('nombre', '').strip()
+        planta_id = request.POST.get('planta')
+        usuario_id = request.POST.get('usuario')
+
+        guardia = Perfil.objects.filter(user_id=usuario_id, rol='guardia').select_related('user').first()
+        planta_dispositivo = Planta.objects.filter(id=planta_id).first()
+        if not nombre or guardia is None or planta_dispositivo is None:
+            messages.error(request, 'Nombre, planta y guardia son obligatorios')
+        else:
+            dispositivo, token_nuevo = emitir_token(nombre, planta_dispositivo, guardia.user, request.user)
+            # El token se muestra solo en esta respuesta (no se guarda en mensajes de sesión)
+            messages.success(request, f'Token emitido para {dispositivo.nombre}. Cópielo ahora: no se volverá a mostrar')
+
+    context = {
+        'planta': planta,
+        'dispositivos': TokenDispositivo.objects.select_related('planta', 'usuario__perfil').order_by('-activo', 'planta__nombre', 'nombre'),
+        'plantas': Planta.objects.filter(activa=True),
+        'guardias': Perfil.objects.filter(rol='guardia').select_related('user', 'planta').order_by('nombre_completo'),
+        'token_nuevo': token_nuevo,
+    }
+
+    return render(request, 'registroCajas/admin/dispositivos.html', context)
+
+
+@admin_required
+def admin_revocar_dispositivo(request, dispositivo_id):
+    """Revoca el token de una portería"""
+    dispositivo = get_object_or_404(TokenDispositivo, id=dispositivo_id)
+
+    if request.method == 'POST' and dispositivo.activo:
+        revocar_token(dispositivo)
+        messages.success(request, f'Token de {dispositivo.nombre} revocado')
+
+    return redirect('admin_dispositivos')
+
+
+@admin_required
+@usar_replica
 def admin_reportes(request):
     """Vista de reportes y estadísticas"""
     planta_codigo = request.session.get('planta_codigo')
@@ -372,10 +465,11 @@ def admin_reportes(request):
     total_beneficiarios = Beneficiario.objects.filter(campana__in=campanas).count()
 
     # Total de entregados EN EL PERÍODO seleccionado
+    inicio_periodo, fin_periodo = rango_fechas(fecha_inicio, fecha_fin)
     total_entregados_periodo = Retiro.objects.filter(
         beneficiario__campana__in=campanas,
-        fecha_hora__date__gte=fecha_inicio,
-        fecha_hora__date__lte=fecha_fin
+        fecha_hora__gte=inicio_periodo,
+        fecha_hora__lt=fin_periodo
     ).count()
 
     # Total de entregados histórico (todos los retiros de las campañas)
@@ -390,8 +484,8 @@ def admin_reportes(request):
     # Retiros recientes en el período para la lista
     retiros = Retiro.objects.filter(
         beneficiario__campana__in=campanas,
-        fecha_hora__date__gte=fecha_inicio,
-        fecha_hora__date__lte=fecha_fin
+        fecha_hora__gte=inicio_periodo,
+        fecha_hora__lt=fin_periodo
     ).select_related('beneficiario', 'confirmado_por')
 
     context = {
@@ -410,6 +504,51 @@ def admin_reportes(request):
     return render(request, 'registroCajas/admin/reportes.html', context)
 
 
+@admin_required
+def admin_rendimiento(request):
+    """Rendimiento de portería por guardia y por día (desde los resúmenes diarios), exportable a CSV"""
+    planta_codigo = request.session.get('planta_codigo')
+    planta = get_object_or_404(Planta, codigo=planta_codigo)
+
+    hoy = timezone.localdate()
+    try:
+        fecha_fin = datetime.strptime(request.GET.get('hasta', ''), '%Y-%m-%d').date()
+    except ValueError:
+        fecha_fin = hoy
+    try:
+        fecha_inicio = datetime.strptime(request.GET.get('desde', ''), '%Y-%m-%d').date()
+    except ValueError:
+        fecha_inicio = fecha_fin - timedelta(days=29)
+    fecha_inicio = min(fecha_inicio, fecha_fin)
+
+    # Los resúmenes los escribe actualizar_rendimiento (cron); el botón recalcula el día en curso
+    if request.method == 'POST':
+        actualizar_rendimiento(hoy, hoy, [planta.id])
+        messages.success(request, 'Rendimiento de hoy actualizado')
+        return redirect(f"{reverse('admin_rendimiento')}?{request.GET.urlencode()}")
+
+    # El día en curso se lee de 'default': la réplica puede no tener aún el resumen nuevo
+    incluye_hoy = fecha_inicio <= hoy <= fecha_fin
+    with nullcontext() if incluye_hoy else lectura_replica():
+        if request.GET.get('formato') == 'csv':
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = (
+                f'attachment; filename="rendimiento_{planta.codigo}_{fecha_inicio:%Y%m%d}_{fecha_fin:%Y%m%d}.csv"'
+            )
+            escribir_csv(response, planta, fecha_inicio, fecha_fin)
+            return response
+
+        context = {
+            'planta': planta,
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'guardias': reporte_guardias(planta, fecha_inicio, fecha_fin),
+            'dias': reporte_diario(planta, fecha_inicio, fecha_fin),
+        }
+
+    return render(request, 'registroCajas/admin/rendimiento.html', context)
+
+
 @admin_required
 def admin_emergencia(request):
     """Vista del sistema de emergencia para bloquear días"""
@@ -417,7 +556,7 @@ def admin_emergencia(request):
     planta = get_object_or_404(Planta, codigo=planta_codigo)
 
     # Obtener campaña activa
-    campana_activa = Campana.objects.filter(planta=planta, activa=True).first()
+    campana_activa = next(iter(obtener_registro().por_planta(planta.id)), None)
 
     if request.method == 'POST':
         if not campana_activa:
@@ -446,6 +585,13 @@ def admin_emergencia(request):
             )
 
             messages.success(request, f'Día {fecha.strftime("%d/%m/%Y")} bloqueado exitosamente')
+
+            # Mover a otros bloques a quienes estaban agendados ese día
+            resultado = reprogramar_fecha(campana_activa, fecha)
+            if resultado['reprogramadas']:
+                messages.info(request, f"{resultado['reprogramadas']} retiros agendados se movieron a otros horarios")
+            if resultado['sin_cupo']:
+                messages.warning(request, f"{resultado['sin_cupo']} trabajadores quedaron sin horario: no hay cupo en la portería")
         except ValueError:
             messages.error(request, 'Formato de fecha inválido')
         except Exception as e:
@@ -485,14 +631,63 @@ def admin_eliminar_bloqueo(request, bloqueo_id):
     return redirect('admin_emergencia')
 
 
+@admin_required
+def admin_registro_masivo(request):
+    """Registro de entregas anotadas en papel: pegar o subir la lista y ver el reporte"""
+    planta_codigo = request.session.get('planta_codigo')
+    planta = get_object_or_404(Planta, codigo=planta_codigo)
+    reporte = None
+
+    if request.method == 'POST':
+        texto = request.POST.get('texto', '')
+        archivo = request.FILES.get('archivo')
+        if archivo:
+            contenido = archivo.read()
+            try:
+                texto = contenido.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                texto = contenido.decode('latin-1')  # CSV guardado desde Excel
+
+        try:
+            fecha_base = datetime.strptime(request.POST.get('fecha', ''), '%Y-%m-%d').date()
+        except ValueError:
+            fecha_base = timezone.localdate()
+
+        try:
+            planta_filtro = Planta.objects.filter(id=int(request.POST.get('planta', ''))).first()
+        except ValueError:
+            planta_filtro = None  # Vacío o no numérico: todas las plantas
+        filas = leer_entregas(texto, fecha_base)
+        if not filas:
+            messages.error(request, 'No se encontraron entregas en la lista')
+        elif len(filas) > MAX_FILAS:
+            messages.error(request, f'Se admiten hasta {MAX_FILAS} filas por registro')
+        else:
+            reporte = registrar_entregas(filas, request.user, planta_filtro)
+            totales = resumen(reporte)
+            messages.success(request, f"{totales['registradas']} de {totales['total']} entregas registradas")
+            if totales['conflictos']:
+                messages.warning(request, f"{totales['conflictos']} filas con conflicto (ver detalle)")
+
+    context = {
+        'planta': planta,
+        'plantas': Planta.objects.filter(activa=True),
+        'hoy': timezone.localdate(),
+        'reporte': reporte,
+    }
+
+    return render(request, 'registroCajas/admin/registro_masivo.html', context)
+
+
 @admin_or_guardia_required
+@usar_replica
 def lista_diaria(request):
     """Vista de lista diaria de entregas (compartida admin/guardia)"""
     planta_codigo = request.session.get('planta_codigo')
     planta = get_object_or_404(Planta, codigo=planta_codigo)
 
     # Buscar CUALQUIER campaña activa
-    campana_activa = Campana.objects.filter(activa=True).order_by('-fecha_creacion').first()
+    campana_activa = obtener_registro().reciente
 
     if not campana_activa:
         context = {
@@ -512,7 +707,6 @@ def lista_diaria(request):
     else: # Guardia
         beneficiarios = campana_activa.beneficiarios.filter(planta=planta)
 
-
     # Filtrar por tipo de contrato
     if filtro_tipo != 'todos':
         beneficiarios = beneficiarios.filter(tipo_contrato=filtro_tipo)
@@ -523,25 +717,20 @@ def lista_diaria(request):
             Q(nombre__icontains=busqueda) | Q(rut__icontains=busqueda)
         )
 
-    # Ordenar: primero entregados, luego pendientes
-    beneficiarios_list = []
-    for b in beneficiarios:
-        beneficiarios_list.append({
-            'beneficiario': b,
-            'tiene_retiro': b.tiene_retiro(),
-            'retiro': b.retiro if b.tiene_retiro() else None
-        })
+    # Solo las columnas que muestra la lista, con el retiro en el mismo JOIN
+    beneficiarios_list = BeneficiarioFila.desde(beneficiarios)
 
     # Ordenar: entregados primero
-    beneficiarios_list.sort(key=lambda x: (not x['tiene_retiro'], x['beneficiario'].nombre))
+    beneficiarios_list.sort(key=lambda b: (not b.tiene_retiro, b.nombre))
+    total_entregados = sum(1 for b in beneficiarios_list if b.tiene_retiro)
 
     context = {
         'planta': planta,
         'campana_activa': campana_activa,
         'beneficiarios': beneficiarios_list,
         'total_beneficiarios': len(beneficiarios_list),
-        'total_entregados': sum(1 for b in beneficiarios_list if b['tiene_retiro']),
-        'total_pendientes': sum(1 for b in beneficiarios_list if not b['tiene_retiro']),
+        'total_entregados': total_entregados,
+        'total_pendientes': len(beneficiarios_list) - total_entregados,
         'filtro_fecha': filtro_fecha,
         'filtro_tipo': filtro_tipo,
         'busqueda': busqueda,
@@ -572,16 +761,20 @@ def admin_gestionar_cargas(request):
     planta = get_object_or_404(Planta, codigo=planta_codigo) # Se mantiene para mostrar la planta del admin
 
     # Para el admin, obtener todas las campañas de TODAS las plantas
-    campanas = Campana.objects.all().select_related('planta', 'creado_por__perfil').order_by('-fecha_inicio')
+    # Los totales se calculan en la misma consulta (una sola consulta para todas las campañas)
+    campanas = Campana.objects.all().select_related('planta', 'creado_por__perfil').annotate(
+        num_beneficiarios=Count('beneficiarios', distinct=True),
+        num_entregados=Count('beneficiarios__retiro', distinct=True),
+    ).order_by('-fecha_inicio')
 
     # Agregar información de beneficiarios a cada campaña
     campanas_info = []
     for campana in campanas:
         campanas_info.append({
             'campana': campana,
-            'total_beneficiarios': campana.total_beneficiarios(),
-            'total_entregados': campana.total_entregados(),
-            'total_pendientes': campana.total_pendientes(),
+            'total_beneficiarios': campana.num_beneficiarios,
+            'total_entregados': campana.num_entregados,
+            'total_pendientes': campana.num_beneficiarios - campana.num_entregados,
         })
 
     context = {
@@ -605,53 +798,225 @@ def admin_eliminar_carga(request, campana_id):
 
     if request.method == 'POST':
         nombre = campana.nombre
-        total_benef = campana.total_beneficiarios()
-        campana.delete()
-        messages.success(request, f'Carga "{nombre}" eliminada exitosamente ({total_benef} beneficiarios)')
+
+        if settings.PURGA_EN_SEGUNDO_PLANO:
+            # Ocultar la campaña de inmediato y eliminar sus registros en un hilo aparte
+            Campana.objects.filter(id=campana.id).update(activa=False, estado_carga='eliminando')
+            invalidar_registro()  # update() no dispara señales
+            purgar_campana_en_segundo_plano(campana.id)
+            messages.success(request, f'Carga "{nombre}" en proceso de eliminación')
+            return redirect('admin_gestionar_cargas')
+
+        conteos = purgar_campana(campana.id)
+        messages.success(request, f'Carga "{nombre}" eliminada exitosamente ({conteos["Beneficiario"]} beneficiarios)')
         return redirect('admin_gestionar_cargas')
 
     return redirect('admin_gestionar_cargas')
 
 
+@admin_required
+def admin_reanudar_carga(request, campana_id):
+    """
+    Reanuda una carga parcial con el mismo archivo: las filas ya guardadas se
+    saltan (get_or_create) y al terminar la campaña queda activa.
+    """
+    campana = get_object_or_404(Campana, id=campana_id, estado_carga='parcial')
+    archivo_nomina = request.FILES.get('archivo_nomina')
+
+    if request.method == 'POST':
+        if not archivo_nomina:
+            messages.error(request, 'Debe subir el archivo de la nómina para reanudar la carga')
+        else:
+            _importar_nomina(request, campana, archivo_nomina)
+
+    return redirect('admin_gestionar_cargas')
+
+
 @admin_required
 def admin_ver_detalle_carga(request, campana_id):
-    """Vista para ver el detalle completo de una carga"""
-    campana = get_object_or_404(Campana, id=campana_id)
+    """
+    Detalle de una carga: totales por planta y tipo de contrato desde una sola
+    consulta agrupada. El listado de cada planta se pide aparte y paginado
+    (admin_detalle_carga_beneficiarios) al abrir su sección.
+    """
+    campana = get_object_or_404(Campana.objects.select_related('creado_por__perfil'), id=campana_id)
 
     # Para el admin, se elimina la restricción de planta
     # La planta se obtiene de la campaña para consistencia
     planta = campana.planta
 
-    # Obtener todos los beneficiarios
-    beneficiarios = campana.beneficiarios.all().order_by('nombre')
-
-    # Contar contratos por tipo
-    contratos_indefinidos = beneficiarios.filter(tipo_contrato='indefinido').count()
-    contratos_fijos = beneficiarios.filter(tipo_contrato='fijo').count()
-
-    # Agrupar beneficiarios por planta
-    beneficiarios_por_planta = {}
-    for benef in beneficiarios:
-        planta_nombre = benef.planta.nombre
-        if planta_nombre not in beneficiarios_por_planta:
-            beneficiarios_por_planta[planta_nombre] = {
-                'planta_obj': benef.planta,
-                'beneficiarios': [],
-                'total': 0,
-            }
-        beneficiarios_por_planta[planta_nombre]['beneficiarios'].append(benef)
-        beneficiarios_por_planta[planta_nombre]['total'] += 1
+    # Una fila por (planta, tipo de contrato) con beneficiarios y entregados
+    totales = {'total': 0, 'entregados': 0, 'indefinido': 0, 'fijo': 0}
+    plantas = {}
+    for grupo in (
+        campana.beneficiarios
+        .values('planta_id', 'planta__nombre', 'tipo_contrato')
+        .annotate(total=Count('id'), entregados=Count('retiro'))
+        .order_by('planta__nombre')
+    ):
+        datos_planta = plantas.setdefault(grupo['planta_id'], {
+            'id': grupo['planta_id'], 'nombre': grupo['planta__nombre'],
+            'total': 0, 'entregados': 0, 'indefinido': 0, 'fijo': 0,
+        })
+        for acumulado in (datos_planta, totales):
+            acumulado['total'] += grupo['total']
+            acumulado['entregados'] += grupo['entregados']
+            acumulado[grupo['tipo_contrato']] = acumulado.get(grupo['tipo_contrato'], 0) + grupo['total']
+    for datos_planta in plantas.values():
+        datos_planta['pendientes'] = datos_planta['total'] - datos_planta['entregados']
 
     context = {
         'planta': planta,
         'campana': campana,
-        'beneficiarios': beneficiarios,
-        'beneficiarios_por_planta': beneficiarios_por_planta,
-        'contratos_indefinidos': contratos_indefinidos,
-        'contratos_fijos': contratos_fijos,
-        'total_beneficiarios': campana.total_beneficiarios(),
-        'total_entregados': campana.total_entregados(),
-        'total_pendientes': campana.total_pendientes(),
+        'plantas': list(plantas.values()),
+        'contratos_indefinidos': totales['indefinido'],
+        'contratos_fijos': totales['fijo'],
+        'total_beneficiarios': totales['total'],
+        'total_entregados': totales['entregados'],
+        'total_pendientes': totales['total'] - totales['entregados'],
     }
 
     return render(request, 'registroCajas/admin/detalle_carga.html', context)
+
+
+@admin_required
+def admin_detalle_carga_beneficiarios(request, campana_id):
+    """Página del listado de beneficiarios de una planta de la carga (fragmento HTML)"""
+    campana = get_object_or_404(Campana, id=campana_id)
+    try:
+        planta_id = int(request.GET.get('planta', ''))
+    except ValueError:
+        planta_id = None  # Valor no numérico: sin filtro de planta
+    contrato = request.GET.get('contrato', '')
+    estado = request.GET.get('estado', '')
+    busqueda = request.GET.get('busqueda', '').strip()
+
+    # Usa el índice (planta, campana, nombre): filtra y ordena sin recorrer la carga completa
+    beneficiarios = campana.beneficiarios.order_by('nombre')
+    if planta_id:
+        beneficiarios = beneficiarios.filter(planta_id=planta_id)
+    if contrato:
+        beneficiarios = beneficiarios.filter(tipo_contrato=contrato)
+    if estado in ('entregado', 'pendiente'):
+        beneficiarios = beneficiarios.filter(retiro__isnull=(estado == 'pendiente'))
+    if busqueda:
+        beneficiarios = beneficiarios.filter(Q(nombre__icontains=busqueda) | Q(rut__icontains=busqueda))
+
+    pagina = Paginator(beneficiarios, DETALLE_CARGA_POR_PAGINA).get_page(request.GET.get('pagina'))
+    filtros = request.GET.copy()
+    filtros.pop('pagina', None)
+
+    context = {
+        'campana': campana,
+        'pagina': pagina,
+        'filas': BeneficiarioFila.desde(pagina.object_list),
+        'filtros': filtros.urlencode(),
+    }
+
+    return render(request, 'registroCajas/admin/includes/detalle_carga_beneficiarios.html', context)
+
+
+@admin_required
+def admin_archivo(request):
+    """Listado de campañas archivadas (solo lectura)"""
+    planta_codigo = request.session.get('planta_codigo')
+    planta = get_object_or_404(Planta, codigo=planta_codigo)
+
+    context = {
+        'planta': planta,
+        'archivadas': CampanaArchivada.objects.select_related('planta', 'archivado_por'),
+    }
+
+    return render(request, 'registroCajas/admin/archivo.html', context)
+
+
+@admin_required
+def admin_archivo_detalle(request, archivada_id):
+    """Consulta de auditoría de una campaña archivada, leída desde su archivo"""
+    archivada = get_object_or_404(CampanaArchivada.objects.select_related('planta'), id=archivada_id)
+    busqueda = request.GET.get('busqueda', '').strip().lower()
+
+    datos = leer_archivo(archivada)
+    retiros = {r['beneficiario']: r for r in datos['retiro']}
+    plantas = dict(Planta.objects.values_list('id', 'nombre'))
+
+    filas = []
+    for benef in datos['beneficiario']:
+        if busqueda and busqueda not in benef['nombre'].lower() and busqueda not in benef['rut'].lower():
+            continue
+        filas.append({
+            'beneficiario': benef,
+            'planta_nombre': plantas.get(benef['planta'], ''),
+            'retiro': retiros.get(benef['id']),
+        })
+    filas.sort(key=lambda x: x['beneficiario']['nombre'])
+
+    context = {
+        'planta': archivada.planta,
+        'archivada': archivada,
+        'pagina': Paginator(filas, 50).get_page(request.GET.get('pagina')),
+        'total_filtrados': len(filas),
+        'dias_bloqueados': datos['diabloquedo'],
+        'busqueda': busqueda,
+    }
+
+    return render(request, 'registroCajas/admin/archivo_detalle.html', context)
+
+
+@admin_required
+def admin_restaurar_archivo(request, archivada_id):
+    """Restaura una campaña archivada a las tablas activas"""
+    archivada = get_object_or_404(CampanaArchivada, id=archivada_id)
+
+    if request.method == 'POST':
+        try:
+            campana = restaurar_campana(archivada)
+            messages.success(request, f'Carga "{campana.nombre}" restaurada ({campana.total_beneficiarios()} beneficiarios)')
+        except Exception as e:
+            messages.error(request, f'Error al restaurar la carga: {str(e)}')
+            return redirect('admin_archivo')
+        return redirect('admin_gestionar_cargas')
+
+    return redirect('admin_archivo')
+
+
+@admin_required
+def admin_resumen_consultas(request):
+    """Resumen en memoria de consultas SQL por vista (proceso actual)"""
+    return JsonResponse({'vistas': resumen_consultas()})
+
+
+@admin_required
+def admin_perfiles(request):
+    """Peticiones perfiladas, de la más lenta a la más rápida"""
+    planta_codigo = request.session.get('planta_codigo')
+    planta = get_object_or_404(Planta, codigo=planta_codigo)
+
+    seleccionado = request.GET.get('perfil', '')
+    context = {
+        'planta': planta,
+        'perfiles': perfiles_capturados()[:50],
+        'seleccionado': seleccionado,
+        'resumen': resumen_perfil(seleccionado) if seleccionado else None,
+    }
+
+    return render(request, 'registroCajas/admin/perfiles.html', context)
+
+
+@admin_required
+def admin_descargar_perfil(request, nombre):
+    """Descarga un archivo .prof (snakeviz / flameprof)"""
+    ruta = ruta_perfil(nombre)
+    if not ruta:
+        raise Http404('Perfil no encontrado')
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre)
+
+
+@admin_required
+def admin_descargar_etiquetas(request, campana_id):
+    """Descarga el PDF de etiquetas generado desde el admin"""
+    campana = get_object_or_404(Campana, id=campana_id)
+    ruta = ruta_pdf(campana.id)
+    if not ruta.exists():
+        raise Http404('Las etiquetas aún se están generando o no se han solicitado')
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=f'etiquetas_{slugify(campana.nombre)}.pdf')
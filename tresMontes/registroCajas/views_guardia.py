@@ -5,8 +5,28 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from django.core import signing
+from django.urls import reverse
+from urllib.parse import urlencode
+from datetime import datetime
+import json
 from .decorators import admin_or_guardia_required
-from .models import Planta, Campana, Beneficiario, Retiro, AutorizacionTercero
+from .dispositivos import acepta_dispositivo
+from . import metricas
+from .tokens import verificar_token_qr, TokenInvalido
+from .campanas_activas import obtener_registro
+from .entregas_masivas import filas_desde_json, registrar_entregas, resumen, MAX_FILAS
+from .terceros import autorizaciones_tercero, registrar_retiros_tercero
+from .agenda import capacidad_hora, llegadas_esperadas
+from .models import Planta, Beneficiario, Retiro, AutorizacionTercero
+
+
+# Popup de éxito: id del retiro firmado en la URL, válido por unos minutos
+SAL_EXITOSO = 'registroCajas.guardia.exitoso'
+VIGENCIA_EXITOSO = 300
 
 
 @admin_or_guardia_required
@@ -17,29 +37,48 @@ def guardia_home(request):
 
     # Buscar beneficiarios de la planta del guardia en CUALQUIER campaña activa
     # La relación es por beneficiario.planta (del CSV), no por campaña.planta
+    registro = obtener_registro()
     beneficiarios_planta = Beneficiario.objects.filter(
         planta=planta,
-        campana__activa=True
+        campana_id__in=registro.ids
     )
 
     total_entregados = beneficiarios_planta.filter(retiro__isnull=False).distinct().count()
     total_pendientes = beneficiarios_planta.filter(retiro__isnull=True).count()
-    beneficiarios_pendientes = beneficiarios_planta.filter(retiro__isnull=True).order_by('nombre')[:10]
 
     # Obtener alguna campaña activa para mostrar info (puede ser de cualquier planta)
-    campana_activa = Campana.objects.filter(activa=True).order_by('-fecha_creacion').first()
+    campana_activa = registro.reciente
 
     context = {
         'planta': planta,
         'campana_activa': campana_activa, # Puede ser una campaña de otra planta
         'total_entregados': total_entregados,
         'total_pendientes': total_pendientes,
-        'beneficiarios_pendientes': beneficiarios_pendientes,
     }
 
     return render(request, 'registroCajas/guardia/home.html', context)
 
 
+@admin_or_guardia_required
+def guardia_llegadas(request):
+    """Trabajadores agendados para el bloque horario en curso"""
+    planta_codigo = request.session.get('planta_codigo')
+    planta = get_object_or_404(Planta, codigo=planta_codigo)
+
+    hora, agendas, por_hora = llegadas_esperadas(planta)
+
+    context = {
+        'planta': planta,
+        'hora': hora,
+        'agendas': agendas,
+        'pendientes': sum(1 for a in agendas if not a.beneficiario.tiene_retiro()),
+        'por_hora': por_hora,
+        'capacidad': capacidad_hora(planta.codigo),
+    }
+
+    return render(request, 'registroCajas/guardia/llegadas.html', context)
+
+
 @admin_or_guardia_required
 def guardia_scanner(request):
     """Vista del escáner QR"""
@@ -60,53 +99,229 @@ def guardia_buscar_rut(request):
     planta = get_object_or_404(Planta, codigo=planta_codigo)
 
     # Obtener CUALQUIER campaña activa
-    campana_activa = Campana.objects.filter(activa=True).order_by('-fecha_creacion').first()
+    registro = obtener_registro()
+    campana_activa = registro.reciente
 
     beneficiario = None
     rut_buscado = request.GET.get('rut', '').strip()
-    desde_scanner = request.GET.get('auto', '') == '1'  # Parámetro para identificar escaneo QR
 
     if rut_buscado:
         # Buscar beneficiario en CUALQUIER campaña activa que pertenezca a la planta del guardia
         try:
             beneficiario = Beneficiario.objects.get(
                 rut=rut_buscado,
-                campana__activa=True,
+                campana_id__in=registro.ids,
                 planta=planta # La relación es por beneficiario.planta (del CSV), no por campaña.planta
             )
+        except Beneficiario.DoesNotExist:
+            metricas.escaneos_fallidos.inc(planta=planta.codigo, motivo='rut_no_encontrado')
+            messages.error(request, f'No se encontró beneficiario con RUT {rut_buscado} en la carga activa para esta planta')
+
+    context = {
+        'planta': planta,
+        'campana_activa': campana_activa,
+        'beneficiario': beneficiario,
+        'rut_buscado': rut_buscado,
+    }
+
+    return render(request, 'registroCajas/guardia/buscar_rut.html', context)
+
+
+@admin_or_guardia_required
+def guardia_retiro_tercero(request):
+    """
+    Busca por RUT del tercero las cajas que tiene autorizado retirar hoy en
+    esta planta y registra las seleccionadas en un solo lote.
+    """
+    planta_codigo = request.session.get('planta_codigo')
+    planta = get_object_or_404(Planta, codigo=planta_codigo)
+    rut_tercero = (request.POST.get('rut_tercero') or request.GET.get('rut_tercero', '')).strip()
+    reporte = None
+
+    autorizaciones = autorizaciones_tercero(rut_tercero, planta)
+    if request.method == 'POST':
+        # Solo se aceptan beneficiarios que sigan autorizados al momento de registrar
+        seleccionados = set(request.POST.getlist('beneficiarios'))
+        elegidas = [
+            a for a in autorizaciones
+            if str(a.beneficiario_id) in seleccionados and not a.beneficiario.tiene_retiro()
+        ]
+        if not elegidas:
+            messages.error(request, 'Seleccione al menos una caja pendiente')
+        else:
+            reporte = registrar_retiros_tercero(elegidas, request.user, planta)
+            totales = resumen(reporte)
+            messages.success(request, f"{totales['registradas']} cajas entregadas a {elegidas[0].nombre_tercero}")
+            if totales['conflictos']:
+                messages.warning(request, f"{totales['conflictos']} cajas no se pudieron registrar")
+            autorizaciones = autorizaciones_tercero(rut_tercero, planta)
+    elif rut_tercero and not autorizaciones:
+        metricas.escaneos_fallidos.inc(planta=planta.codigo, motivo='tercero_sin_autorizacion')
+        messages.error(request, f'{rut_tercero} no tiene autorizaciones vigentes hoy en esta planta')
+
+    context = {
+        'planta': planta,
+        'rut_tercero': rut_tercero,
+        'autorizaciones': autorizaciones,
+        'pendientes': sum(1 for a in autorizaciones if not a.beneficiario.tiene_retiro()),
+        'reporte': reporte,
+    }
 
-            # Si viene desde el scanner QR, registrar automáticamente
-            if desde_scanner and beneficiario:
-                # Verificar si ya tiene retiro
-                if beneficiario.tiene_retiro():
-                    messages.warning(request, f'La caja de {beneficiario.nombre} ya fue entregada anteriormente')
-                    return redirect('guardia_scanner')
+    return render(request, 'registroCajas/guardia/retiro_tercero.html', context)
 
-                # Crear retiro automáticamente
+
+def _redirigir_exitoso(retiro):
+    """Redirige al popup de éxito con el id del retiro firmado en la URL"""
+    firmado = signing.dumps(retiro.pk, salt=SAL_EXITOSO)
+    return redirect(f"{reverse('guardia_confirmar_exitoso')}?{urlencode({'r': firmado})}")
+
+
+def _registrar_entrega_qr(request, beneficiario, planta_codigo):
+    """Registra el retiro de un beneficiario escaneado y redirige al popup"""
+    # Verificar si ya tiene retiro
+    if beneficiario.tiene_retiro():
+        metricas.escaneos_fallidos.inc(planta=planta_codigo, motivo='ya_entregada')
+        messages.warning(request, f'La caja de {beneficiario.nombre} ya fue entregada anteriormente')
+        return redirect('guardia_scanner')
+
+    # Crear retiro automáticamente
+    retiro = Retiro.objects.create(
+        beneficiario=beneficiario,
+        fecha_hora=timezone.now(),
+        confirmado_por=request.user,
+        observaciones='Entrega registrada mediante escaneo QR'
+    )
+    metricas.retiros.inc(planta=planta_codigo, guardia=request.user.username, modo='qr')
+
+    return _redirigir_exitoso(retiro)
+
+
+def _planta_codigo(request):
+    """Planta del guardia: la del token de dispositivo o la de la sesión"""
+    if getattr(request, 'dispositivo', None):
+        return request.dispositivo.planta.codigo
+    return request.session.get('planta_codigo')
+
+
+def _resolver_escaneo(codigo, planta_codigo):
+    """
+    Valida un token QR y obtiene el beneficiario. La firma se valida antes
+    de consultar la base de datos; luego basta una búsqueda por id.
+
+    Returns:
+        tuple: (beneficiario, motivo, mensaje); beneficiario es None si se rechaza
+    """
+    try:
+        beneficiario_id, campana_id = verificar_token_qr(codigo)
+    except TokenInvalido as e:
+        if e.motivo == 'expirado':
+            return None, 'qr_expirado', 'El código QR venció. Pida al trabajador que actualice su pantalla'
+        return None, f'qr_{e.motivo}', 'Código QR no válido'
+
+    # Una campaña inactiva se descarta sin consultar la base de datos
+    campana = obtener_registro().campana(campana_id)
+    try:
+        if campana is None:
+            raise Beneficiario.DoesNotExist
+        beneficiario = Beneficiario.objects.select_related('planta', 'retiro').get(
+            pk=beneficiario_id, campana_id=campana_id
+        )
+    except Beneficiario.DoesNotExist:
+        return None, 'rut_no_encontrado', 'El código QR no corresponde a una carga activa'
+    beneficiario.campana = campana
+
+    if beneficiario.planta.codigo != planta_codigo:
+        return None, 'otra_planta', f'{beneficiario.nombre} no pertenece a esta planta'
+
+    return beneficiario, None, None
+
+
+@acepta_dispositivo
+@admin_or_guardia_required
+def guardia_escanear_qr(request):
+    """Registra la entrega a partir de un token QR firmado"""
+    planta_codigo = _planta_codigo(request)
+
+    beneficiario, motivo, mensaje = _resolver_escaneo(request.GET.get('codigo', ''), planta_codigo)
+    if beneficiario is None:
+        metricas.escaneos_fallidos.inc(planta=planta_codigo, motivo=motivo)
+        messages.error(request, mensaje)
+        return redirect('guardia_scanner')
+
+    return _registrar_entrega_qr(request, beneficiario, planta_codigo)
+
+
+@acepta_dispositivo
+@require_POST
+@admin_or_guardia_required
+def api_escanear(request):
+    """
+    Escaneo para kioscos (Authorization: Dispositivo <token>).
+    Recibe `codigo` (token QR) y responde JSON sin usar sesión ni redirecciones.
+    """
+    planta_codigo = _planta_codigo(request)
+
+    beneficiario, motivo, mensaje = _resolver_escaneo(request.POST.get('codigo', ''), planta_codigo)
+    if beneficiario is None:
+        metricas.escaneos_fallidos.inc(planta=planta_codigo, motivo=motivo)
+        return JsonResponse({'ok': False, 'motivo': motivo, 'mensaje': mensaje}, status=400)
+
+    ya_entregada = beneficiario.tiene_retiro()
+    if not ya_entregada:
+        try:
+            with transaction.atomic():
                 retiro = Retiro.objects.create(
                     beneficiario=beneficiario,
                     fecha_hora=timezone.now(),
                     confirmado_por=request.user,
                     observaciones='Entrega registrada mediante escaneo QR'
                 )
+        except IntegrityError:
+            # Otra portería la registró al mismo tiempo
+            ya_entregada = True
 
-                # Guardar datos en sesión para el popup
-                request.session['codigo_caja_entregada'] = retiro.codigo_caja
-                request.session['nombre_beneficiario'] = beneficiario.nombre
+    if ya_entregada:
+        metricas.escaneos_fallidos.inc(planta=planta_codigo, motivo='ya_entregada')
+        return JsonResponse({
+            'ok': False,
+            'motivo': 'ya_entregada',
+            'mensaje': f'La caja de {beneficiario.nombre} ya fue entregada anteriormente',
+        }, status=409)
 
-                return redirect('guardia_confirmar_exitoso')
+    metricas.retiros.inc(planta=planta_codigo, guardia=request.user.username, modo='qr')
+    return JsonResponse({'ok': True, 'nombre': beneficiario.nombre, 'codigo_caja': retiro.codigo_caja})
 
-        except Beneficiario.DoesNotExist:
-            messages.error(request, f'No se encontró beneficiario con RUT {rut_buscado} en la carga activa para esta planta')
-
-    context = {
-        'planta': planta,
-        'campana_activa': campana_activa,
-        'beneficiario': beneficiario,
-        'rut_buscado': rut_buscado,
-    }
 
-    return render(request, 'registroCajas/guardia/buscar_rut.html', context)
+@require_POST
+@admin_or_guardia_required
+def api_registro_masivo(request):
+    """
+    Registro masivo de entregas en papel (JSON). Recibe
+    {"fecha": "AAAA-MM-DD", "entregas": [{"identificador", "fecha_hora",
+    "nombre_tercero", "rut_tercero", "observaciones"}, ...]} y responde el
+    reporte por fila. El guardia solo registra beneficiarios de su planta.
+    """
+    try:
+        datos = json.loads(request.body or b'{}')
+        entregas = datos['entregas']
+        if not isinstance(entregas, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'ok': False, 'mensaje': 'Se espera un objeto JSON con la lista "entregas"'}, status=400)
+    if len(entregas) > MAX_FILAS:
+        return JsonResponse({'ok': False, 'mensaje': f'Se admiten hasta {MAX_FILAS} filas por registro'}, status=400)
+
+    try:
+        fecha_base = datetime.strptime(str(datos.get('fecha') or ''), '%Y-%m-%d').date()
+    except ValueError:
+        fecha_base = timezone.localdate()
+
+    planta = None
+    if request.user.perfil.rol != 'admin':
+        planta = get_object_or_404(Planta, codigo=_planta_codigo(request))
+
+    reporte = registrar_entregas(filas_desde_json(entregas, fecha_base), request.user, planta)
+    return JsonResponse({'ok': True, 'resumen': resumen(reporte), 'filas': reporte})
 
 
 @admin_or_guardia_required
@@ -118,11 +333,13 @@ def guardia_confirmar(request, beneficiario_id):
 
     # Verificar que el beneficiario pertenece a la planta del guardia
     if beneficiario.planta != planta:
+        metricas.escaneos_fallidos.inc(planta=planta.codigo, motivo='otra_planta')
         messages.error(request, 'El beneficiario no pertenece a esta planta')
         return redirect('guardia_home')
 
     # Verificar si ya tiene retiro
     if beneficiario.tiene_retiro():
+        metricas.escaneos_fallidos.inc(planta=planta.codigo, motivo='ya_entregada')
         messages.warning(request, 'Esta caja ya fue entregada anteriormente')
         return redirect('guardia_buscar_rut')
 
@@ -150,6 +367,11 @@ def guardia_confirmar(request, beneficiario_id):
             confirmado_por=request.user,
             observaciones=observaciones
         )
+        metricas.retiros.inc(
+            planta=planta.codigo,
+            guardia=request.user.username,
+            modo='titular' if retira_titular else 'tercero',
+        )
 
         # Si no retira el titular, registrar datos del tercero
         if not retira_titular:
@@ -166,18 +388,7 @@ def guardia_confirmar(request, beneficiario_id):
                 retiro.observaciones = observacion_tercero
             retiro.save()
 
-        # Guardar el código de caja en la sesión para mostrarlo en el template
-        request.session['codigo_caja_entregada'] = retiro.codigo_caja
-        request.session['nombre_beneficiario'] = beneficiario.nombre
-
-        # Si fue retirado por tercero, guardar también esta información
-        if not retira_titular:
-            request.session['retirado_por_tercero'] = True
-            request.session['nombre_tercero'] = nombre_tercero
-        else:
-            request.session['retirado_por_tercero'] = False
-
-        return redirect('guardia_confirmar_exitoso')
+        return _redirigir_exitoso(retiro)
 
     context = {
         'planta': planta,
@@ -193,21 +404,22 @@ def guardia_confirmar_exitoso(request):
     planta_codigo = request.session.get('planta_codigo')
     planta = get_object_or_404(Planta, codigo=planta_codigo)
 
-    # Obtener datos de la sesión
-    codigo_caja = request.session.pop('codigo_caja_entregada', None)
-    nombre_beneficiario = request.session.pop('nombre_beneficiario', None)
-    retirado_por_tercero = request.session.pop('retirado_por_tercero', False)
-    nombre_tercero = request.session.pop('nombre_tercero', None)
+    # Retiro firmado en la URL (sin escribir en la sesión)
+    try:
+        retiro_id = signing.loads(request.GET.get('r', ''), salt=SAL_EXITOSO, max_age=VIGENCIA_EXITOSO)
+    except signing.BadSignature:
+        return redirect('guardia_home')
 
-    if not codigo_caja:
+    retiro = Retiro.objects.select_related('beneficiario').filter(pk=retiro_id).first()
+    if retiro is None:
         return redirect('guardia_home')
 
     context = {
         'planta': planta,
-        'codigo_caja': codigo_caja,
-        'nombre_beneficiario': nombre_beneficiario,
-        'retirado_por_tercero': retirado_por_tercero,
-        'nombre_tercero': nombre_tercero,
+        'codigo_caja': retiro.codigo_caja,
+        'nombre_beneficiario': retiro.beneficiario.nombre,
+        'retirado_por_tercero': retiro.retirado_por_tercero,
+        'nombre_tercero': retiro.nombre_tercero,
     }
 
     return render(request, 'registroCajas/guardia/confirmar_exitoso.html', context)
@@ -5,6 +5,9 @@ from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .decorators import trabajador_required
 from .models import Planta, Beneficiario
+from .tokens import generar_token_qr, QR_VIGENCIA
+from .campanas_activas import obtener_registro
+from django.conf import settings
 
 
 @trabajador_required
@@ -19,11 +22,15 @@ def trabajador_home(request):
     beneficiario = None
     if perfil.rut:
         # Buscar por RUT y planta del beneficiario (ignorando planta de campaña)
+        registro = obtener_registro()
         beneficiario = Beneficiario.objects.filter(
             rut=perfil.rut,
             planta=planta,
-            campana__activa=True
+            campana_id__in=registro.ids
         ).first()
+        if beneficiario:
+            # La campaña ya está en el registro; evita otra consulta en la plantilla
+            beneficiario.campana = registro.campana(beneficiario.campana_id)
 
     context = {
         'perfil': perfil,
@@ -31,4 +38,10 @@ def trabajador_home(request):
         'beneficiario': beneficiario,
     }
 
+    # Token firmado para el QR; la página se recarga antes de que venza
+    if beneficiario and not beneficiario.tiene_retiro():
+        context['puede_retirar_hoy'] = beneficiario.puede_retirar_hoy()
+        context['token_qr'] = generar_token_qr(beneficiario)
+        context['qr_vigencia'] = getattr(settings, 'QR_VIGENCIA', QR_VIGENCIA)
+
     return render(request, 'registroCajas/trabajador/home.html', context)
@@ -3,6 +3,9 @@
 Script para simular retiros de cajas de manera aleatoria
 Uso: python3 manage.py shell < simular_retiros.py
 O desde el shell de Django: exec(open('simular_retiros.py').read())
+
+Este script inserta retiros directamente con el ORM. Para medir la portería
+por el flujo real de peticiones usar: python manage.py carga_porteria
 """
 import random
 from django.contrib.auth.models import User
@@ -51,8 +54,11 @@ def simular_retiros(cantidad=15):
         cantidad = total_pendientes
         print(f"   Se simularán {cantidad} retiros\n")
 
-    # Seleccionar beneficiarios aleatorios
-    beneficiarios_seleccionados = random.sample(list(beneficiarios_pendientes), cantidad)
+    # Seleccionar beneficiarios aleatorios (solo se cargan los ids pendientes)
+    ids_pendientes = list(beneficiarios_pendientes.values_list('id', flat=True))
+    beneficiarios_seleccionados = Beneficiario.objects.filter(
+        id__in=random.sample(ids_pendientes, cantidad)
+    ).select_related('planta')
 
     # Obtener un usuario para asignar como confirmador (guardia o admin)
     usuario_confirmador = User.objects.filter(
@@ -0,0 +1,86 @@
+/**
+ * Panel en vivo: se suscribe al flujo SSE (/eventos/) y actualiza la página
+ * sin recargar. Los contadores se marcan con data-contador="entregados",
+ * "pendientes", "hoy" o "tasa"; la lista de actividad con data-actividad y
+ * cada retiro ya mostrado con data-retiro="<id>".
+ *
+ * 'contadores' trae totales absolutos y el servidor puede reenviar retiros
+ * recientes (solape para los que se confirman tarde): se descartan por id.
+ */
+
+function suscribirPanelEnVivo(url) {
+    if (!window.EventSource) return null;
+
+    const fuente = new EventSource(url);
+    const mostrados = new Set();
+    document.querySelectorAll('[data-retiro]').forEach(function(el) {
+        mostrados.add(parseInt(el.dataset.retiro, 10));
+    });
+
+    fuente.addEventListener('contadores', function(e) {
+        const totales = JSON.parse(e.data);
+        Object.keys(totales).forEach(function(clave) {
+            document.querySelectorAll('[data-contador="' + clave + '"]').forEach(function(el) {
+                el.textContent = totales[clave];
+            });
+        });
+        actualizarTasa();
+    });
+
+    fuente.addEventListener('retiro', function(e) {
+        const retiro = JSON.parse(e.data);
+        if (mostrados.has(retiro.id)) return;
+        mostrados.add(retiro.id);
+        const lista = document.querySelector('[data-actividad]');
+        if (!lista) return;
+
+        const vacio = lista.querySelector('[data-vacio]');
+        if (vacio) vacio.remove();
+
+        const item = document.createElement('div');
+        item.className = 'list-item';
+        item.dataset.retiro = retiro.id;
+        const info = document.createElement('div');
+        const nombre = document.createElement('strong');
+        nombre.textContent = retiro.nombre;
+        const detalle = document.createElement('div');
+        detalle.className = 'text-muted small';
+        detalle.textContent = retiro.hora + (retiro.tercero ? ' - ' + retiro.tercero : '');
+        info.appendChild(nombre);
+        info.appendChild(detalle);
+        const badge = document.createElement('span');
+        badge.className = 'status-badge status-delivered';
+        badge.textContent = 'Entregado';
+        item.appendChild(info);
+        item.appendChild(badge);
+        lista.prepend(item);
+
+        const maximo = parseInt(lista.dataset.actividad, 10) || 5;
+        while (lista.children.length > maximo) lista.lastElementChild.remove();
+    });
+
+    fuente.addEventListener('bloqueo', function(e) {
+        const bloqueo = JSON.parse(e.data);
+        const contenedor = document.querySelector('[data-avisos]');
+        if (!contenedor) return;
+
+        const alerta = document.createElement('div');
+        alerta.className = 'alert alert-warning';
+        alerta.textContent = 'Día bloqueado: ' + bloqueo.fecha + ' (' + bloqueo.campana + ')';
+        contenedor.appendChild(alerta);
+    });
+
+    return fuente;
+}
+
+function actualizarTasa() {
+    const tasa = document.querySelector('[data-contador="tasa"]');
+    const total = document.querySelector('[data-total]');
+    const entregados = document.querySelector('[data-contador="entregados"]');
+    if (!tasa || !total || !entregados) return;
+
+    const totalBeneficiarios = parseInt(total.dataset.total, 10) || 0;
+    if (totalBeneficiarios === 0) return;
+    const valor = (parseInt(entregados.textContent, 10) || 0) * 100 / totalBeneficiarios;
+    tasa.textContent = valor.toLocaleString('es-CL', { maximumFractionDigits: 1 }) + '%';
+}
@@ -43,7 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'registroCajas.middleware.PerfiladorMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'registroCajas.middleware.ConsultasMiddleware',
+    'registroCajas.metricas.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,6 +89,40 @@ DATABASES = {
     }
 }
 
+# Perfil PostgreSQL (multi-planta). Se activa con DB_MOTOR=postgresql:
+#   DB_NOMBRE, DB_USUARIO, DB_PASSWORD, DB_HOST, DB_PUERTO
+#   DB_CONN_MAX_AGE  segundos de vida de la conexión persistente
+#   DB_REPLICA_HOST  (opcional) réplica de lectura para reportes y exportaciones
+# Los tests corren contra PostgreSQL local con:
+#   DB_MOTOR=postgresql python manage.py test registroCajas
+DB_MOTOR = os.environ.get('DB_MOTOR', 'sqlite')
+
+
+def _config_postgres(host):
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NOMBRE', 'tresmontes'),
+        'USER': os.environ.get('DB_USUARIO', 'tresmontes'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.environ.get('DB_PUERTO', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+
+if DB_MOTOR == 'postgresql':
+    DATABASES = {
+        'default': _config_postgres(os.environ.get('DB_HOST', 'localhost')),
+    }
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = _config_postgres(os.environ['DB_REPLICA_HOST'])
+        # En tests la réplica apunta a la misma base que default
+        DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Envía las lecturas de reportes/exportaciones a la réplica (si existe)
+DATABASE_ROUTERS = ['registroCajas.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -140,4 +177,90 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Authentication settings
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'panel_principal'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Importación de nóminas: tamaño de cada lote y pausa (segundos) entre lotes,
+# para que las escrituras de portería no esperen durante una carga.
+NOMINA_TAMANO_LOTE = int(os.environ.get('NOMINA_TAMANO_LOTE', 200))
+NOMINA_PAUSA_LOTE = float(os.environ.get('NOMINA_PAUSA_LOTE', 0.05))
+
+# Eliminación de cargas: DELETE por lotes, en un hilo aparte por defecto.
+# Si el worker se reinicia a mitad de una purga la campaña queda oculta en
+# "eliminando"; programar `manage.py purgar_campana --pendientes` (cron, cada
+# pocos minutos) la retoma.
+PURGA_TAMANO_LOTE = int(os.environ.get('PURGA_TAMANO_LOTE', 1000))
+PURGA_EN_SEGUNDO_PLANO = os.environ.get('PURGA_EN_SEGUNDO_PLANO', '1') == '1'
+
+# Perfilador opcional por petición (X-Perfilar: 1 o ?perfilar=1, solo staff;
+# PERFILADOR_MUESTREO perfila una fracción de las peticiones de cualquier rol)
+PERFILADOR_DIR = os.environ.get('PERFILADOR_DIR', os.path.join(BASE_DIR, 'perfiles'))
+PERFILADOR_MUESTREO = float(os.environ.get('PERFILADOR_MUESTREO', 0))
+PERFILADOR_MAX_ARCHIVOS = int(os.environ.get('PERFILADOR_MAX_ARCHIVOS', 50))
+
+# Métricas Prometheus en /metrics. Con varios workers, METRICAS_DIR debe ser un
+# directorio local compartido (cada proceso vuelca ahí sus valores) y no
+# compartirse entre máquinas o contenedores: los archivos de pids que ya no
+# existen en este host se suman al acumulado y se eliminan.
+METRICAS_DIR = os.environ.get('METRICAS_DIR', '')
+METRICAS_INTERVALO = float(os.environ.get('METRICAS_INTERVALO', 5))
+# Token del scraper (Authorization: Bearer ...). Vacío: /metrics solo para
+# administradores con sesión iniciada.
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+
+# Paneles en vivo (SSE, /eventos/). Servir con ASGI para flujos largos sin
+# retener workers (p. ej. `uvicorn tresMontes.asgi:application`, o enrutar
+# solo /eventos/ a ese servidor desde el proxy). Bajo WSGI cada conexión hace
+# una vuelta y el navegador reconecta cada SSE_INTERVALO segundos.
+SSE_INTERVALO = float(os.environ.get('SSE_INTERVALO', 2))
+SSE_DURACION = int(os.environ.get('SSE_DURACION', 300))
+SSE_MAX_CONEXIONES = int(os.environ.get('SSE_MAX_CONEXIONES', 200))
+
+# Vigencia (segundos) de los tokens QR firmados del trabajador
+QR_VIGENCIA = int(os.environ.get('QR_VIGENCIA', 600))
+
+# Etiquetas PDF: caché de imágenes por campaña y hash de contenido (se poda en
+# cada generación) y procesos del pool de manage.py generar_etiquetas
+ETIQUETAS_CACHE_DIR = os.environ.get('ETIQUETAS_CACHE_DIR', os.path.join(MEDIA_ROOT, 'etiquetas_cache'))
+ETIQUETAS_PROCESOS = int(os.environ.get('ETIQUETAS_PROCESOS', 0)) or None
+
+# Tokens de dispositivo (tablets de portería): segundos que se cachea la verificación
+DISPOSITIVOS_CACHE_TTL = int(os.environ.get('DISPOSITIVOS_CACHE_TTL', 60))
+
+# Sesiones cached_db: se leen del caché 'sesiones' y solo se escriben en la base
+# cuando cambian (login, logout, cambio de planta); el escaneo no escribe. Si el
+# caché descarta una sesión se relee de la base, sin cerrar la sesión del guardia.
+# FileBasedCache es compartido por los workers del mismo servidor, pero lista el
+# directorio en cada escritura y al pasar MAX_ENTRIES descarta 1/CULL_FREQUENCY de
+# las entradas: MAX_ENTRIES cubre a todos los usuarios activos de una campaña, a
+# costa de más archivos en disco. Con Redis/Memcached basta cambiar el BACKEND.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sesiones': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SESIONES_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'sesiones')),
+        'TIMEOUT': 60 * 60 * 24 * 14,
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('SESIONES_MAX_ENTRIES', 50000))},
+    },
+    # Compartido entre workers del mismo servidor (p. ej. versión del registro de campañas activas)
+    'compartido': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('COMPARTIDO_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'compartido')),
+        'TIMEOUT': None,
+    },
+}
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = 'sesiones'
+
+# Planificador de retiros: personas por hora en portería (general y por código
+# de planta, p. ej. AGENDA_CAPACIDAD_POR_PLANTA = {'casablanca': 80}) y horario
+AGENDA_CAPACIDAD_HORA = int(os.environ.get('AGENDA_CAPACIDAD_HORA', 60))
+AGENDA_CAPACIDAD_POR_PLANTA = {}
+AGENDA_HORARIO = (int(os.environ.get('AGENDA_HORA_INICIO', 8)), int(os.environ.get('AGENDA_HORA_FIN', 18)))
+
+# Simulación de portería (manage.py simular_porteria): espera p95 aceptable, en minutos
+SIMULACION_OBJETIVO_ESPERA = float(os.environ.get('SIMULACION_OBJETIVO_ESPERA', 5))
+
+# Rendimiento de portería: intervalos entre escaneos mayores a esto cuentan como pausa
+RENDIMIENTO_PAUSA_MINUTOS = int(os.environ.get('RENDIMIENTO_PAUSA_MINUTOS', 10))